@@ -1,24 +1,52 @@
 """REST client handling, including coingeckoStream base class."""
 import os
+from functools import cached_property
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional, List
+from typing import Any, Callable, Dict, Iterable, Optional, List, Tuple
 from abc import ABC, abstractmethod
 
-import hashlib
-import datadog.api
 import requests
 import backoff
 import simplejson
-import singer
-from singer import RecordMessage
 from singer_sdk.streams import RESTStream
-from singer_sdk.helpers._typing import conform_record_data_types
-from singer_sdk.helpers._util import utc_now
-from singer_sdk.exceptions import RetriableAPIError
+from singer_sdk.exceptions import FatalAPIError, RetriableAPIError
+
+from tap_coingecko.prefetch import PartitionPrefetcher
+from tap_coingecko.ratelimit import RateLimitedAdapter, RateLimiter
+
+from tap_coingecko.messages import compile_conformance
 
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 BASE_URL_PRO = "https://pro-api.coingecko.com/api"
 BASE_URL_FREE = "https://api.coingecko.com/api"
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 300
+DEFAULT_RATE_LIMIT_BURST = 1
+
+# Loads the records of a partition, returning the error instead of raising it
+PartitionLoader = Callable[[], Tuple[List[dict], Optional[Exception]]]
+
+
+def create_requests_session(config: dict) -> requests.Session:
+    """Create a keep-alive session shared by all the streams of the tap. All
+    the requests of the session go through one rate limiter."""
+    # Each prefetch worker holds a connection
+    pool_size = max(DEFAULT_HTTP_POOL_SIZE,
+                    int(config.get("fetch_concurrency", 1)))
+    pool_size = int(config.get("http_pool_size", pool_size))
+    rate_limit = config.get("rate_limit")
+    rate_limiter = RateLimiter(rate=float(rate_limit) if rate_limit else None,
+                               burst=float(
+                                   config.get("rate_limit_burst",
+                                              DEFAULT_RATE_LIMIT_BURST)))
+    adapter = RateLimitedAdapter(rate_limiter,
+                                 pool_connections=pool_size,
+                                 pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class CoingeckoStream(RESTStream, ABC):
@@ -36,6 +64,15 @@ class CoingeckoStream(RESTStream, ABC):
         else:
             return BASE_URL_FREE
 
+    @property
+    def requests_session(self) -> requests.Session:
+        # All the streams of the tap share one pooled keep-alive session
+        return self._tap.requests_session
+
+    @property
+    def timeout(self) -> int:
+        return int(self.config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT))
+
     def get_url_params(self, context: Optional[dict],
                        next_page_token: Optional[Any]) -> Dict[str, Any]:
         params = super().get_url_params(context, next_page_token)
@@ -72,26 +109,119 @@ class CoingeckoStream(RESTStream, ABC):
         )(func)
         return decorator
 
+    @property
+    def fetch_concurrency(self) -> int:
+        return int(self.config.get("fetch_concurrency", 1))
+
+    @cached_property
+    def partition_prefetcher(self) -> Optional[PartitionPrefetcher]:
+        if self.fetch_concurrency <= 1:
+            return None
+
+        # Workers share the rate limiter of the tap session, so the
+        # concurrency only hides the latency of the requests
+        return PartitionPrefetcher(self.partitions, self.prepare_partition,
+                                   self.fetch_concurrency)
+
+    def sync(self, context: Optional[dict] = None) -> None:
+        try:
+            super().sync(context)
+        finally:
+            # Cancel the outstanding partitions, a new prefetcher is created by
+            # the next sync
+            prefetcher = self.__dict__.pop('partition_prefetcher', None)
+            if prefetcher is not None:
+                prefetcher.shutdown()
+
+    def prepare_partition(self, context: dict) -> PartitionLoader:
+        context = context.copy()
+        return lambda: self.load_partition(context)
+
+    def load_partition(
+            self, context: dict) -> Tuple[List[dict], Optional[Exception]]:
+        # Errors are returned, not raised, so that a failed partition does
+        # not affect the partitions loaded along with it
+        try:
+            return list(self.request_records(context)), None
+        except Exception as e:
+            return [], e
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        context = context or {}
+        if self.partition_prefetcher:
+            records, error = self.partition_prefetcher.load(context)
+        else:
+            records, error = self.prepare_partition(context)()
+
+        if error is not None:
+            self.log_partition_error(context, error)
+            return
+
+        for record in records:
+            transformed_record = self.post_process(record, context)
+            if transformed_record is None:
+                continue
+            yield transformed_record
+
+    def log_partition_error(self, context: dict, error: Exception) -> None:
+        self.logger.error('Error while requesting %s with context %s: %s' %
+                          (self.name, context, str(error)))
+
     def load_coins(self) -> List[Dict[str, str]]:
         coins = self.config.get("coins", None)
 
         if coins:
             self.logger.info(f"Using coins {coins} from the config parameter")
-            coins = [{"id": symbol} for coin in coins]
+            return [{"id": coin} for coin in coins]
         else:
-            return self.request_decorator(self.fetch_coins)()
+            return self.fetch_coins()
 
     def fetch_coins(self) -> List[Dict[str, str]]:
         coins_limit = self.config.get("coins_limit", None)
+
+        try:
+            coin_ids = self._tap.coin_list_cache.get(
+                self.request_decorator(self.fetch_coin_list))
+        except (ValueError, FatalAPIError, RetriableAPIError,
+                requests.RequestException) as e:
+            # The expired list is used by the cache if there is any
+            self.logger.error(f"Error while loading coins: {str(e)}")
+            return []
+
+        if coins_limit is not None:
+            coin_ids = coin_ids[:coins_limit]
+
+        return [{
+            "id": coin_id
+        } for coin_id in self._tap.split_assigner.filter(coin_ids)]
+
+    def fetch_coin_list(
+        self,
+        validators: Dict[str,
+                         str]) -> Tuple[Optional[List[str]], Dict[str, str]]:
+        """Download sorted ids of all the coins, unless the list is not
+        modified since the response with the `validators`."""
         self.logger.info("Loading coins")
 
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
         params = {"include_platform": "false"}
-        res = requests.get(
+        res = self.requests_session.get(
             url=f"{BASE_URL_FREE}/v3/coins/list",
             params=params,
+            headers=headers,
+            timeout=self.timeout,
         )
         self._write_request_duration_log("/v3/coins/list", res, None, None)
 
+        if res.status_code == 304:
+            return None, validators
+        self.validate_response(res)
+
         try:
             res_data = res.json()
         except simplejson.scanner.JSONDecodeError as e:
@@ -99,45 +229,40 @@ class CoingeckoStream(RESTStream, ABC):
             raise e
 
         if not isinstance(res_data, list):
-            self.logger.error(f"Error while loading coins: {res_data}")
-            return []
-
-        coins = [{"id": coin['id']} for coin in res_data]
-        coins = sorted(coins, key=lambda record: record['id'])
-
-        if coins_limit is not None:
-            coins = coins[:coins_limit]
+            # Not cached, the expired list is used if any
+            raise ValueError(f"unexpected response {res_data}")
 
-        coins = filter(lambda coin: self.is_within_split(coin['id']), coins)
+        coin_ids = sorted(coin['id'] for coin in res_data)
+        return coin_ids, {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+        }
 
-        return list(coins)
+    def is_within_split(self, symbol) -> bool:
+        return self._tap.split_assigner.is_within_split(symbol)
 
-    def is_within_split(self, symbol) -> int:
-        split_num = int(self.config.get("split_num", 1))
-        split_id = int(self.config.get("split_id", 0))
-        # Use built-in `hashlib` to get consistent hash value
-        symbol_hash = int(hashlib.md5(symbol.encode("UTF-8")).hexdigest(), 16)
-        return symbol_hash % split_num == split_id
+    @cached_property
+    def conform_record(self) -> Callable[[dict], dict]:
+        return compile_conformance(self.name, self.schema, self.logger)
 
     def _write_record_message(self, record: dict) -> None:
         """Write out a RECORD message."""
-        record = conform_record_data_types(
-            stream_name=self.name,
-            row=record,
-            schema=self.schema,
-            logger=self.logger,
-        )
+        record = self.conform_record(record)
         for stream_map in self.stream_maps:
             mapped_record = stream_map.transform(record)
             # Emit record if not filtered
             if mapped_record is not None:
-                record_message = RecordMessage(
-                    stream=stream_map.stream_alias,
-                    record=mapped_record,
-                    version=None,
-                    time_extracted=utc_now(),
-                )
-                singer.write_message(record_message)
+                self._tap.record_writer.write_record(stream_map.stream_alias,
+                                                     mapped_record)
+
+    def _write_schema_message(self) -> None:
+        # Buffered records must reach the target before any other message
+        self._tap.record_writer.flush()
+        super()._write_schema_message()
+
+    def _write_state_message(self) -> None:
+        self._tap.record_writer.flush()
+        super()._write_state_message()
 
     def _write_metric_log(self, metric: dict,
                           extra_tags: Optional[dict]) -> None:
@@ -147,8 +272,6 @@ class CoingeckoStream(RESTStream, ABC):
     def _send_to_datadog(self, metric, types, add_env=True):
         try:
             if metric["type"] in types:
-                datadog.initialize()
-
                 tag_list = []
                 if "tags" in metric:
                     tag_list += [
@@ -158,11 +281,11 @@ class CoingeckoStream(RESTStream, ABC):
                 if add_env and "ENV" in os.environ:
                     tag_list.append(f"env:{os.environ['ENV']}")
 
-                datadog.api.Metric.send(
-                    metric=f"data.tap.{self.name}.{metric['metric']}",
-                    type="count",
-                    points=metric["value"],
-                    tags=tag_list)
+                # Timers are sent as the last measured value
+                send = self._tap.metrics_emitter.gauge if metric[
+                    "type"] == "timer" else self._tap.metrics_emitter.increment
+                send(f"data.tap.{self.name}.{metric['metric']}",
+                     metric["value"], tag_list)
             else:
                 self.logger.debug(f"Skipping metric: {metric['metric']}")
 
@@ -0,0 +1,104 @@
+"""Cache of the coin list."""
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tap_coingecko.files import write_json_atomic
+
+DEFAULT_COINS_CACHE_TTL = 6 * 60 * 60
+
+COIN_LIST_KEYS = frozenset(["coins", "validators", "fetched_at"])
+
+# Downloads the coin list with the `ETag` and `Last-Modified` validators of
+# the cached list. Returns the sorted coin ids, or None if the list was not
+# modified, and the validators of the response
+CoinListLoader = Callable[[Dict[str, str]], Tuple[Optional[List[str]],
+                                                  Dict[str, str]]]
+
+
+class CoinListCache:
+    """Keeps the sorted coin ids for the whole tap invocation and, if
+    `directory` is set, in a file reused by later invocations for `ttl`
+    seconds.
+
+    An expired list is revalidated with the validators of the previous
+    response, so it is only downloaded again once it's modified. If the list
+    fails to load, the expired one is used.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 directory: Optional[str] = None,
+                 ttl: float = DEFAULT_COINS_CACHE_TTL):
+        self.logger = logger
+        self.directory = Path(directory) if directory else None
+        self.ttl = ttl
+
+        self._coin_list: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def get(self, load: CoinListLoader) -> List[str]:
+        # The lock is held while loading so that the streams sharing the
+        # cache wait for the list being loaded instead of loading it again
+        with self._lock:
+            coin_list = self._coin_list or self._read_file()
+            if coin_list is not None and time.time(
+            ) - coin_list["fetched_at"] <= self.ttl:
+                self._coin_list = coin_list
+                return coin_list["coins"]
+
+            try:
+                coins, validators = load(
+                    coin_list["validators"] if coin_list else {})
+            except Exception as e:
+                if coin_list is None:
+                    raise
+                self.logger.warning(
+                    f"Using expired coin list due to an error: '{str(e)}'")
+                self._coin_list = coin_list
+                return coin_list["coins"]
+
+            if coins is None:
+                self.logger.info("Coin list is not modified")
+                coins = coin_list["coins"]
+
+            self._coin_list = {
+                "coins": coins,
+                "validators": validators,
+                "fetched_at": time.time(),
+            }
+            self._write_file(self._coin_list)
+            return coins
+
+    def _file_path(self) -> Path:
+        return self.directory / "coins_list.json"
+
+    def _read_file(self) -> Optional[dict]:
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self._file_path()) as f:
+                coin_list = json.load(f)
+            missing_keys = COIN_LIST_KEYS.difference(coin_list)
+            if missing_keys:
+                raise ValueError(f"missing {sorted(missing_keys)}")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Failed to read cached coin list: '{str(e)}'")
+            return None
+
+        return coin_list
+
+    def _write_file(self, coin_list: dict) -> None:
+        if self.directory is None:
+            return
+
+        try:
+            write_json_atomic(self._file_path(), coin_list)
+        except OSError as e:
+            self.logger.warning(f"Failed to cache coin list: '{str(e)}'")
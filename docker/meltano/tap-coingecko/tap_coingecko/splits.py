@@ -0,0 +1,316 @@
+"""Assignment of symbols to tap splits."""
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from singer_sdk.exceptions import ConfigValidationError
+
+# Relative, so that the module is the same in every tap
+from .files import write_json_atomic
+
+SPLIT_MODE_MODULO = "modulo"
+SPLIT_MODE_JUMP = "jump"
+SPLIT_MODE_COST = "cost"
+SPLIT_MODES = [SPLIT_MODE_MODULO, SPLIT_MODE_JUMP, SPLIT_MODE_COST]
+
+
+def symbol_hash(symbol: str) -> int:
+    # Use built-in `hashlib` to get consistent hash value
+    return int(hashlib.md5(symbol.encode("UTF-8")).hexdigest(), 16)
+
+
+def jump_hash(key: int, num_buckets: int) -> int:
+    """Jump consistent hash by Lamping and Veach: when the number of buckets
+    grows from N to N+1, only 1/(N+1) of the keys move to the new bucket."""
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, j = -1, 0
+    while j < num_buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+class SplitAssigner:
+    """Assigns symbols to one of `split_num` splits of the tap.
+
+    In the `modulo` mode the symbol hash modulo `split_num` is used, so
+    changing `split_num` moves almost every symbol to another split. In the
+    `jump` mode a jump consistent hash is used, so adding a split moves only
+    1/`split_num` of the symbols and keeps the partition state of the rest.
+    In the `cost` mode symbols are assigned by the `plan` built with
+    `plan_splits` from the measured symbol costs, symbols missing from the
+    plan fall back to the jump consistent hash.
+
+    Assignments are memoized, so each symbol is hashed once per invocation.
+    """
+
+    def __init__(self,
+                 split_num: int = 1,
+                 split_id: int = 0,
+                 mode: str = SPLIT_MODE_MODULO,
+                 plan: Optional[Dict[str, int]] = None):
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Unknown split mode `{mode}`, "
+                             f"expected one of {SPLIT_MODES}")
+
+        self.split_num = max(1, split_num)
+        self.split_id = split_id
+        self.mode = mode
+        self.plan = plan or {}
+
+        self._assignments: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def assign(self, symbol: str) -> int:
+        """Return the split of the symbol."""
+        split = self._assignments.get(symbol)
+        if split is None:
+            split = self._assign(symbol)
+            with self._lock:
+                self._assignments[symbol] = split
+        return split
+
+    def assign_all(self, symbols: Iterable[str]) -> Dict[str, int]:
+        """Return splits of all the symbols, hashing the new ones in bulk."""
+        symbols = list(symbols)
+        new_assignments = {
+            symbol: self._assign(symbol)
+            for symbol in set(symbols).difference(self._assignments)
+        }
+        with self._lock:
+            self._assignments.update(new_assignments)
+            return {symbol: self._assignments[symbol] for symbol in symbols}
+
+    def is_within_split(self, symbol: str) -> bool:
+        return self.assign(symbol) == self.split_id
+
+    def filter(self, symbols: Iterable[str]) -> List[str]:
+        """Return the symbols of this split, keeping their order."""
+        symbols = list(symbols)
+        assignments = self.assign_all(symbols)
+        return [
+            symbol for symbol in symbols
+            if assignments[symbol] == self.split_id
+        ]
+
+    def split_counts(self) -> List[int]:
+        """Number of the assigned symbols in each split."""
+        counts = [0] * self.split_num
+        with self._lock:
+            for split in self._assignments.values():
+                counts[split] += 1
+        return counts
+
+    def log_report(self, logger: logging.Logger) -> None:
+        """Log the load skew across the splits of all the assigned symbols:
+        the largest split size relative to the mean split size."""
+        counts = self.split_counts()
+        total = sum(counts)
+        if self.split_num <= 1 or not total:
+            return
+
+        skew = max(counts) / (total / self.split_num)
+        logger.info(
+            f"Split {self.split_id} of {self.split_num} ({self.mode}): "
+            f"{counts[self.split_id]} of {total} symbols, "
+            f"symbols per split {counts}, skew {skew:.3f}")
+
+    def _assign(self, symbol: str) -> int:
+        if self.split_num == 1:
+            return 0
+        if self.mode == SPLIT_MODE_COST and symbol in self.plan:
+            return self.plan[symbol]
+        if self.mode in (SPLIT_MODE_JUMP, SPLIT_MODE_COST):
+            return jump_hash(symbol_hash(symbol), self.split_num)
+        return symbol_hash(symbol) % self.split_num
+
+
+class SymbolCostRecorder:
+    """Measures the extraction cost of the symbols synced by the split: the
+    time spent loading each symbol and the number of its records, per stream.
+
+    If `directory` is set, the costs are saved to one file per stream and
+    split in the directory, so that splits and streams running in separate
+    processes never write the same file. `load_symbol_costs` reads them back.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 directory: Optional[str] = None,
+                 split_id: int = 0):
+        self.logger = logger
+        self.directory = Path(directory) if directory else None
+        self.split_id = split_id
+
+        self._costs: Dict[str, Dict[str, dict]] = {}
+        # Symbols are measured from the prefetch workers
+        self._lock = threading.Lock()
+
+    def record(self, stream_name: str, symbol: str, duration: float,
+               records_count: int) -> None:
+        with self._lock:
+            costs = self._costs.setdefault(stream_name, {})
+            cost = costs.setdefault(symbol, {"duration": 0.0, "records": 0})
+            cost["duration"] += duration
+            cost["records"] += records_count
+
+    def save(self) -> None:
+        """Merge the costs measured during the run into the cost files."""
+        if self.directory is None:
+            return
+
+        with self._lock:
+            costs = {
+                stream_name: dict(stream_costs)
+                for stream_name, stream_costs in self._costs.items()
+            }
+
+        measured_at = time.time()
+        for stream_name, stream_costs in costs.items():
+            path = self.directory / f"{stream_name}.{self.split_id}.json"
+            symbols = _read_cost_file(path, self.logger).get("symbols", {})
+            for symbol, cost in stream_costs.items():
+                symbols[symbol] = {**cost, "measured_at": measured_at}
+
+            try:
+                write_json_atomic(path, {
+                    "stream": stream_name,
+                    "symbols": symbols
+                })
+            except OSError as e:
+                self.logger.warning(
+                    f"Failed to save symbol costs of {stream_name}: '{str(e)}'"
+                )
+
+
+def _read_cost_file(path: Path, logger: logging.Logger) -> dict:
+    try:
+        with open(path) as f:
+            cost_file = json.load(f)
+        if not isinstance(cost_file.get("symbols"), dict):
+            raise ValueError("missing symbols")
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Failed to read symbol costs {path}: '{str(e)}'")
+        return {}
+
+    return cost_file
+
+
+def load_symbol_costs(directory: str,
+                      logger: logging.Logger) -> Dict[str, float]:
+    """Return the loading time of each symbol summed over the streams. A
+    symbol moved between splits is measured by both, the latest measurement
+    of each stream is used."""
+    latest: Dict[tuple, dict] = {}
+    for path in sorted(Path(directory).glob("*.json")):
+        cost_file = _read_cost_file(path, logger)
+        for symbol, cost in cost_file.get("symbols", {}).items():
+            key = (cost_file.get("stream"), symbol)
+            if key not in latest or cost["measured_at"] > latest[key][
+                    "measured_at"]:
+                latest[key] = cost
+
+    costs: Dict[str, float] = {}
+    for (_, symbol), cost in latest.items():
+        costs[symbol] = costs.get(symbol, 0.0) + cost["duration"]
+    return costs
+
+
+def plan_splits(costs: Dict[str, float], split_num: int) -> Dict[str, int]:
+    """Assign the symbols to `split_num` splits balancing the total cost of
+    each split. The longest-processing-time-first greedy packing puts the
+    most expensive remaining symbol to the least loaded split, which keeps
+    the slowest split within 4/3 of the optimum. Ties are broken by symbol
+    and split index, so the same costs always give the same plan."""
+    split_num = max(1, split_num)
+    loads = [(0.0, split) for split in range(split_num)]
+    plan = {}
+    for symbol, cost in sorted(costs.items(),
+                               key=lambda item: (-item[1], item[0])):
+        load, split = heapq.heappop(loads)
+        plan[symbol] = split
+        heapq.heappush(loads, (load + cost, split))
+    return plan
+
+
+def read_split_plan(path: str, split_num: int) -> Dict[str, int]:
+    """Return the assignments of the plan file. All the splits must read the
+    same plan, otherwise a symbol may be synced twice or never, so a plan
+    which can't be used fails the configuration."""
+    try:
+        with open(path) as f:
+            plan_file = json.load(f)
+        planned_split_num = plan_file["split_num"]
+        plan = {
+            symbol: int(split)
+            for symbol, split in plan_file["splits"].items()
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ConfigValidationError(
+            f"Failed to read split plan {path}: '{str(e)}'") from e
+
+    if planned_split_num != split_num:
+        raise ConfigValidationError(
+            f"Split plan {path} is for {planned_split_num} splits "
+            f"instead of {split_num}")
+    if any(split < 0 or split >= split_num for split in plan.values()):
+        raise ConfigValidationError(
+            f"Split plan {path} assigns symbols to unknown splits")
+
+    return plan
+
+
+def create_split_assigner(config: dict) -> SplitAssigner:
+    split_num = int(config.get("split_num", 1))
+    mode = config.get("split_mode", SPLIT_MODE_MODULO)
+
+    plan = None
+    if mode == SPLIT_MODE_COST:
+        if not config.get("split_plan_file"):
+            raise ConfigValidationError(
+                "`split_plan_file` is required for the `cost` split mode")
+        plan = read_split_plan(config["split_plan_file"], split_num)
+
+    return SplitAssigner(split_num=split_num,
+                         split_id=int(config.get("split_id", 0)),
+                         mode=mode,
+                         plan=plan)
+
+
+def main() -> None:
+    """Plan the splits from the symbol costs measured by earlier runs."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--costs-dir", required=True)
+    parser.add_argument("--split-num", type=int, required=True)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    costs = load_symbol_costs(args.costs_dir, logger)
+    plan = plan_splits(costs, args.split_num)
+
+    loads = [0.0] * max(1, args.split_num)
+    for symbol, split in plan.items():
+        loads[split] += costs[symbol]
+    logger.info(f"Planned {len(plan)} symbols, "
+                f"seconds per split {[round(load) for load in loads]}")
+
+    write_json_atomic(args.output, {
+        "split_num": args.split_num,
+        "splits": plan
+    })
+
+
+if __name__ == "__main__":
+    main()
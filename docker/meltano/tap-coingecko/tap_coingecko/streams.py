@@ -1,11 +1,14 @@
 """Stream type classes for tap-coingecko."""
+import time
 from functools import cached_property
 from pathlib import Path
-from typing import Any, Dict, Optional, Iterable, List
+from typing import Any, Dict, Optional, Iterable, List, Tuple
+from urllib.parse import quote_plus, urlencode
 
-from tap_coingecko.client import CoingeckoStream
+from tap_coingecko.client import CoingeckoStream, PartitionLoader
 
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
+DEFAULT_MAX_URL_LENGTH = 8000
 
 
 class CoinData(CoingeckoStream):
@@ -18,6 +21,9 @@ class CoinData(CoingeckoStream):
 
     schema_filepath = SCHEMAS_DIR / "coin_data.json"
 
+    # Max number of coins in one `/v3/coins/markets` request
+    markets_per_page = 250
+
     @property
     def is_realtime(self) -> bool:
         return False
@@ -35,14 +41,88 @@ class CoinData(CoingeckoStream):
 
         return params
 
-    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+    @property
+    def is_incremental(self) -> bool:
+        return bool(self.config.get("incremental_coin_data", False))
+
+    @cached_property
+    def markets_last_updated(self) -> Dict[str, str]:
+        """`last_updated` of the coins market data by coin id. Coins are
+        requested from the cheap batched markets listing."""
+        coin_ids = [partition["id"] for partition in self.partitions]
+        last_updated = {}
         try:
-            yield from super().get_records(context)
+            for page_start in range(0, len(coin_ids), self.markets_per_page):
+                batch = coin_ids[page_start:page_start + self.markets_per_page]
+                for record in self.request_decorator(
+                        self.fetch_markets)(batch):
+                    if record.get("last_updated"):
+                        last_updated[record["id"]] = record["last_updated"]
         except Exception as e:
+            # All the coins are loaded then
             self.logger.error(
-                'Error while requesting %s for coin %s: %s' %
-                (self.name, context.get('id', '') if context else '', str(e)))
-            pass
+                f"Error while loading markets of {self.name}: {str(e)}")
+
+        self.logger.info(f"Loaded markets of {len(last_updated)} coins")
+        return last_updated
+
+    def fetch_markets(self, coin_ids: List[str]) -> List[dict]:
+        params = CoingeckoStream.get_url_params(self, None, None)
+        params.update({
+            "vs_currency": "usd",
+            "ids": ",".join(coin_ids),
+            "per_page": self.markets_per_page,
+            "sparkline": "false",
+        })
+        res = self.requests_session.get(
+            url=f"{self.url_base}/v3/coins/markets",
+            params=params,
+            timeout=self.timeout)
+        self._write_request_duration_log("/v3/coins/markets", res, None, None)
+        self.validate_response(res)
+        return res.json()
+
+    def is_changed(self, context: dict) -> bool:
+        """Whether the coin market data was updated since the coin was
+        loaded. Coins missing in the markets listing are always loaded."""
+        last_updated = self.markets_last_updated.get(context.get("id"))
+        if last_updated is None:
+            return True
+
+        state = self.get_context_state(context)
+        return state.get("last_updated") != last_updated
+
+    def prepare_partition(self, context: dict) -> PartitionLoader:
+        # Read the partition state in the calling thread, the returned loader
+        # may be executed in a prefetch worker
+        if self.is_incremental and not self.is_changed(context):
+            return lambda: ([], None)
+
+        return super().prepare_partition(context)
+
+    def load_partition(
+            self, context: dict) -> Tuple[List[dict], Optional[Exception]]:
+        started = time.monotonic()
+        records, error = super().load_partition(context)
+        self._tap.symbol_costs.record(self.name, context["id"],
+                                      time.monotonic() - started, len(records))
+        return records, error
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        context = context or {}
+        records_count = 0
+        for record in super().get_records(context):
+            records_count += 1
+            yield record
+
+        last_updated = self.markets_last_updated.get(
+            context.get("id")) if self.is_incremental else None
+        if records_count and last_updated is not None:
+            self.get_context_state(context)["last_updated"] = last_updated
+
+    def log_partition_error(self, context: dict, error: Exception) -> None:
+        self.logger.error('Error while requesting %s for coin %s: %s' %
+                          (self.name, context.get('id', ''), str(error)))
 
 
 class CoinMarketRealtimeData(CoingeckoStream):
@@ -53,7 +133,10 @@ class CoinMarketRealtimeData(CoingeckoStream):
     STATE_MSG_FREQUENCY = 100
     schema_filepath = SCHEMAS_DIR / "coin_market_realtime.json"
 
-    per_page = 500
+    # The API returns up to `max_per_page` coins, `default_per_page` unless
+    # `per_page` is requested
+    default_per_page = 100
+    max_per_page = 250
 
     @property
     def is_realtime(self) -> bool:
@@ -63,16 +146,43 @@ class CoinMarketRealtimeData(CoingeckoStream):
     def url_base(self) -> str:
         return "https://api.coingecko.com/api"
 
+    @property
+    def max_url_length(self) -> int:
+        return int(self.config.get("max_url_length", DEFAULT_MAX_URL_LENGTH))
+
     @cached_property
     def partitions(self) -> List[dict]:
-        records = self.load_coins()
-        partitions = []
-        for page_start in range(0, len(records), self.per_page):
-            batch = records[page_start:min(len(records), page_start +
-                                           self.per_page)]
-            batch_coin_ids = [record["id"] for record in batch]
-            partitions.append({"ids": ",".join(batch_coin_ids)})
-        return partitions
+        coin_ids = [record["id"] for record in self.load_coins()]
+        return [{
+            "ids": ",".join(batch)
+        } for batch in self.batch_coin_ids(coin_ids)]
+
+    def batch_coin_ids(self, coin_ids: List[str]) -> List[List[str]]:
+        """Split the coins into batches as large as the API returns in one
+        page, each requested with a URL of at most `max_url_length`."""
+        params = self.get_url_params({"ids": ""}, None)
+        params["per_page"] = self.max_per_page
+        url_length = len(f"{self.url_base}{self.path}?{urlencode(params)}")
+
+        batches = []
+        batch = []
+        batch_url_length = url_length
+        for coin_id in coin_ids:
+            # Coin ids are joined with the encoded comma - `%2C`
+            id_length = len(quote_plus(coin_id)) + (3 if batch else 0)
+            if batch and (len(batch) >= self.max_per_page or
+                          batch_url_length + id_length > self.max_url_length):
+                batches.append(batch)
+                batch = []
+                batch_url_length = url_length
+                id_length -= 3
+
+            batch.append(coin_id)
+            batch_url_length += id_length
+
+        if batch:
+            batches.append(batch)
+        return batches
 
     def get_url_params(self, context: Optional[dict],
                        next_page_token: Optional[Any]) -> Dict[str, Any]:
@@ -82,13 +192,31 @@ class CoinMarketRealtimeData(CoingeckoStream):
         params["ids"] = context.get("ids")
         params["sparkline"] = "false"
 
+        coins_count = len(params["ids"].split(",")) if params["ids"] else 0
+        if coins_count > self.default_per_page:
+            params["per_page"] = coins_count
+
         return params
 
-    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
-        try:
-            yield from super().get_records(context)
-        except Exception as e:
-            self.logger.error(
-                'Error while requesting %s for coins %s: %s' %
-                (self.name, context.get('ids', '') if context else '', str(e)))
-            pass
+    def sync(self, context: Optional[dict] = None) -> None:
+        started_at = time.monotonic()
+        super().sync(context)
+
+        # Time to refresh the prices of all the coins. The batches are
+        # prefetched concurrently but emitted in order, so a slow batch holds
+        # back the batches after it and the whole cycle, even when they are
+        # already loaded
+        metric = {
+            "type": "timer",
+            "metric": "cycle_time",
+            "value": time.monotonic() - started_at,
+            "tags": {
+                "stream": self.name,
+            },
+        }
+        self._write_metric_log(metric, None)
+        self._send_to_datadog(metric, ["timer"])
+
+    def log_partition_error(self, context: dict, error: Exception) -> None:
+        self.logger.error('Error while requesting %s for coins %s: %s' %
+                          (self.name, context.get('ids', ''), str(error)))
@@ -1,10 +1,19 @@
 """coingecko tap class."""
+from functools import cached_property
 from typing import List, Tuple
 
+import requests
+
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
 from singer_sdk.exceptions import ConfigValidationError
 
+from tap_coingecko.client import create_requests_session
+from tap_coingecko.coins import DEFAULT_COINS_CACHE_TTL, CoinListCache
+from tap_coingecko.messages import RecordWriter
+from tap_coingecko.metrics import DEFAULT_FLUSH_INTERVAL, DatadogMetricsEmitter
+from tap_coingecko.splits import (SplitAssigner, SymbolCostRecorder,
+                                  create_split_assigner)
 from tap_coingecko.streams import CoinData, CoinMarketRealtimeData
 
 STREAM_TYPES = [
@@ -29,14 +38,131 @@ class Tapcoingecko(Tap):
                     th.StringType,
                     required=False,
                     description="Total number of tap splits"),
+        th.Property(
+            "split_mode",
+            th.StringType,
+            required=False,
+            description=
+            "`modulo` (default), `jump` - consistent hashing, which moves few symbols between splits when `split_num` changes, or `cost` - assignment by `split_plan_file`"
+        ),
+        th.Property(
+            "split_plan_file",
+            th.StringType,
+            required=False,
+            description=
+            "Split plan built from the symbol costs by `python -m tap_coingecko.splits`"
+        ),
+        th.Property(
+            "split_costs_dir",
+            th.StringType,
+            required=False,
+            description=
+            "Directory to save the measured loading time of each symbol to"),
         th.Property("realtime",
                     th.BooleanType,
                     required=False,
                     description="Filter by `realtime` stream flag"),
+        th.Property("http_pool_size",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of kept-alive HTTP connections"),
+        th.Property("request_timeout",
+                    th.IntegerType,
+                    required=False,
+                    description="HTTP request timeout in seconds"),
+        th.Property(
+            "fetch_concurrency",
+            th.IntegerType,
+            required=False,
+            description=
+            "Number of coins or coin batches to prefetch concurrently"),
+        th.Property(
+            "max_url_length",
+            th.IntegerType,
+            required=False,
+            description=
+            "Max length of the URL listing coins of a realtime market data request"
+        ),
+        th.Property(
+            "coins_cache_dir",
+            th.StringType,
+            required=False,
+            description="Directory to keep the coin list between runs"),
+        th.Property(
+            "coins_cache_ttl",
+            th.IntegerType,
+            required=False,
+            description=
+            "Time in seconds to reuse the cached coin list before revalidating it"
+        ),
+        th.Property(
+            "incremental_coin_data",
+            th.BooleanType,
+            required=False,
+            description=
+            "Load coin data only for the coins with market data updated since the previous run"
+        ),
+        th.Property("rate_limit",
+                    th.NumberType,
+                    required=False,
+                    description="Max number of requests per second to each "
+                    "API host"),
+        th.Property("rate_limit_burst",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of requests to send at once "
+                    "within the rate limit"),
+        th.Property(
+            "metrics_flush_interval",
+            th.NumberType,
+            required=False,
+            description="Interval in seconds between Datadog metrics flushes"),
     ).to_dict()
 
     parse_env_config = True
 
+    @cached_property
+    def requests_session(self) -> requests.Session:
+        return create_requests_session(self.config)
+
+    @cached_property
+    def coin_list_cache(self) -> CoinListCache:
+        return CoinListCache(self.logger,
+                             directory=self.config.get("coins_cache_dir"),
+                             ttl=int(
+                                 self.config.get("coins_cache_ttl",
+                                                 DEFAULT_COINS_CACHE_TTL)))
+
+    @cached_property
+    def metrics_emitter(self) -> DatadogMetricsEmitter:
+        flush_interval = float(
+            self.config.get("metrics_flush_interval", DEFAULT_FLUSH_INTERVAL))
+        return DatadogMetricsEmitter(self.logger,
+                                     flush_interval=flush_interval)
+
+    @cached_property
+    def split_assigner(self) -> SplitAssigner:
+        return create_split_assigner(self.config)
+
+    @cached_property
+    def symbol_costs(self) -> SymbolCostRecorder:
+        return SymbolCostRecorder(self.logger,
+                                  directory=self.config.get("split_costs_dir"),
+                                  split_id=int(self.config.get("split_id", 0)))
+
+    @cached_property
+    def record_writer(self) -> RecordWriter:
+        return RecordWriter()
+
+    def sync_all(self) -> None:
+        try:
+            super().sync_all()
+        finally:
+            self.record_writer.flush()
+            self.split_assigner.log_report(self.logger)
+            self.symbol_costs.save()
+            self.metrics_emitter.close()
+
     def discover_streams(self) -> List[Stream]:
         streams = [stream_class(tap=self) for stream_class in STREAM_TYPES]
 
@@ -0,0 +1,96 @@
+"""Tests coin list caching."""
+
+import json
+import logging
+from unittest import mock
+
+import pytest
+import requests
+from singer_sdk.exceptions import FatalAPIError, RetriableAPIError
+
+from tap_coingecko.coins import CoinListCache
+from tap_coingecko.tap import Tapcoingecko
+
+
+class _Loader:
+
+    def __init__(self, coins=("bitcoin", "ethereum")):
+        self.coins = list(coins)
+        self.calls = []
+        self.modified = True
+        self.error = None
+
+    def __call__(self, validators):
+        self.calls.append(validators)
+        if self.error:
+            raise self.error
+        if not self.modified:
+            return None, validators
+        return self.coins, {"etag": f'"{len(self.calls)}"'}
+
+
+def test_coin_list_is_loaded_once():
+    cache = CoinListCache(logging.getLogger("test"))
+    loader = _Loader()
+
+    assert cache.get(loader) == ["bitcoin", "ethereum"]
+    assert cache.get(loader) == ["bitcoin", "ethereum"]
+    assert loader.calls == [{}]
+
+
+def test_file_store_revalidation(tmp_path):
+    logger = logging.getLogger("test")
+    loader = _Loader()
+
+    CoinListCache(logger, directory=str(tmp_path)).get(loader)
+    assert [p.name for p in tmp_path.iterdir()] == ["coins_list.json"]
+
+    coins = CoinListCache(logger, directory=str(tmp_path)).get(loader)
+    assert coins == ["bitcoin", "ethereum"]
+    assert len(loader.calls) == 1
+
+    # Expired list is revalidated with the validators of the last response
+    loader.modified = False
+    coins = CoinListCache(logger, directory=str(tmp_path), ttl=-1).get(loader)
+    assert coins == ["bitcoin", "ethereum"]
+    assert loader.calls[1] == {"etag": '"1"'}
+
+    data = json.loads((tmp_path / "coins_list.json").read_text())
+    assert data["validators"] == {"etag": '"1"'}
+
+    # Expired list is used if the list fails to load
+    loader.error = ValueError("unexpected response")
+    coins = CoinListCache(logger, directory=str(tmp_path), ttl=-1).get(loader)
+    assert coins == ["bitcoin", "ethereum"]
+
+    (tmp_path / "coins_list.json").write_text("{")
+    with pytest.raises(ValueError):
+        CoinListCache(logger, directory=str(tmp_path)).get(loader)
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("unexpected response"),
+    FatalAPIError("404 Client Error"),
+    RetriableAPIError("429 Client Error"),
+    requests.exceptions.ConnectionError("Connection refused"),
+])
+def test_fetch_coins_errors(tmp_path, error):
+    tap = Tapcoingecko(config={"coins_cache_dir": str(tmp_path)})
+    stream = tap.streams["coingecko_coin"]
+    loader = _Loader()
+
+    def fetch_coin_list(validators):
+        return loader(validators)
+
+    with mock.patch.object(
+            stream, "fetch_coin_list",
+            fetch_coin_list), mock.patch("backoff._sync.time.sleep"):
+        loader.error = error
+        assert stream.fetch_coins() == []
+
+        # The expired list is used if the list fails to load
+        loader.error = None
+        stream.fetch_coins()
+        tap.coin_list_cache.ttl = -1
+        loader.error = error
+        assert stream.fetch_coins() == [{"id": "bitcoin"}, {"id": "ethereum"}]
@@ -1,6 +1,9 @@
 """Tests standard tap features using the built-in SDK tests library."""
 
 import copy
+import threading
+import time
+from unittest import mock
 
 import vcr
 from vcr.record_mode import RecordMode
@@ -88,3 +91,148 @@ def _validate_schema(config, context, schema_file, stream_name):
 
         validator = JSONSchemaValidator(schema)
         validator.validate(records[0])
+
+
+def _sync_coin_data(config):
+    tap = Tapcoingecko(config=config)
+    stream = tap.streams["coingecko_coin"]
+
+    lock = threading.Lock()
+    requests = {"in_flight": 0, "max_in_flight": 0}
+
+    def request_records(context):
+        with lock:
+            requests["in_flight"] += 1
+            requests["max_in_flight"] = max(requests["max_in_flight"],
+                                            requests["in_flight"])
+        try:
+            # The first coins respond slower, so the prefetched ones
+            # complete first
+            position = config["coins"].index(context["id"])
+            time.sleep(0.1 / (position + 1))
+            if context["id"] == "failing":
+                raise Exception("Server error")
+            return [{"id": context["id"], "position": position}]
+        finally:
+            with lock:
+                requests["in_flight"] -= 1
+
+    records = []
+    with mock.patch.object(stream, "request_records", request_records):
+        for context in stream.partitions:
+            for record in stream.get_records(context):
+                records.append(record)
+
+    return records, requests["max_in_flight"]
+
+
+def test_concurrent_coin_data():
+    config = {"coins": ["bitcoin", "failing", "ethereum", "tether", "solana"]}
+
+    sequential_records, sequential_in_flight = _sync_coin_data(config)
+    concurrent_records, concurrent_in_flight = _sync_coin_data({
+        **config, "fetch_concurrency":
+        3
+    })
+
+    # The coins are requested by the prefetch workers at the same time, at
+    # most `fetch_concurrency` of them
+    assert sequential_in_flight == 1
+    assert 1 < concurrent_in_flight <= 3
+
+    # The failed coin is skipped, records keep the partitions order
+    assert [record["id"] for record in concurrent_records
+            ] == ["bitcoin", "ethereum", "tether", "solana"]
+    assert concurrent_records == sequential_records
+
+
+def test_prefetcher_is_shut_down():
+    config = {"coins": ["bitcoin", "ethereum"], "fetch_concurrency": 2}
+    tap = Tapcoingecko(config=config)
+    stream = tap.streams["coingecko_coin"]
+    prefetcher = stream.partition_prefetcher
+
+    with mock.patch.object(stream, "request_records", lambda context: []):
+        stream.sync()
+
+    assert prefetcher._executor._shutdown
+    # The next sync prefetches with a new executor
+    assert stream.partition_prefetcher is not prefetcher
+
+
+def _sync_incremental_coin_data(config, state, markets):
+    tap = Tapcoingecko(config=config, state=state)
+    stream = tap.streams["coingecko_coin"]
+
+    def fetch_markets(coin_ids):
+        return [{
+            "id": coin_id,
+            "last_updated": markets[coin_id]
+        } for coin_id in coin_ids if coin_id in markets]
+
+    requested_coins = []
+
+    def request_records(context):
+        requested_coins.append(context["id"])
+        return [{"id": context["id"]}]
+
+    with mock.patch.object(stream, "fetch_markets", fetch_markets), \
+            mock.patch.object(stream, "request_records", request_records):
+        for context in stream.partitions:
+            list(stream.get_records(context))
+
+    return requested_coins, tap.state
+
+
+def test_incremental_coin_data():
+    config = {
+        "coins": ["bitcoin", "ethereum", "tether", "unlisted"],
+        "incremental_coin_data": True,
+    }
+    markets = {
+        "bitcoin": "2021-12-01T00:00:00.000Z",
+        "ethereum": "2021-12-01T00:00:00.000Z",
+        "tether": "2021-12-01T00:00:00.000Z",
+    }
+
+    requested_coins, state = _sync_incremental_coin_data(config, {}, markets)
+    assert requested_coins == config["coins"]
+
+    markets["ethereum"] = "2021-12-01T00:05:00.000Z"
+    requested_coins, state = _sync_incremental_coin_data(
+        config, copy.deepcopy(state), markets)
+    # Coins missing in the markets listing are always loaded
+    assert requested_coins == ["ethereum", "unlisted"]
+
+    partitions = state["bookmarks"]["coingecko_coin"]["partitions"]
+    assert {
+        partition["context"]["id"]: partition["last_updated"]
+        for partition in partitions if "last_updated" in partition
+    } == markets
+
+
+def test_realtime_coin_batches():
+    coins = [f"coin-{i}" for i in range(600)]
+    tap = Tapcoingecko(config={
+        "realtime": True,
+        "coins": coins,
+        "max_url_length": 2000
+    })
+    stream = tap.streams["coingecko_market_realtime"]
+
+    batches = [partition["ids"].split(",") for partition in stream.partitions]
+    assert sum(batches, []) == coins
+    assert max(len(batch) for batch in batches) <= stream.max_per_page
+    url_lengths = [
+        len(stream.prepare_request(partition, None).url)
+        for partition in stream.partitions
+    ]
+    assert all(1900 < length <= 2000 for length in url_lengths[:-1])
+    assert url_lengths[-1] <= 2000
+
+    tap = Tapcoingecko(config={"realtime": True, "coins": coins})
+    stream = tap.streams["coingecko_market_realtime"]
+    assert [
+        len(partition["ids"].split(",")) for partition in stream.partitions
+    ] == [250, 250, 100]
+    assert stream.get_url_params(stream.partitions[0], None)["per_page"] == 250
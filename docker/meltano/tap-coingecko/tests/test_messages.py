@@ -0,0 +1,84 @@
+"""Tests buffered RECORD messages writing."""
+
+import datetime
+import io
+import json
+import logging
+
+from freezegun import freeze_time
+from singer_sdk.helpers._typing import conform_record_data_types
+
+from tap_coingecko.messages import RecordWriter, compile_conformance
+
+SCHEMA = {
+    "properties": {
+        "symbol": {
+            "type": ["string"]
+        },
+        "t": {
+            "type": ["integer"]
+        },
+        "date": {
+            "type": ["string", "null"],
+            "format": "date-time"
+        },
+        "active": {
+            "type": ["boolean", "null"]
+        },
+    }
+}
+
+
+def test_compiled_conformance():
+    logger = logging.getLogger("test")
+    conform = compile_conformance("test", SCHEMA, logger)
+
+    for row in [
+        {
+            "symbol": "AAPL",
+            "t": 1,
+            "active": 1,
+            "unknown": "value"
+        },
+        {
+            "symbol": "AAPL",
+            "date": datetime.date(2022, 5, 5),
+            "active": None
+        },
+    ]:
+        assert conform(row) == conform_record_data_types(
+            "test", row, SCHEMA, logger)
+
+
+def test_record_writer_buffers_records():
+    output = io.StringIO()
+    writer = RecordWriter(output=output, buffer_size=1000, flush_interval=60)
+
+    writer.write_record("test", {"symbol": "AAPL"})
+    assert output.getvalue() == ""
+
+    writer.flush()
+    message = json.loads(output.getvalue())
+    assert message["type"] == "RECORD"
+    assert message["stream"] == "test"
+    assert message["record"] == {"symbol": "AAPL"}
+
+    for i in range(10):
+        writer.write_record("test", {"symbol": "AAPL", "t": i})
+    assert len(output.getvalue().splitlines()) > 1
+
+
+def test_record_writer_stamps_records_when_written():
+    output = io.StringIO()
+    writer = RecordWriter(output=output, buffer_size=1000, flush_interval=60)
+
+    with freeze_time("2022-05-05 10:00:00"):
+        writer.write_record("test", {"t": 1})
+    with freeze_time("2022-05-05 10:00:30"):
+        writer.write_record("test", {"t": 2})
+        writer.flush()
+
+    assert [
+        json.loads(line)["time_extracted"]
+        for line in output.getvalue().splitlines()
+    ] == ["2022-05-05T10:00:00.000000Z", "2022-05-05T10:00:30.000000Z"]
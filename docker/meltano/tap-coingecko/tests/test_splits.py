@@ -0,0 +1,81 @@
+"""Tests assignment of the coins to tap splits."""
+
+import hashlib
+import json
+from unittest import mock
+
+import pytest
+from singer_sdk.exceptions import ConfigValidationError
+
+from tap_coingecko.splits import SplitAssigner
+from tap_coingecko.tap import Tapcoingecko
+
+COIN_IDS = [f"coin-{i}" for i in range(100)]
+
+
+def _load_coin_ids(config, stream_name="coingecko_coin"):
+    tap = Tapcoingecko(config=config)
+    stream = tap.streams[stream_name]
+    with mock.patch.object(tap.coin_list_cache, "get",
+                           lambda loader: COIN_IDS):
+        return [
+            coin_id for partition in stream.partitions
+            for coin_id in (partition.get("ids") or partition["id"]).split(",")
+        ]
+
+
+def test_coins_are_split_by_id():
+    splits = [
+        _load_coin_ids({
+            "split_num": "3",
+            "split_id": str(split_id)
+        }) for split_id in range(3)
+    ]
+    assert sorted(sum(splits, [])) == sorted(COIN_IDS)
+
+    for split_id, coin_ids in enumerate(splits):
+        assert all(
+            int(hashlib.md5(coin_id.encode("UTF-8")).hexdigest(), 16) %
+            3 == split_id for coin_id in coin_ids)
+
+    # Realtime batches hold the coins of the split only
+    assert _load_coin_ids({
+        "realtime": True,
+        "split_num": "3",
+        "split_id": "1"
+    }, "coingecko_market_realtime") == splits[1]
+
+
+def test_jump_mode():
+    config = {"split_num": "3", "split_id": "2", "split_mode": "jump"}
+    assigner = SplitAssigner(split_num=3, split_id=2, mode="jump")
+    assert _load_coin_ids(config) == assigner.filter(COIN_IDS)
+
+
+def test_cost_mode(tmp_path):
+    plan_file = tmp_path / "plan.json"
+    plan_file.write_text(
+        json.dumps({
+            "split_num": 2,
+            "splits": {
+                "coin-1": 0,
+                "coin-2": 1
+            }
+        }))
+    config = {
+        "split_num": "2",
+        "split_id": "1",
+        "split_mode": "cost",
+        "split_plan_file": str(plan_file)
+    }
+    coin_ids = _load_coin_ids(config)
+    assert "coin-2" in coin_ids
+    assert "coin-1" not in coin_ids
+    # Coins missing from the plan are hashed
+    jump = SplitAssigner(split_num=2, split_id=1, mode="jump")
+    assert [coin_id for coin_id in coin_ids if coin_id != "coin-2"
+            ] == jump.filter(coin_id for coin_id in COIN_IDS
+                             if coin_id not in ["coin-1", "coin-2"])
+
+    with pytest.raises(ConfigValidationError, match="for 2 splits"):
+        _load_coin_ids({**config, "split_num": "3"})
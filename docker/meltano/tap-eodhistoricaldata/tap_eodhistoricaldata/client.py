@@ -1,19 +1,43 @@
 """REST client handling, including eodhistoricaldataStream base class."""
 import os
 import re
-import hashlib
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional, List
+from typing import Any, Callable, Dict, Iterable, Optional, List
 
-import datadog.api
 import requests
 import backoff
 from singer_sdk.streams import RESTStream
 from singer_sdk.exceptions import RetriableAPIError
 
+from tap_eodhistoricaldata.jsonstream import iter_json_array
+from tap_eodhistoricaldata.ratelimit import RateLimitedAdapter, RateLimiter
+
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 
 EXCHANGE_POSTFIXES = {'CC': '.CC', 'INDX': '.INDX'}
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 300
+DEFAULT_RATE_LIMIT_BURST = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def create_requests_session(config: dict) -> requests.Session:
+    """Create a keep-alive session shared by all the streams of the tap. All
+    the requests of the session go through one rate limiter."""
+    pool_size = int(config.get("http_pool_size", DEFAULT_HTTP_POOL_SIZE))
+    rate_limit = config.get("rate_limit")
+    rate_limiter = RateLimiter(rate=float(rate_limit) if rate_limit else None,
+                               burst=float(
+                                   config.get("rate_limit_burst",
+                                              DEFAULT_RATE_LIMIT_BURST)))
+    adapter = RateLimitedAdapter(rate_limiter,
+                                 pool_connections=pool_size,
+                                 pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class eodhistoricaldataStream(RESTStream):
@@ -21,6 +45,53 @@ class eodhistoricaldataStream(RESTStream):
 
     url_base = "https://eodhistoricaldata.com/api"
 
+    # Parse array responses incrementally while they are being received
+    stream_responses = False
+
+    @property
+    def requests_session(self) -> requests.Session:
+        # All the streams of the tap share one pooled keep-alive session
+        return self._tap.requests_session
+
+    @property
+    def timeout(self) -> int:
+        return int(self.config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT))
+
+    def iter_response_records(self,
+                              response: requests.Response) -> Iterable[Any]:
+        """Yield the elements of the JSON array response as they arrive from
+        the socket. The response must be requested with `stream=True`."""
+        with response:
+            yield from iter_json_array(
+                response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+    def parse_response(self, response: requests.Response) -> Iterable[dict]:
+        if self.stream_responses:
+            yield from self.iter_response_records(response)
+        else:
+            yield from super().parse_response(response)
+
+    def _request(self, prepared_request: requests.PreparedRequest,
+                 context: Optional[dict]) -> requests.Response:
+        if not self.stream_responses:
+            return super()._request(prepared_request, context)
+
+        # Same as the SDK implementation, but the body is left to be read by
+        # `parse_response`, so the request duration excludes the download
+        response = self.requests_session.send(prepared_request,
+                                              timeout=self.timeout,
+                                              stream=True)
+        if self._LOG_REQUEST_METRICS:
+            extra_tags = {}
+            if self._LOG_REQUEST_METRIC_URLS:
+                extra_tags["url"] = prepared_request.path_url
+            self._write_request_duration_log(endpoint=self.path,
+                                             response=response,
+                                             context=context,
+                                             extra_tags=extra_tags)
+        self.validate_response(response)
+        return response
+
     def get_next_page_token(self, response: requests.Response,
                             previous_token: Optional[Any]) -> Optional[Any]:
         return None
@@ -78,17 +149,10 @@ class eodhistoricaldataStream(RESTStream):
                 exchanges = [exchange]
 
             self.logger.info(f"Loading symbols for exchanges: {exchanges}")
-            exchange_url = f"{self.url_base}/exchange-symbol-list"
+            symbols_by_exchange = self._tap.exchange_symbols_cache.get(
+                exchanges, self.load_exchange_symbols)
             records = []
             for exchange in exchanges:
-                res = requests.get(url=f"{exchange_url}/{exchange}",
-                                   params={
-                                       "api_token": self.config["api_token"],
-                                       "fmt": "json"
-                                   })
-                self._write_request_duration_log("/exchange-symbol-list", res,
-                                                 None, None)
-
                 exchange_symbols = [{
                     "Code":
                     record["Code"] + self.get_ticker_postfix(exchange),
@@ -96,7 +160,7 @@ class eodhistoricaldataStream(RESTStream):
                     record["Type"],
                     "Exchange":
                     record["Exchange"],
-                } for record in res.json()
+                } for record in symbols_by_exchange[exchange]
                                     if re.match("^[^()]+$", record["Code"])]
 
                 if exchange_symbols_limit is not None:
@@ -107,50 +171,96 @@ class eodhistoricaldataStream(RESTStream):
 
                 records += exchange_symbols
 
+        codes = set(
+            self._tap.split_assigner.filter(record['Code']
+                                            for record in records))
+        return [
+            record
+            for record in sorted(records, key=lambda record: record['Code'])
+            if record['Code'] in codes
+        ]
+
+    def load_exchange_symbols(self, exchange: str) -> List[Dict[str, str]]:
+        """Download the symbol list of the exchange, keeping only the fields
+        used by the tap."""
+        self.logger.info(f"Downloading symbols of exchange {exchange}")
+        res = self.requests_session.get(
+            url=f"{self.url_base}/exchange-symbol-list/{exchange}",
+            params={
+                "api_token": self.config["api_token"],
+                "fmt": "json"
+            },
+            timeout=self.timeout,
+            stream=True)
+        self._write_request_duration_log("/exchange-symbol-list", res, None,
+                                         None)
+        res.raise_for_status()
+
+        return [{
+            "Code": record["Code"],
+            "Type": record["Type"],
+            "Exchange": record["Exchange"],
+        } for record in self.iter_response_records(res)]
+
+    def load_event_symbols(self, exchange: str, dates: List[str],
+                           event_type: str) -> List[str]:
+        """Return the symbols of the exchange with events of the type, e.g.
+        `splits` or `dividends`, on any of the dates."""
+        self.logger.info(
+            f"Loading symbols' {event_type} for exchange: {exchange}")
+
+        def load(date: str) -> List[str]:
+            return self.load_date_event_symbols(exchange, date, event_type)
+
+        # The bulk API returns the events of a single date, so the events of
+        # the past dates are cached between runs
+        events = self._tap.event_symbols_cache.get(exchange, event_type, dates,
+                                                   load)
+
+        postfix = self.get_ticker_postfix(exchange)
         return list(
-            filter(lambda record: self.is_within_split(record['Code']),
-                   sorted(records, key=lambda record: record['Code'])))
-
-    def load_split_symbols(self, exchange: str, dates: List[str]) -> List[str]:
-        self.logger.info(f"Loading symbols' splits for exchange: {exchange}")
-
-        url = f"{self.url_base}/eod-bulk-last-day/{exchange}"
-        symbols = set()
-        params = {
-            "api_token": self.config["api_token"],
-            "type": "splits",
-            "fmt": "json"
-        }
-        for date in dates:
-            params["date"] = date
-            res = requests.get(url=url, params=params)
-            self._write_request_duration_log("/eod-bulk-last-day?type=splits",
-                                             res, None, None)
-
-            for record in res.json():
-                symbols.add(record["code"] + self.get_ticker_postfix(exchange))
-
-        exchange_symbols_limit = self.config.get("exchange_symbols_limit",
-                                                 None)
-        if exchange_symbols_limit is not None:
-            symbols = list(sorted(symbols))[:exchange_symbols_limit]
-
-        return list(symbols)
-
-    def split_num(self) -> int:
-        return int(self.config.get("split_num", "1"))
-
-    def split_id(self) -> int:
-        return int(self.config.get("split_id", "0"))
-
-    def is_within_split(self, symbol) -> int:
-        # Use built-in `hashlib` to get consistent hash value
-        symbol_hash = int(hashlib.md5(symbol.encode("UTF-8")).hexdigest(), 16)
-        return symbol_hash % self.split_num() == self.split_id()
+            {code + postfix
+             for codes in events.values()
+             for code in codes})
+
+    def load_date_event_symbols(self, exchange: str, date: str,
+                                event_type: str) -> List[str]:
+        """Return the codes of the exchange symbols with events of the type
+        on the date."""
+        res = self.requests_session.get(
+            url=f"{self.url_base}/eod-bulk-last-day/{exchange}",
+            params={
+                "api_token": self.config["api_token"],
+                "type": event_type,
+                "date": date,
+                "fmt": "json"
+            },
+            timeout=self.timeout,
+            stream=True)
+        self._write_request_duration_log(
+            f"/eod-bulk-last-day?type={event_type}", res, None, None)
+        # A missed event would keep stale adjusted prices
+        res.raise_for_status()
+
+        return sorted(
+            {record["code"]
+             for record in self.iter_response_records(res)})
+
+    def is_within_split(self, symbol) -> bool:
+        return self._tap.split_assigner.is_within_split(symbol)
 
     def get_ticker_postfix(self, exchange) -> str:
         return EXCHANGE_POSTFIXES.get(exchange, '')
 
+    def _write_schema_message(self) -> None:
+        # Buffered records must reach the target before any other message
+        self._tap.record_writer.flush()
+        super()._write_schema_message()
+
+    def _write_state_message(self) -> None:
+        self._tap.record_writer.flush()
+        super()._write_state_message()
+
     def _write_metric_log(self, metric: dict,
                           extra_tags: Optional[dict]) -> None:
         super()._write_metric_log(metric, extra_tags)
@@ -159,8 +269,6 @@ class eodhistoricaldataStream(RESTStream):
     def _send_to_datadog(self, metric, types, add_env=True):
         try:
             if metric["type"] in types:
-                datadog.initialize()
-
                 tag_list = []
                 if "tags" in metric:
                     tag_list += [
@@ -170,11 +278,9 @@ class eodhistoricaldataStream(RESTStream):
                 if add_env and "ENV" in os.environ:
                     tag_list.append(f"env:{os.environ['ENV']}")
 
-                datadog.api.Metric.send(
-                    metric=f"data.tap.{self.name}.{metric['metric']}",
-                    type="count",
-                    points=metric["value"],
-                    tags=tag_list)
+                self._tap.metrics_emitter.increment(
+                    f"data.tap.{self.name}.{metric['metric']}",
+                    metric["value"], tag_list)
             else:
                 self.logger.debug(f"Skipping metric: {metric['metric']}")
 
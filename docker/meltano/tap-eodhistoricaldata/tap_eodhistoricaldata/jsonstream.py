@@ -0,0 +1,158 @@
+"""Incremental parsing of JSON arrays received in chunks."""
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _ChunkReader:
+    """Buffer of the decoded text, which keeps only the unparsed part of the
+    document."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read(self, size: int = 1) -> bool:
+        """Append at least `size` characters to the buffer, or the rest of
+        the document. Returns False if nothing was left."""
+        texts = []
+        received = 0
+        for chunk in self.chunks:
+            text = self.utf8.decode(chunk)
+            texts.append(text)
+            received += len(text)
+            if received >= size:
+                break
+        else:
+            if not self.eof:
+                self.eof = True
+                texts.append(self.utf8.decode(b"", final=True))
+
+        self.buffer = self.buffer[self.pos:] + "".join(texts)
+        self.pos = 0
+        return received > 0
+
+    def read_all(self) -> str:
+        while self.read():
+            pass
+        return self.buffer[self.pos:]
+
+    def skip_whitespace(self) -> bool:
+        # Returns False if the document ended
+        while True:
+            while self.pos < len(
+                    self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return True
+            if not self.read():
+                return False
+
+    def next_char(self, error: str) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        if not self.skip_whitespace():
+            raise json.JSONDecodeError(error, self.buffer, self.pos)
+        return self.buffer[self.pos]
+
+    def decode(self, delimiters: str) -> Any:
+        """Decode the value at the current position, which must be followed
+        by one of the delimiters. The position is left at the delimiter."""
+        self.next_char("Expecting value")
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # The unparsed text is at least doubled, so a large value is
+                # decoded a logarithmic number of times instead of once per
+                # chunk
+                if self.read(len(self.buffer) - self.pos):
+                    continue
+                raise
+
+            # A number cut by the end of the buffer is decoded partially, e.g.
+            # "1.5" of "1.5e3", so a value is only accepted once it's followed
+            # by a delimiter, otherwise it's decoded again with more data
+            while end < len(self.buffer) and self.buffer[end] in _WHITESPACE:
+                end += 1
+            if end == len(self.buffer) or self.buffer[end] not in delimiters:
+                if self.read():
+                    continue
+                raise json.JSONDecodeError(
+                    f"Expecting one of '{delimiters}' delimiters", self.buffer,
+                    end)
+
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the elements of the array at the current position and move
+        past its end."""
+        self.pos += 1
+        expect_element = False
+        while True:
+            if self.next_char(
+                    "Unterminated array") == "]" and not expect_element:
+                self.pos += 1
+                return
+
+            element = self.decode(",]")
+            expect_element = self.buffer[self.pos] == ","
+            self.pos += 1
+            yield element
+            if not expect_element:
+                return
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array as soon as each of them
+    is received, without keeping the whole document in memory. Any other
+    top-level value is yielded as a whole once the document is complete.
+
+    Chunks are utf-8 encoded bytes, e.g. `response.iter_content()` of a
+    streamed `requests` response.
+    """
+    reader = _ChunkReader(chunks)
+    if reader.next_char("Expecting value") != "[":
+        yield json.loads(reader.read_all())
+        return
+
+    yield from reader.iter_array()
+
+
+def iter_json_member_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """Yield the elements of the array under `key` of a top-level JSON object
+    as soon as each of them is received. Other members are parsed and
+    skipped. Nothing is yielded if the document is not an object or the
+    member is missing or is not an array."""
+    reader = _ChunkReader(chunks)
+    if reader.next_char("Expecting value") != "{":
+        json.loads(reader.read_all())
+        return
+
+    reader.pos += 1
+    expect_member = False
+    while True:
+        if reader.next_char(
+                "Unterminated object") == "}" and not expect_member:
+            return
+
+        member_key = reader.decode(":")
+        reader.pos += 1
+        if member_key == key and reader.next_char("Expecting value") == "[":
+            yield from reader.iter_array()
+            if reader.next_char("Unterminated object") not in ",}":
+                raise json.JSONDecodeError("Expecting ',' delimiter",
+                                           reader.buffer, reader.pos)
+        else:
+            reader.decode(",}")
+
+        expect_member = reader.buffer[reader.pos] == ","
+        reader.pos += 1
+        if not expect_member:
+            return
@@ -0,0 +1,125 @@
+"""Batched shipping of tap metrics to Datadog."""
+import atexit
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import datadog
+import datadog.api
+
+DEFAULT_FLUSH_INTERVAL = 10
+DEFAULT_MAX_SERIES = 10000
+
+SeriesKey = Tuple[str, Tuple[str, ...]]
+
+
+class DatadogMetricsEmitter:
+    """Aggregates counters in memory per metric and tag set and sends them
+    to the Datadog API in one request per flush. Gauges send the last value
+    recorded since the previous flush, a gauge which is not recorded again is
+    not sent by the next flush.
+
+    Flushes happen in a background thread every `flush_interval` seconds and
+    on `close()`, so recording a metric never waits for the network. At most
+    `max_series` distinct series are kept between flushes, new series above
+    the limit are dropped.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_series: int = DEFAULT_MAX_SERIES,
+                 api_key: Optional[str] = None,
+                 api_host: Optional[str] = None):
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self.max_series = max_series
+
+        self._counters: Dict[SeriesKey, float] = {}
+        self._gauges: Dict[SeriesKey, float] = {}
+        self._dropped_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        datadog.initialize(api_key=api_key, api_host=api_host)
+
+    def increment(self, metric: str, value: float, tags: List[str]) -> None:
+        key = (metric, tuple(sorted(tags)))
+        with self._lock:
+            if key in self._counters:
+                self._counters[key] += value
+            elif len(self._counters) + len(self._gauges) < self.max_series:
+                self._counters[key] = value
+            else:
+                self._dropped_count += 1
+
+            if self._thread is None and not self._closed.is_set():
+                self._start()
+
+    def gauge(self, metric: str, value: float, tags: List[str]) -> None:
+        key = (metric, tuple(sorted(tags)))
+        with self._lock:
+            if key in self._gauges or len(self._counters) + len(
+                    self._gauges) < self.max_series:
+                self._gauges[key] = value
+            else:
+                self._dropped_count += 1
+
+            if self._thread is None and not self._closed.is_set():
+                self._start()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                counters, self._counters = self._counters, {}
+                gauges, self._gauges = self._gauges, {}
+                dropped_count, self._dropped_count = self._dropped_count, 0
+
+            if dropped_count:
+                self.logger.warning(
+                    f"Dropped {dropped_count} metrics: too many series")
+            if not counters and not gauges:
+                return
+
+            now = int(time.time())
+            series = [{
+                "metric": metric,
+                "type": metric_type,
+                "points": [(now, value)],
+                "tags": list(tags),
+            } for metric_type, values in [("count", counters), ("gauge",
+                                                                gauges)]
+                      for (metric, tags), value in values.items()]
+
+            try:
+                datadog.api.Metric.send(metrics=series)
+            except Exception as e:
+                self.logger.warning(
+                    f"{len(series)} metrics were not sent due to an error: '{str(e)}'"
+                )
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            # Otherwise the closed emitter is kept and flushed again at exit,
+            # when the logging streams may already be closed
+            atexit.unregister(self.close)
+        self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name="datadog-metrics",
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,203 @@
+"""Client-side rate limiting of the API requests."""
+import email.utils
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+from urllib.parse import urlsplit
+
+import requests
+import requests.adapters
+
+# Window assumed for the remaining quota header sent without a reset time
+DEFAULT_QUOTA_WINDOW = 60
+# Pause after a 429 response without the `Retry-After` header
+DEFAULT_RETRY_AFTER = 1
+# The rate is decreased by this factor on every 429 response and is then
+# gradually recovered up to the configured rate on successful responses
+RATE_DECREASE_FACTOR = 0.5
+RATE_RECOVERY_FACTOR = 1.05
+MIN_RATE = 0.1
+
+REMAINING_HEADERS = ["X-RateLimit-Remaining", "RateLimit-Remaining"]
+RESET_HEADERS = ["X-RateLimit-Reset", "RateLimit-Reset"]
+
+
+class TokenBucket:
+    """Hands out up to `rate` request permits per second, with up to `burst`
+    permits saved up while idle. Without `rate` requests are only held
+    during pauses.
+
+    `clock` and `sleep` measure and wait out the time between the requests.
+    """
+
+    def __init__(self,
+                 rate: Optional[float],
+                 burst: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self.sleep = sleep
+
+        self._tokens = self.burst
+        self._refilled_at = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request is allowed."""
+        while True:
+            with self._lock:
+                now = self.clock()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+
+            self.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = self.clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._refilled_at = max(self._refilled_at, self._paused_until)
+
+    def set_rate(self, rate: float) -> None:
+        """Set the rate derived from the quota reported by the API, capped by
+        the configured rate."""
+        with self._lock:
+            self._refill(self.clock())
+            rate = max(MIN_RATE, rate)
+            self.rate = rate if self.max_rate is None else min(
+                self.max_rate, rate)
+
+    def decrease_rate(self) -> None:
+        with self._lock:
+            if self.rate is not None:
+                self._refill(self.clock())
+                self.rate = max(MIN_RATE, self.rate * RATE_DECREASE_FACTOR)
+
+    def recover_rate(self) -> None:
+        with self._lock:
+            if self.rate is not None and self.max_rate is not None:
+                self._refill(self.clock())
+                self.rate = min(self.max_rate,
+                                self.rate * RATE_RECOVERY_FACTOR)
+
+    def _refill(self, now: float) -> None:
+        if self.rate is None:
+            self._refilled_at = max(self._refilled_at, now)
+        elif now > self._refilled_at:
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+
+class RateLimiter:
+    """Keeps a token bucket per API host, adapting its rate to the rate
+    limit headers and 429 responses of the host."""
+
+    def __init__(self,
+                 rate: Optional[float] = None,
+                 burst: float = 1,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate,
+                                                  self.burst,
+                                                  clock=self.clock,
+                                                  sleep=self.sleep)
+            return self._buckets[host]
+
+    def acquire(self, url: str) -> None:
+        self.bucket(urlsplit(url).netloc).acquire()
+
+    def update(self, url: str, response: requests.Response) -> None:
+        bucket = self.bucket(urlsplit(url).netloc)
+
+        if response.status_code == 429:
+            bucket.decrease_rate()
+            retry_after = _parse_retry_after(response.headers)
+            bucket.pause(DEFAULT_RETRY_AFTER if retry_after is
+                         None else retry_after)
+            return
+
+        remaining = _parse_number(response.headers, REMAINING_HEADERS)
+        if remaining is None:
+            bucket.recover_rate()
+            return
+
+        window = _parse_reset(response.headers)
+        if window is None:
+            window = DEFAULT_QUOTA_WINDOW
+
+        # The remaining quota is spread evenly until it's reset
+        if remaining < 1:
+            bucket.pause(window)
+        else:
+            bucket.set_rate(remaining / max(window, 1))
+
+
+class RateLimitedAdapter(requests.adapters.HTTPAdapter):
+    """Sends every request of the session through the rate limiter."""
+
+    def __init__(self, rate_limiter: RateLimiter, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+
+    def send(self, request: requests.PreparedRequest,
+             **kwargs) -> requests.Response:
+        self.rate_limiter.acquire(request.url)
+        response = super().send(request, **kwargs)
+        self.rate_limiter.update(request.url, response)
+        return response
+
+
+def _parse_number(headers: Mapping[str, str], names) -> Optional[float]:
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return None
+
+
+def _parse_reset(headers: Mapping[str, str]) -> Optional[float]:
+    reset = _parse_number(headers, RESET_HEADERS)
+    # Either seconds until the reset or the reset unix timestamp
+    if reset is not None and reset > 1e9:
+        reset -= time.time()
+    return reset
+
+
+def _parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    retry_after = _parse_number(headers, ["Retry-After"])
+    if retry_after is not None or "Retry-After" not in headers:
+        return retry_after
+
+    # Otherwise it's an HTTP date
+    try:
+        retry_at = email.utils.parsedate_to_datetime(headers["Retry-After"])
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
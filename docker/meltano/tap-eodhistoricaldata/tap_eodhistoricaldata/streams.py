@@ -3,23 +3,31 @@ from abc import ABC
 from datetime import datetime, timedelta
 from functools import cached_property, reduce
 from pathlib import Path
-from typing import Any, Dict, Optional, Iterable, List
+from typing import Any, Dict, Optional, Iterable, List, Set
 
+import hashlib
 import json
+import math
 import re
+import time
+
 import requests
-import singer
-from singer import RecordMessage
-from singer_sdk.helpers._typing import conform_record_data_types
-from singer_sdk.helpers._util import utc_now
+from singer_sdk.exceptions import FatalAPIError, RetriableAPIError
 
-from tap_eodhistoricaldata.client import eodhistoricaldataStream
+from tap_eodhistoricaldata.client import STREAM_CHUNK_SIZE, eodhistoricaldataStream
+from tap_eodhistoricaldata.jsonstream import iter_json_member_array
+from tap_eodhistoricaldata.messages import compile_conformance
 
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 
 
 class AbstractEODStream(eodhistoricaldataStream):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conform_record = compile_conformance(self.name, self.schema,
+                                                  self.logger)
+
     @cached_property
     def partitions(self) -> List[dict]:
         return self.load_symbols()
@@ -35,35 +43,38 @@ class AbstractEODStream(eodhistoricaldataStream):
 
     def _write_record_message(self, record: dict) -> None:
         """Write out a RECORD message."""
-        record = conform_record_data_types(
-            stream_name=self.name,
-            row=record,
-            schema=self.schema,
-            logger=self.logger,
-        )
+        record = self.conform_record(record)
         for stream_map in self.stream_maps:
             mapped_record = stream_map.transform(record)
             # Emit record if not filtered
             if mapped_record is not None:
-                record_message = RecordMessage(
-                    stream=stream_map.stream_alias,
-                    record=mapped_record,
-                    version=None,
-                    time_extracted=utc_now(),
-                )
-                singer.write_message(record_message)
+                self._tap.record_writer.write_record(stream_map.stream_alias,
+                                                     mapped_record)
 
     def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
         if context is None:
             return
 
+        started = time.monotonic()
+        records_count = 0
         try:
-            yield from super().get_records(context)
+            for record in self.get_partition_records(context):
+                records_count += 1
+                yield record
         except Exception as e:
             self.logger.error('Error while requesting %s for symbol %s: %s' %
                               (self.name, context['Code'], str(e)))
             pass
 
+        self._tap.symbol_costs.record(self.name, context['Code'],
+                                      time.monotonic() - started,
+                                      records_count)
+
+    def get_partition_records(self, context: dict) -> Iterable[Dict[str, Any]]:
+        """Return the records of the symbol, errors are logged by
+        `get_records`."""
+        return super().get_records(context)
+
 
 class Fundamentals(AbstractEODStream):
     name = "eod_fundamentals"
@@ -83,6 +94,58 @@ class Fundamentals(AbstractEODStream):
             "filter"] = "General,Earnings,Highlights,AnalystRatings,Technicals,Valuation,Financials,SplitsDividends,SharesStats,ETF_Data,MutualFund_Data,Components"
         return params
 
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        if context is None:
+            return
+
+        state = self.get_context_state(context)
+        if self.is_unchanged(context, state):
+            return
+
+        for record in super().get_records(context):
+            yield record
+
+            if isinstance(record['UpdatedAt'], str):
+                state['updated_at'] = record['UpdatedAt']
+                state['loaded_at'] = datetime.now().strftime("%Y-%m-%d")
+
+    def is_unchanged(self, context: dict, state: dict) -> bool:
+        """Check with a request of the `UpdatedAt` field only whether the
+        fundamentals loaded within `fundamentals_max_age_days` are unchanged.
+        """
+        max_age_days = self.config.get("fundamentals_max_age_days")
+        if max_age_days is None or 'updated_at' not in state or state.get(
+                'loaded_at', '') < datetime.strftime(
+                    datetime.now() - timedelta(days=int(max_age_days)),
+                    "%Y-%m-%d"):
+            return False
+
+        try:
+            updated_at = self.request_decorator(self.load_updated_at)(
+                context['Code'])
+        except Exception as e:
+            self.logger.warning('Error while checking %s for symbol %s: %s' %
+                                (self.name, context['Code'], str(e)))
+            return False
+
+        return updated_at == state['updated_at']
+
+    def load_updated_at(self, symbol: str) -> Optional[str]:
+        res = self.requests_session.get(
+            url=f"{self.url_base}/fundamentals/{symbol}",
+            params={
+                "api_token": self.config["api_token"],
+                "filter": "General::UpdatedAt"
+            },
+            timeout=self.timeout)
+        self._write_request_duration_log("/fundamentals?filter=UpdatedAt", res,
+                                         None, None)
+        # Rate limited and server errors are retried by `request_decorator`
+        self.validate_response(res)
+
+        updated_at = res.json()
+        return updated_at if isinstance(updated_at, str) else None
+
     def post_process(self, row: dict, context: Optional[dict] = None) -> dict:
         if 'UpdatedAt' in row['General']:
             row['UpdatedAt'] = row['General']['UpdatedAt']
@@ -146,10 +209,52 @@ class Options(AbstractEODStream):
 
         return records
 
-    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
-        for i in super().get_records(context):
-            for j in i['data']:
-                yield j
+    # Option chains are parsed one by one while the response is received
+    stream_responses = True
+
+    def iter_response_records(self,
+                              response: requests.Response) -> Iterable[Any]:
+        with response:
+            yield from iter_json_member_array(
+                response.iter_content(chunk_size=STREAM_CHUNK_SIZE), "data")
+
+    def get_partition_records(self, context: dict) -> Iterable[Dict[str, Any]]:
+        # Only the chains changed since the previous run are emitted, chains
+        # of the past expirations are never emitted again
+        state = self.get_context_state(context)
+        fingerprints = state.get('fingerprints', {})
+        new_fingerprints = {}
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        completed = False
+        try:
+            for chain in super().get_partition_records(context):
+                expiration_date = str(chain.get('expirationDate'))
+                if expiration_date < today:
+                    continue
+
+                fingerprint = hashlib.md5(
+                    json.dumps(chain, sort_keys=True,
+                               default=str).encode("utf-8")).hexdigest()
+                new_fingerprints[expiration_date] = fingerprint
+                if fingerprints.get(expiration_date) == fingerprint:
+                    continue
+
+                yield chain
+            completed = True
+        finally:
+            if completed:
+                state['fingerprints'] = new_fingerprints
+            else:
+                # Chains missing from a partial response may still exist, so
+                # their fingerprints are kept unless expired
+                state['fingerprints'] = {
+                    expiration_date: fingerprint
+                    for expiration_date, fingerprint in {
+                        **fingerprints,
+                        **new_fingerprints
+                    }.items() if expiration_date >= today
+                }
 
 
 # ############## EXCHANGE STREAMS ################
@@ -198,6 +303,13 @@ class EODPrices(AbstractExchangeStream):
 
     STATE_MSG_FREQUENCY = 1000
 
+    # Both bulk last day and full history responses are large arrays
+    stream_responses = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._adjusted_symbols: Dict[str, Optional[Set[str]]] = {}
+
     def get_url_params(self, context: Optional[dict],
                        next_page_token: Optional[Any]) -> Dict[str, Any]:
         params = super().get_url_params(context, next_page_token)
@@ -207,6 +319,10 @@ class EODPrices(AbstractExchangeStream):
 
         if context["api"] == "eod":
             params["period"] = "d"
+            if "date_from" in context:
+                params["from"] = context["date_from"]
+            if "date_to" in context:
+                params["to"] = context["date_to"]
         else:
             params["date"] = context["date"]
 
@@ -215,9 +331,124 @@ class EODPrices(AbstractExchangeStream):
 
         return params
 
+    @property
+    def is_bulk_incremental(self) -> bool:
+        return bool(self.config.get(
+            "bulk_incremental")) and not self.config.get("symbols")
+
+    @cached_property
+    def partitions(self) -> List[Dict[str, Any]]:
+        if not self.is_bulk_incremental:
+            # Symbols listed on several exchanges share one partition state,
+            # so their prices are loaded once
+            partitions = []
+            symbols = set()
+            for partition in super().partitions:
+                if partition['symbol'] not in symbols:
+                    symbols.add(partition['symbol'])
+                    partitions.append(partition)
+            return partitions
+
+        # The context is extended while syncing, so the partition must be the
+        # context object kept in the state to keep matching its state
+        return [
+            self.get_context_state({"exchange": exchange})["context"]
+            for exchange in self.config.get("exchanges", [])
+        ]
+
     def is_initial_load(self, context: dict) -> bool:
         return self.get_starting_replication_key_value(context) is None
 
+    @property
+    def adjustment_events_days(self) -> int:
+        return int(self.config.get("adjustment_events_days", 0))
+
+    @cached_property
+    def adjustment_events_from(self) -> str:
+        return datetime.strftime(
+            datetime.now() - timedelta(days=self.adjustment_events_days),
+            "%Y-%m-%d")
+
+    @cached_property
+    def symbol_exchanges(self) -> Dict[str, str]:
+        """Configured exchange of each symbol, symbols from the config
+        parameter have none."""
+        if self.config.get("symbols"):
+            return {}
+
+        return {
+            record['Code']: exchange
+            for exchange in self.config.get("exchanges", [])
+            for record in self.load_symbols(exchange=exchange)
+        }
+
+    def get_adjusted_symbols(self,
+                             exchange: Optional[str]) -> Optional[Set[str]]:
+        """Return the symbols of the exchange with splits or dividends since
+        `adjustment_events_from`, loaded once per exchange, or None if the
+        events are not used or failed to load."""
+        if not self.adjustment_events_days or exchange is None:
+            return None
+
+        if exchange not in self._adjusted_symbols:
+            dates = self.loading_dates(
+                datetime.strptime(self.adjustment_events_from, "%Y-%m-%d"))
+            try:
+                self._adjusted_symbols[exchange] = {
+                    symbol
+                    for event_type in ["splits", "dividends"]
+                    for symbol in self.load_event_symbols(
+                        exchange, dates, event_type)
+                }
+            except Exception as e:
+                self.logger.warning(
+                    "Failed to load splits and dividends of exchange "
+                    f"{exchange}, checking first records instead: "
+                    f"'{str(e)}'")
+                self._adjusted_symbols[exchange] = None
+
+        return self._adjusted_symbols[exchange]
+
+    def is_history_unchanged(self, context: dict, symbol: str,
+                             first_record: Optional[dict],
+                             last_record_date: Optional[str]) -> bool:
+        """Decide whether only the bars since the last stored one need to be
+        loaded. Adjusted prices are adjusted for both splits and dividends,
+        so if these events since the last stored bar are known, only the
+        symbols with events are reloaded in full and nothing is requested to
+        check the rest."""
+        if first_record is None or not last_record_date:
+            return False
+
+        if last_record_date >= self.adjustment_events_from:
+            adjusted_symbols = self.get_adjusted_symbols(
+                self.symbol_exchanges.get(symbol))
+            if adjusted_symbols is not None:
+                return symbol not in adjusted_symbols
+
+        return self.is_first_record_unchanged(context, first_record)
+
+    def is_first_record_unchanged(self, context: dict,
+                                  first_record: Optional[dict]) -> bool:
+        """Check that the history of the symbol still starts with the stored
+        first record. The bars up to it are requested, so both history
+        extended back and prices adjusted after a split are detected."""
+        if first_record is None:
+            return False
+
+        context["date_to"] = first_record["date"]
+        try:
+            records = list(self.request_records(context))
+        finally:
+            del context["date_to"]
+
+        # Decades old bars are often adjusted to fractions of a cent, so the
+        # prices are compared relatively
+        return bool(records) and records[0]["date"] == first_record[
+            "date"] and math.isclose(records[0]["adjusted_close"],
+                                     first_record["adjusted_close"],
+                                     rel_tol=1e-4)
+
     def get_records_all(self, symbols: Iterable[str],
                         context: Optional[dict]) -> Iterable[Dict[str, Any]]:
         state = self.get_context_state(context)
@@ -229,73 +460,141 @@ class EODPrices(AbstractExchangeStream):
         for symbol in symbols:
             if not symbol:
                 continue
+
+            started = time.monotonic()
+            records_count = 0
             try:
                 context["object"] = symbol
                 context["first_record"] = None
 
-                first_records_match = None
+                first_record = first_records.get(symbol)
                 last_record_date = last_record_dates.get(symbol)
+                if self.is_history_unchanged(context, symbol, first_record,
+                                             last_record_date):
+                    # Only the bars since the last stored one are loaded,
+                    # the last one is loaded again as it may have changed
+                    context["date_from"] = last_record_date
+                    context["first_record"] = first_record
 
                 for record in self.request_records(context):
-                    if first_records_match is None:
-                        first_record = first_records.get(symbol)
-                        first_records_match = first_record is not None and first_record[
-                            "date"] == record['date'] and abs(
-                                first_record["adjusted_close"] -
-                                record['adjusted_close']) < 1e-3
-
+                    if context["first_record"] is None:
                         first_records[symbol] = context["first_record"] = {
                             "date": record['date'],
                             "adjusted_close": record['adjusted_close'],
                         }
 
-                    if first_records_match and last_record_date and record[
-                            'date'] < last_record_date:
-                        continue
-
                     last_record_dates[symbol] = record['date']
 
                     transformed_record = self.post_process(record, context)
                     if transformed_record is None:
                         continue
+                    records_count += 1
                     yield transformed_record
 
             except requests.exceptions.RequestException as e:
                 self.logger.exception(e)
+            finally:
+                context.pop("date_from", None)
+
+            self._tap.symbol_costs.record(self.name, symbol,
+                                          time.monotonic() - started,
+                                          records_count)
 
         state['first_records'] = first_records
         state['last_record_dates'] = last_record_dates
 
-    def get_records_partial(
-            self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+    def get_records_partial(self, symbols: Iterable[str],
+                            context: dict) -> Iterable[Dict[str, Any]]:
+        """Load the prices of the exchange symbols since the bookmark with one
+        bulk last day request per day instead of the full history of every
+        symbol."""
+        state = self.get_context_state(context)
+        first_records = state.setdefault('first_records', {})
+        last_record_dates = state.setdefault('last_record_dates', {})
+
+        # The bulk response contains all the symbols of the exchange
+        symbols = set(symbols)
+        postfix = self.get_ticker_postfix(context['exchange'])
+
         context["api"] = "eod-bulk-last-day"
         context["object"] = context['exchange']
 
         from_date = datetime.strptime(
             self.get_starting_replication_key_value(context), "%Y-%m-%d")
-        for date in self.loading_dates(from_date):
-            context["date"] = date
-            yield from super().get_records(context)
-        del context["date"]
+        try:
+            for date in self.loading_dates(from_date):
+                context["date"] = date
+                for record in self.request_records(context):
+                    symbol = record["code"] + postfix
+                    if symbol not in symbols:
+                        continue
+
+                    context["first_record"] = first_records.get(symbol)
+                    transformed_record = self.post_process(record, context)
+                    if transformed_record is None:
+                        continue
+
+                    last_record_dates[symbol] = max(
+                        last_record_dates.get(symbol, ''),
+                        transformed_record['date'])
+                    yield transformed_record
+        finally:
+            context.pop("date", None)
 
     def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
         if 'exchange' in context:
-            self.logger.info(
-                f"Loading prices using historical EOD API for exchange: {context['exchange']}"
-            )
             symbols = [
                 record['Code']
                 for record in self.load_symbols(exchange=context["exchange"])
             ]
+
+            if self.is_bulk_incremental and not self.is_initial_load(context):
+                # Only the symbols loaded up to the bookmark are up to date
+                # with the exchange, the others need a longer date range or
+                # their full history, as well as the ones with splits or
+                # dividends
+                bookmark = self.get_starting_replication_key_value(context)
+                last_record_dates = self.get_context_state(context).get(
+                    'last_record_dates', {})
+                adjusted_symbols = self.get_adjusted_symbols(
+                    context['exchange']) or set()
+                bulk_symbols = {
+                    symbol
+                    for symbol in symbols
+                    if last_record_dates.get(symbol, '') >= bookmark
+                    and symbol not in adjusted_symbols
+                }
+
+                self.logger.info(
+                    "Loading prices using bulk last day API for exchange: "
+                    f"{context['exchange']}")
+                try:
+                    yield from self.get_records_partial(bulk_symbols, context)
+                    symbols = [
+                        symbol for symbol in symbols
+                        if symbol not in bulk_symbols
+                    ]
+                except (requests.exceptions.RequestException,
+                        RetriableAPIError, FatalAPIError) as e:
+                    # The symbols continue from the last bar loaded in bulk
+                    self.logger.warning(
+                        "Failed to load bulk last day prices of exchange "
+                        f"{context['exchange']}, loading its symbols one by "
+                        f"one: '{str(e)}'")
+
+            self.logger.info(
+                "Loading prices using historical EOD API for exchange: "
+                f"{context['exchange']}")
         else:
             self.logger.info(
-                f"Loading prices using historical EOD API for symbol: {context['symbol']}"
-            )
+                "Loading prices using historical EOD API for symbol: "
+                f"{context['symbol']}")
             symbols = [context['symbol']]
 
         yield from self.get_records_all(symbols, context)
 
-        del context["api"], context["object"], context["first_record"]
+        for key in ["api", "object", "first_record"]:
+            context.pop(key, None)
 
     def loading_dates(self, from_date) -> List[str]:
         to_date = datetime.now()
@@ -339,12 +638,14 @@ class EODPrices(AbstractExchangeStream):
 
 class DailyFundamentals(AbstractExchangeStream):
     """
-    Incremental Fundamentals stream is based on Fundamentals Bulk API, which doesn't currently include
-    all needed data comparing to the full Fundamentals API. For example, `AnalystRatings` is not
-    provided as a part of the bulk version of API.
+    Incremental Fundamentals stream is based on Fundamentals Bulk API, which
+    doesn't currently include all needed data comparing to the full
+    Fundamentals API. For example, `AnalystRatings` is not provided as a part
+    of the bulk version of API.
 
 
-    This is a significant limitation, therefore, this stream is disable for now.
+    This is a significant limitation, therefore, this stream is disable for
+    now.
     """
 
     name = "fundamentals_daily"
@@ -0,0 +1,194 @@
+"""Caches of exchange symbol lists and of the symbols with events."""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from tap_eodhistoricaldata.files import write_json_atomic
+
+DEFAULT_SYMBOLS_CACHE_TTL = 24 * 60 * 60
+DEFAULT_SYMBOLS_FETCH_CONCURRENCY = 4
+
+ExchangeSymbolsLoader = Callable[[str], List[dict]]
+# Loads the symbols with events on a date
+EventSymbolsLoader = Callable[[str], List[str]]
+
+
+class ExchangeSymbolsCache:
+    """Keeps exchange symbol lists for the whole tap invocation and, if
+    `directory` is set, in files reused by later invocations for `ttl`
+    seconds.
+
+    Exchanges missing in the cache are loaded concurrently, each of them at
+    most once, with up to `concurrency` threads.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 directory: Optional[str] = None,
+                 ttl: float = DEFAULT_SYMBOLS_CACHE_TTL,
+                 concurrency: int = DEFAULT_SYMBOLS_FETCH_CONCURRENCY):
+        self.logger = logger
+        self.directory = Path(directory) if directory else None
+        self.ttl = ttl
+        self.concurrency = max(1, concurrency)
+
+        self._symbols: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, exchanges: Iterable[str],
+            load: ExchangeSymbolsLoader) -> Dict[str, List[dict]]:
+        """Return symbol lists by exchange, calling `load(exchange)` for the
+        exchanges which are not cached."""
+        exchanges = list(dict.fromkeys(exchanges))
+
+        # The lock is held while loading so that concurrent callers wait for
+        # the lists being loaded instead of downloading them again
+        with self._lock:
+            misses = [
+                exchange for exchange in exchanges if
+                exchange not in self._symbols and not self._read_file(exchange)
+            ]
+
+            if len(misses) > 1 and self.concurrency > 1:
+                with ThreadPoolExecutor(
+                        max_workers=min(len(misses), self.concurrency),
+                        thread_name_prefix="exchange-symbols") as executor:
+                    loaded = list(executor.map(load, misses))
+            else:
+                loaded = [load(exchange) for exchange in misses]
+
+            for exchange, symbols in zip(misses, loaded):
+                self._symbols[exchange] = symbols
+                if symbols:
+                    self._write_file(exchange, symbols)
+                else:
+                    # Likely a failed download, which is not kept for later
+                    # invocations
+                    self.logger.warning(
+                        f"Loaded no symbols of exchange {exchange}")
+
+            return {
+                exchange: self._symbols[exchange]
+                for exchange in exchanges
+            }
+
+    def _file_path(self, exchange: str) -> Path:
+        return self.directory / f"{exchange}.json"
+
+    def _read_file(self, exchange: str) -> bool:
+        if self.directory is None:
+            return False
+
+        try:
+            with open(self._file_path(exchange)) as f:
+                data = json.load(f)
+            if time.time() - data["fetched_at"] > self.ttl:
+                return False
+            symbols = data["symbols"]
+            if not symbols:
+                return False
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(
+                f"Failed to read cached symbols of {exchange}: '{str(e)}'")
+            return False
+
+        self.logger.info(f"Using cached symbols of exchange {exchange}")
+        self._symbols[exchange] = symbols
+        return True
+
+    def _write_file(self, exchange: str, symbols: List[dict]) -> None:
+        if self.directory is None:
+            return
+
+        try:
+            write_json_atomic(self._file_path(exchange), {
+                "fetched_at": time.time(),
+                "symbols": symbols
+            })
+        except OSError as e:
+            self.logger.warning(
+                f"Failed to cache symbols of {exchange}: '{str(e)}'")
+
+
+class EventSymbolsCache:
+    """Keeps the symbols with events of a type, e.g. splits or dividends, on
+    each date in files of `directory`, if set, reused by later invocations.
+
+    The events of a past date don't change, so they are kept for as long as
+    the date is requested. The events of today are loaded on every call.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 directory: Optional[str] = None):
+        self.logger = logger
+        self.directory = Path(directory) if directory else None
+
+        self._lock = threading.Lock()
+
+    def get(self, exchange: str, event_type: str, dates: Iterable[str],
+            load: EventSymbolsLoader) -> Dict[str, List[str]]:
+        """Return the symbols with events by date, calling `load(date)` for
+        the dates which are not cached."""
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        with self._lock:
+            cached = self._read_file(exchange, event_type)
+            events = {}
+            for date in dates:
+                if date < today and date in cached:
+                    events[date] = cached[date]
+                else:
+                    events[date] = load(date)
+
+            # Dates no longer requested are dropped
+            past_events = {
+                date: symbols
+                for date, symbols in events.items() if date < today
+            }
+            if past_events != cached:
+                self._write_file(exchange, event_type, past_events)
+
+            return events
+
+    def _file_path(self, exchange: str, event_type: str) -> Path:
+        return self.directory / f"{exchange}.{event_type}.json"
+
+    def _read_file(self, exchange: str,
+                   event_type: str) -> Dict[str, List[str]]:
+        if self.directory is None:
+            return {}
+
+        try:
+            with open(self._file_path(exchange, event_type)) as f:
+                events = json.load(f)["events"]
+            if not isinstance(events, dict):
+                raise TypeError(f"unexpected events {events}")
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(
+                f"Failed to read cached {event_type} of {exchange}: '{str(e)}'"
+            )
+            return {}
+
+        return events
+
+    def _write_file(self, exchange: str, event_type: str,
+                    events: Dict[str, List[str]]) -> None:
+        if self.directory is None:
+            return
+
+        try:
+            write_json_atomic(self._file_path(exchange, event_type),
+                              {"events": events})
+        except OSError as e:
+            self.logger.warning(
+                f"Failed to cache {event_type} of {exchange}: '{str(e)}'")
@@ -1,10 +1,22 @@
 """eodhistoricaldata tap class."""
+from functools import cached_property
 from typing import List, Tuple
 
+import requests
+
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
 from singer_sdk.exceptions import ConfigValidationError
 
+from tap_eodhistoricaldata.client import create_requests_session
+from tap_eodhistoricaldata.messages import RecordWriter
+from tap_eodhistoricaldata.metrics import DEFAULT_FLUSH_INTERVAL, DatadogMetricsEmitter
+from tap_eodhistoricaldata.splits import (SplitAssigner, SymbolCostRecorder,
+                                          create_split_assigner)
+from tap_eodhistoricaldata.symbols import (DEFAULT_SYMBOLS_FETCH_CONCURRENCY,
+                                           DEFAULT_SYMBOLS_CACHE_TTL,
+                                           EventSymbolsCache,
+                                           ExchangeSymbolsCache)
 from tap_eodhistoricaldata.streams import (EODPrices, Fundamentals,
                                            HistoricalDividends, Options)
 
@@ -39,10 +51,142 @@ class Tapeodhistoricaldata(Tap):
         th.Property("split_num",
                     th.StringType,
                     required=False,
-                    description="Total number of tap splits")).to_dict()
+                    description="Total number of tap splits"),
+        th.Property(
+            "split_mode",
+            th.StringType,
+            required=False,
+            description=
+            "`modulo` (default), `jump` - consistent hashing, which moves few symbols between splits when `split_num` changes, or `cost` - assignment by `split_plan_file`"
+        ),
+        th.Property(
+            "split_plan_file",
+            th.StringType,
+            required=False,
+            description=
+            "Split plan built from the symbol costs by `python -m tap_eodhistoricaldata.splits`"
+        ),
+        th.Property(
+            "split_costs_dir",
+            th.StringType,
+            required=False,
+            description=
+            "Directory to save the measured loading time of each symbol to"),
+        th.Property("http_pool_size",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of kept-alive HTTP connections"),
+        th.Property("request_timeout",
+                    th.IntegerType,
+                    required=False,
+                    description="HTTP request timeout in seconds"),
+        th.Property("rate_limit",
+                    th.NumberType,
+                    required=False,
+                    description="Max number of requests per second to each "
+                    "API host"),
+        th.Property("rate_limit_burst",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of requests to send at once "
+                    "within the rate limit"),
+        th.Property(
+            "metrics_flush_interval",
+            th.NumberType,
+            required=False,
+            description="Interval in seconds between Datadog metrics flushes"),
+        th.Property(
+            "symbols_cache_dir",
+            th.StringType,
+            required=False,
+            description="Directory to keep exchange symbol lists and symbols "
+            "with splits or dividends between runs"),
+        th.Property(
+            "symbols_cache_ttl",
+            th.IntegerType,
+            required=False,
+            description="Time in seconds to reuse cached exchange symbol lists"
+        ),
+        th.Property(
+            "symbols_fetch_concurrency",
+            th.IntegerType,
+            required=False,
+            description="Max number of concurrent symbol list requests"),
+        th.Property(
+            "bulk_incremental",
+            th.BooleanType,
+            required=False,
+            description=
+            "Partition prices by exchange and load them with one bulk last day request per day once the exchange is loaded"
+        ),
+        th.Property(
+            "adjustment_events_days",
+            th.IntegerType,
+            required=False,
+            description=
+            "Number of days of split and dividend events to load per exchange, prices are reloaded in full only for the symbols with events instead of checking the first price of every symbol"
+        ),
+        th.Property(
+            "fundamentals_max_age_days",
+            th.IntegerType,
+            required=False,
+            description=
+            "Load fundamentals only if their `UpdatedAt` changed or they were loaded more than this number of days ago"
+        )).to_dict()
 
     parse_env_config = True
 
+    @cached_property
+    def requests_session(self) -> requests.Session:
+        return create_requests_session(self.config)
+
+    @cached_property
+    def metrics_emitter(self) -> DatadogMetricsEmitter:
+        flush_interval = float(
+            self.config.get("metrics_flush_interval", DEFAULT_FLUSH_INTERVAL))
+        return DatadogMetricsEmitter(self.logger,
+                                     flush_interval=flush_interval)
+
+    @cached_property
+    def exchange_symbols_cache(self) -> ExchangeSymbolsCache:
+        return ExchangeSymbolsCache(
+            self.logger,
+            directory=self.config.get("symbols_cache_dir"),
+            ttl=int(
+                self.config.get("symbols_cache_ttl",
+                                DEFAULT_SYMBOLS_CACHE_TTL)),
+            concurrency=int(
+                self.config.get("symbols_fetch_concurrency",
+                                DEFAULT_SYMBOLS_FETCH_CONCURRENCY)))
+
+    @cached_property
+    def event_symbols_cache(self) -> EventSymbolsCache:
+        return EventSymbolsCache(
+            self.logger, directory=self.config.get("symbols_cache_dir"))
+
+    @cached_property
+    def split_assigner(self) -> SplitAssigner:
+        return create_split_assigner(self.config)
+
+    @cached_property
+    def symbol_costs(self) -> SymbolCostRecorder:
+        return SymbolCostRecorder(self.logger,
+                                  directory=self.config.get("split_costs_dir"),
+                                  split_id=int(self.config.get("split_id", 0)))
+
+    @cached_property
+    def record_writer(self) -> RecordWriter:
+        return RecordWriter()
+
+    def sync_all(self) -> None:
+        try:
+            super().sync_all()
+        finally:
+            self.record_writer.flush()
+            self.split_assigner.log_report(self.logger)
+            self.symbol_costs.save()
+            self.metrics_emitter.close()
+
     def discover_streams(self) -> List[Stream]:
         # """Return a list of discovered streams."""
         return [stream_class(tap=self) for stream_class in STREAM_TYPES]
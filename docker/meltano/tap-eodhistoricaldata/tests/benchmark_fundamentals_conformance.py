@@ -0,0 +1,85 @@
+"""Measures CPU time per eod_fundamentals record of the schema conformance
+and of the whole RECORD message writing, using the fundamentals payloads
+recorded in the test cassettes.
+
+Usage: python benchmark_fundamentals_conformance.py [iterations]
+"""
+
+import contextlib
+import gzip
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import yaml
+from singer_sdk.helpers._typing import conform_record_data_types
+
+from tap_eodhistoricaldata.messages import compile_conformance
+from tap_eodhistoricaldata.tap import Tapeodhistoricaldata
+
+CASSETTE_PATH = Path(__file__).parent / "cassettes/tap/tap-core.yaml"
+
+
+def load_fundamentals(stream):
+    cassette = yaml.safe_load(CASSETTE_PATH.read_text())
+    records = []
+    for interaction in cassette["interactions"]:
+        if "/api/fundamentals/" not in interaction["request"]["uri"]:
+            continue
+
+        body = interaction["response"]["body"]["string"]
+        if isinstance(body, bytes):
+            body = gzip.decompress(body)
+        row = json.loads(body)
+        if not isinstance(row, dict) or "General" not in row:
+            continue
+
+        code = interaction["request"]["uri"].split("/")[-1].split("?")[0]
+        records.append(stream.post_process(row, {"Code": code}))
+    return records
+
+
+def measure(name, records, iterations, func, flush=None):
+    started_at = time.process_time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            for _ in range(iterations):
+                for record in records:
+                    func(record)
+            if flush:
+                flush()
+    elapsed = time.process_time() - started_at
+    count = len(records) * iterations
+    print(f"{name}: {elapsed / count * 1e6:,.1f} us/record")
+
+
+def main(iterations):
+    tap = Tapeodhistoricaldata(config={
+        "api_token": "fake_token",
+        "symbols": ["AAPL"]
+    })
+    stream = tap.streams["eod_fundamentals"]
+    records = load_fundamentals(stream)
+    print(f"{len(records)} recorded fundamentals records, "
+          f"{sum(len(json.dumps(r)) for r in records) // len(records):,} "
+          "bytes each on average")
+
+    measure(
+        "conform_record_data_types", records,
+        iterations, lambda record: conform_record_data_types(
+            stream.name, record, stream.schema, stream.logger))
+
+    started_at = time.process_time()
+    conform = compile_conformance(stream.name, stream.schema, stream.logger)
+    print(f"compile_conformance cache lookup: "
+          f"{(time.process_time() - started_at) * 1e6:,.1f} us")
+    measure("compiled conformance", records, iterations, conform)
+
+    measure("RecordWriter", records, iterations, stream._write_record_message,
+            tap.record_writer.flush)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
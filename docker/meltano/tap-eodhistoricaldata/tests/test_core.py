@@ -1,20 +1,33 @@
 """Tests standard tap features using the built-in SDK tests library."""
 
 import copy
+import json
 import re
+from unittest import mock
+
+import pytest
+import requests
 import vcr
 from vcr.record_mode import RecordMode
+import freezegun
 from freezegun import freeze_time
+from singer_sdk.exceptions import RetriableAPIError
 from singer_sdk.plugin_base import JSONSchemaValidator
 from singer_sdk.testing import get_standard_tap_tests
+from tap_eodhistoricaldata.streams import DailyFundamentals
 from tap_eodhistoricaldata.tap import Tapeodhistoricaldata
 
+# The recorded rate limit headers make requests wait on the real clock
+freezegun.configure(extend_ignore_list=["tap_eodhistoricaldata.ratelimit"])
+
 # RECORD_MODE = RecordMode.NEW_EPISODES
 RECORD_MODE = RecordMode.NONE
 EXCHANGES_CONFIG = {
     "api_token": "fake_token",
     "exchanges": ["NASDAQ", "NYSE", "INDX", "CC"],
-    "exchange_symbols_limit": 1
+    "exchange_symbols_limit": 1,
+    # vcr playback is not thread-safe
+    "symbols_fetch_concurrency": 1
 }
 
 EXCHANGES_STATE = {
@@ -174,6 +187,25 @@ def test_tap_symbols_config():
     tap.sync_all()
 
 
+def test_exchange_partitions_of_symbols_on_several_exchanges():
+    tap = Tapeodhistoricaldata(config=EXCHANGES_CONFIG)
+    symbols = [{
+        "Code": code,
+        "Type": "Common Stock",
+        "Exchange": exchange
+    } for code, exchange in [("AAPL", "NASDAQ"), ("MSFT",
+                                                  "NASDAQ"), ("AAPL", "NYSE")]]
+
+    # Only the prices are loaded once per symbol, the partitions of the other
+    # exchange streams are kept as they are
+    for stream, codes in [(tap.streams["eod_historical_prices"],
+                           ["AAPL", "MSFT"]),
+                          (DailyFundamentals(tap), ["AAPL", "MSFT", "AAPL"])]:
+        with mock.patch.object(stream, "load_symbols", return_value=symbols):
+            assert [partition["symbol"]
+                    for partition in stream.partitions] == codes
+
+
 @freeze_time("2021-12-01")
 @vcr.use_cassette("cassettes/tap/tap-core.yaml",
                   record_mode=RECORD_MODE,
@@ -217,3 +249,468 @@ def _validate_schema(context, schema_file, stream_name):
 
         validator = JSONSchemaValidator(schema)
         validator.validate(records[0])
+
+
+@freeze_time("2021-12-01")
+def test_tap_prices_bulk_incremental():
+    config = {**EXCHANGES_CONFIG, "bulk_incremental": True}
+    first_records = {
+        symbol: {
+            "date": "1980-12-12",
+            "adjusted_close": 0.1
+        }
+        for symbol in ["AAPL", "IBM"]
+    }
+    state = {
+        "bookmarks": {
+            "eod_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "exchange": "NASDAQ"
+                    },
+                    "replication_key": "date",
+                    "replication_key_value": "2021-11-29",
+                    "first_records": first_records,
+                    "last_record_dates": {
+                        "AAPL": "2021-11-29",
+                        "IBM": "2021-11-20"
+                    }
+                }]
+            }
+        }
+    }
+
+    requested = []
+    failing_dates = []
+
+    def request_records(context):
+        requested.append(
+            (context["api"], context["object"], context.get("date"),
+             context.get("date_from"), context.get("date_to")))
+        if context["api"] == "eod-bulk-last-day":
+            if context["date"] in failing_dates:
+                raise RetriableAPIError("Server error")
+            return [{
+                "code": code,
+                "date": context["date"],
+                "adjusted_close": 1.0
+            } for code in ["AAPL", "GOOGL", "IBM"]]
+        if "date_to" in context:
+            return [first_records[context["object"]]]
+        return [{"date": "2021-11-30", "adjusted_close": 1.0}]
+
+    def create_stream():
+        tap = Tapeodhistoricaldata(config=config, state=copy.deepcopy(state))
+        prices_stream = tap.streams["eod_historical_prices"]
+        prices_stream.load_symbols = lambda exchange=None: [{
+            "Code": symbol
+        } for symbol in ["AAPL", "IBM", "MSFT"]]
+        prices_stream.request_records = request_records
+        return prices_stream
+
+    prices_stream = create_stream()
+    partitions = prices_stream.partitions
+    assert ["NASDAQ", "NYSE", "INDX",
+            "CC"] == [partition["exchange"] for partition in partitions]
+
+    nasdaq = partitions[0]
+    prices_stream._write_starting_replication_value(nasdaq)
+    records = list(prices_stream.get_records(nasdaq))
+
+    assert [
+        # One bulk request per day since the bookmark
+        ("eod-bulk-last-day", "NASDAQ", "2021-11-29", None, None),
+        ("eod-bulk-last-day", "NASDAQ", "2021-11-30", None, None),
+        ("eod-bulk-last-day", "NASDAQ", "2021-12-01", None, None),
+        # The bars since the last stored one for the symbol behind the
+        # bookmark
+        ("eod", "IBM", None, None, "1980-12-12"),
+        ("eod", "IBM", None, "2021-11-20", None),
+        # Full history for the symbol never loaded
+        ("eod", "MSFT", None, None, None),
+    ] == requested
+    assert ["AAPL", "AAPL", "AAPL", "IBM",
+            "MSFT"] == [record["Code"] for record in records]
+    assert "1980-12-12" == records[0]["first_date"]
+    assert {"exchange": "NASDAQ"} == nasdaq
+
+    partition_state = prices_stream.get_context_state(nasdaq)
+    assert {
+        "AAPL": "2021-12-01",
+        "IBM": "2021-11-30",
+        "MSFT": "2021-11-30"
+    } == partition_state["last_record_dates"]
+
+    # Exchanges without a bookmark are loaded symbol by symbol
+    requested.clear()
+    prices_stream._write_starting_replication_value(partitions[1])
+    list(prices_stream.get_records(partitions[1]))
+    assert [("eod", symbol, None, None, None)
+            for symbol in ["AAPL", "IBM", "MSFT"]] == requested
+
+    # A failed bulk request falls back to loading the symbols one by one,
+    # continuing from the bars already loaded in bulk
+    prices_stream = create_stream()
+    failing_dates.append("2021-11-30")
+    requested.clear()
+
+    nasdaq = prices_stream.partitions[0]
+    prices_stream._write_starting_replication_value(nasdaq)
+    records = list(prices_stream.get_records(nasdaq))
+
+    assert [
+        ("eod-bulk-last-day", "NASDAQ", "2021-11-29", None, None),
+        ("eod-bulk-last-day", "NASDAQ", "2021-11-30", None, None),
+        ("eod", "AAPL", None, None, "1980-12-12"),
+        ("eod", "AAPL", None, "2021-11-29", None),
+        ("eod", "IBM", None, None, "1980-12-12"),
+        ("eod", "IBM", None, "2021-11-20", None),
+        ("eod", "MSFT", None, None, None),
+    ] == requested
+    assert ["AAPL", "AAPL", "IBM",
+            "MSFT"] == [record["Code"] for record in records]
+    assert {"exchange": "NASDAQ"} == nasdaq
+
+
+@freeze_time("2021-12-01")
+def test_tap_prices_date_window():
+    state = {
+        "bookmarks": {
+            "eod_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "symbol": "AAPL"
+                    },
+                    "replication_key": "date",
+                    "replication_key_value": "2021-11-29",
+                    "first_records": {
+                        "AAPL": {
+                            "date": "1980-12-12",
+                            "adjusted_close": 0.1
+                        }
+                    },
+                    "last_record_dates": {
+                        "AAPL": "2021-11-29"
+                    }
+                }]
+            }
+        }
+    }
+    tap = Tapeodhistoricaldata(config=SYMBOLS_CONFIG, state=state)
+    prices_stream = tap.streams["eod_historical_prices"]
+
+    history = [{
+        "date": "1980-12-12",
+        "adjusted_close": 0.1
+    }, {
+        "date": "2021-11-29",
+        "adjusted_close": 1.0
+    }, {
+        "date": "2021-11-30",
+        "adjusted_close": 1.0
+    }]
+    requested = []
+
+    def request_records(context):
+        params = prices_stream.get_url_params(context, None)
+        requested.append((params.get("from"), params.get("to")))
+        return [
+            record for record in history
+            if params.get("from", "") <= record["date"] <= params.get(
+                "to", "9999")
+        ]
+
+    prices_stream.request_records = request_records
+
+    context = next(partition for partition in prices_stream.partitions
+                   if partition["symbol"] == "AAPL")
+    records = list(prices_stream.get_records(context))
+
+    # The first record is checked, then the bars since the last stored one
+    assert [(None, "1980-12-12"), ("2021-11-29", None)] == requested
+    assert ["2021-11-29",
+            "2021-11-30"] == [record["date"] for record in records]
+    assert all(record["first_date"] == "1980-12-12" for record in records)
+    assert {"symbol": "AAPL"} == context
+
+    # Adjusted prices are reloaded in full
+    history[0]["adjusted_close"] = 0.025
+    requested.clear()
+    records = list(prices_stream.get_records(context))
+
+    assert [(None, "1980-12-12"), (None, None)] == requested
+    assert 3 == len(records)
+    assert 0.025 == prices_stream.get_context_state(
+        context)["first_records"]["AAPL"]["adjusted_close"]
+
+    # Sub-cent adjustments are detected as well
+    history[0]["adjusted_close"] = 0.0249
+    requested.clear()
+    assert 3 == len(list(prices_stream.get_records(context)))
+    assert [(None, "1980-12-12"), (None, None)] == requested
+
+    # Unchanged up to the float precision
+    history[0]["adjusted_close"] = 0.0249 * (1 + 1e-9)
+    requested.clear()
+    assert 1 == len(list(prices_stream.get_records(context)))
+    assert [(None, "1980-12-12"), ("2021-11-30", None)] == requested
+
+
+@freeze_time("2021-12-01")
+def test_tap_prices_adjustment_events():
+    config = {**EXCHANGES_CONFIG, "adjustment_events_days": 5}
+    symbols = ["AAPL", "GOOGL", "MSFT", "IBM"]
+    first_records = {
+        symbol: {
+            "date": "2000-01-03",
+            "adjusted_close": 1.0
+        }
+        for symbol in symbols
+    }
+    state = {
+        "bookmarks": {
+            "eod_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "symbol": symbol
+                    },
+                    "first_records": first_records,
+                    "last_record_dates": {
+                        "AAPL": "2021-11-29",
+                        "GOOGL": "2021-11-29",
+                        "MSFT": "2021-11-29",
+                        "IBM": "2021-10-01"
+                    }
+                } for symbol in symbols]
+            }
+        }
+    }
+    tap = Tapeodhistoricaldata(config=config, state=state)
+    prices_stream = tap.streams["eod_historical_prices"]
+
+    exchange_symbols = {"NASDAQ": ["AAPL", "GOOGL", "MSFT"], "NYSE": ["IBM"]}
+    prices_stream.load_symbols = lambda exchange=None: [{
+        "Code": symbol
+    } for symbol in exchange_symbols.get(exchange, [])]
+
+    event_requests = []
+    nasdaq_events = {"splits": ["AAPL"], "dividends": ["MSFT"]}
+
+    def load_event_symbols(exchange, dates, event_type):
+        event_requests.append((exchange, event_type, dates[0], dates[-1]))
+        return nasdaq_events[event_type] if exchange == "NASDAQ" else []
+
+    prices_stream.load_event_symbols = load_event_symbols
+
+    requested = []
+
+    def request_records(context):
+        params = prices_stream.get_url_params(context, None)
+        requested.append(
+            (context["object"], params.get("from"), params.get("to")))
+        return [{"date": "2000-01-03", "adjusted_close": 1.0}]
+
+    prices_stream.request_records = request_records
+
+    for symbol in symbols:
+        context = prices_stream.get_context_state({"symbol":
+                                                   symbol})["context"]
+        list(prices_stream.get_records(context))
+
+    # Events are loaded once per exchange
+    assert [
+        ("NASDAQ", "splits", "2021-11-26", "2021-12-01"),
+        ("NASDAQ", "dividends", "2021-11-26", "2021-12-01"),
+    ] == event_requests
+    assert [
+        # Adjusted prices of the split and the dividend symbols are
+        # reloaded in full
+        ("AAPL", None, None),
+        # No events since the last stored price
+        ("GOOGL", "2021-11-29", None),
+        ("MSFT", None, None),
+        # Last stored price is older than the events
+        ("IBM", None, "2000-01-03"),
+        ("IBM", "2021-10-01", None),
+    ] == requested
+
+
+@freeze_time("2021-12-01")
+def test_tap_event_symbols_are_cached(tmp_path):
+    config = {**EXCHANGES_CONFIG, "symbols_cache_dir": str(tmp_path)}
+    dates = ["2021-11-29", "2021-11-30", "2021-12-01"]
+    requested = []
+
+    def load_date_event_symbols(exchange, date, event_type):
+        requested.append((exchange, date, event_type))
+        return ["BTC-USD", "ETH-USD"] if date == "2021-11-30" else []
+
+    # Each run of the tap requests only the events of today again
+    for _ in range(2):
+        tap = Tapeodhistoricaldata(config=config)
+        prices_stream = tap.streams["eod_historical_prices"]
+        prices_stream.load_date_event_symbols = load_date_event_symbols
+        assert ["BTC-USD.CC", "ETH-USD.CC"] == sorted(
+            prices_stream.load_event_symbols("CC", dates, "splits"))
+
+    assert [("CC", date, "splits")
+            for date in dates] + [("CC", "2021-12-01", "splits")] == requested
+
+
+@freeze_time("2021-12-01")
+def test_tap_options_delta():
+    tap = Tapeodhistoricaldata(config=SYMBOLS_CONFIG)
+    options_stream = tap.streams["eod_options"]
+    context = options_stream.get_context_state({
+        "Code": "AAPL",
+        "Type": "Common Stock",
+        "Exchange": "NASDAQ"
+    })["context"]
+
+    chains = [{
+        "expirationDate": f"2021-12-{day:02d}",
+        "options": {
+            "CALL": [{
+                "strike": 150.0,
+                "lastPrice": float(day)
+            }]
+        }
+    } for day in range(10, 20)]
+    failing_after = {"count": None}
+
+    def request_records(context):
+        for i, chain in enumerate(chains):
+            if i == failing_after["count"]:
+                raise requests.exceptions.ChunkedEncodingError("Broken")
+            yield copy.deepcopy(chain)
+
+    def emitted_dates():
+        return [
+            chain["expirationDate"]
+            for chain in options_stream.get_records(context)
+        ]
+
+    def fingerprints():
+        return options_stream.get_context_state(context)["fingerprints"]
+
+    options_stream.request_records = request_records
+
+    assert [chain["expirationDate"] for chain in chains] == emitted_dates()
+    assert 10 == len(fingerprints())
+
+    # Unchanged chains are not emitted again
+    assert [] == emitted_dates()
+
+    chains[0]["options"]["CALL"][0]["lastPrice"] = 1.0
+    assert ["2021-12-10"] == emitted_dates()
+
+    # A failed response keeps the fingerprints of the chains not received
+    stored = dict(fingerprints())
+    chains[1]["options"]["CALL"][0]["lastPrice"] = 1.0
+    chains[5]["options"]["CALL"][0]["lastPrice"] = 1.0
+    failing_after["count"] = 3
+    assert ["2021-12-11"] == emitted_dates()
+    assert stored.keys() == fingerprints().keys()
+    assert stored["2021-12-11"] != fingerprints()["2021-12-11"]
+    failing_after["count"] = 0
+    assert [] == emitted_dates()
+    assert 10 == len(fingerprints())
+
+    failing_after["count"] = None
+    assert ["2021-12-15"] == emitted_dates()
+
+    # Expired chains are skipped and forgotten, also when the response fails
+    with freeze_time("2021-12-12"):
+        assert [] == emitted_dates()
+        assert 8 == len(fingerprints())
+        failing_after["count"] = 0
+    with freeze_time("2021-12-14"):
+        assert [] == emitted_dates()
+        assert 6 == len(fingerprints())
+
+
+@freeze_time("2021-12-01")
+def test_tap_fundamentals_updated_at():
+    config = {**SYMBOLS_CONFIG, "fundamentals_max_age_days": 7}
+    tap = Tapeodhistoricaldata(config=config)
+    fundamentals_stream = tap.streams["eod_fundamentals"]
+    context = fundamentals_stream.partitions[0]
+
+    updated_at = {"value": "2021-11-30"}
+    requested = []
+
+    def request_records(context):
+        requested.append("full")
+        return [{"General": {"UpdatedAt": updated_at["value"]}}]
+
+    def load_updated_at(symbol):
+        requested.append("updated_at")
+        return updated_at["value"]
+
+    fundamentals_stream.request_records = request_records
+    fundamentals_stream.load_updated_at = load_updated_at
+
+    assert 1 == len(list(fundamentals_stream.get_records(context)))
+    state = fundamentals_stream.get_context_state(context)
+    assert "2021-11-30" == state["updated_at"]
+    assert "2021-12-01" == state["loaded_at"]
+
+    # Unchanged fundamentals are not loaded
+    assert [] == list(fundamentals_stream.get_records(context))
+
+    updated_at["value"] = "2021-12-01"
+    assert 1 == len(list(fundamentals_stream.get_records(context)))
+    assert ["full", "updated_at", "updated_at", "full"] == requested
+
+    # Fundamentals loaded too long ago are loaded without the check
+    requested.clear()
+    with freeze_time("2021-12-09"):
+        assert 1 == len(list(fundamentals_stream.get_records(context)))
+    assert ["full"] == requested
+
+
+def _response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode("UTF-8")
+    return response
+
+
+def test_exchange_symbols_status_is_checked():
+    tap = Tapeodhistoricaldata(config=EXCHANGES_CONFIG)
+    stream = tap.streams["eod_fundamentals"]
+
+    # An error is not cached as an empty symbol list
+    with mock.patch.object(stream.requests_session, "get",
+                           lambda *args, **kwargs: _response(500, [])):
+        with pytest.raises(requests.HTTPError):
+            stream.load_exchange_symbols("NYSE")
+
+
+@freeze_time("2021-12-01")
+def test_tap_fundamentals_updated_at_retries():
+    config = {**SYMBOLS_CONFIG, "fundamentals_max_age_days": 7}
+    tap = Tapeodhistoricaldata(config=config)
+    fundamentals_stream = tap.streams["eod_fundamentals"]
+    context = fundamentals_stream.partitions[0]
+    state = {"updated_at": "2021-11-30", "loaded_at": "2021-11-30"}
+
+    responses = []
+
+    def get(url, params, timeout):
+        return responses.pop(0)
+
+    # Rate limited checks are retried instead of loading the fundamentals
+    responses[:] = [
+        _response(429, {}),
+        _response(503, {}),
+        _response(200, "2021-11-30")
+    ]
+    with mock.patch.object(fundamentals_stream.requests_session, "get",
+                           get), mock.patch("backoff._sync.time.sleep"):
+        assert fundamentals_stream.is_unchanged(context, state)
+        assert [] == responses
+
+        responses[:] = [_response(404, {}), _response(200, "2021-11-30")]
+        assert not fundamentals_stream.is_unchanged(context, state)
+        assert 1 == len(responses)
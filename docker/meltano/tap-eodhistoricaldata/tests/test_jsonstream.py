@@ -0,0 +1,104 @@
+"""Tests incremental JSON array parsing."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from tap_eodhistoricaldata import jsonstream
+from tap_eodhistoricaldata.jsonstream import iter_json_array, iter_json_member_array
+
+DOCUMENT = json.dumps([{
+    "code": "AAPL",
+    "name": "Apple Inc – é",
+    "close": 144.44
+}, 12345, "a, ]", [], None, True, -1.5e3],
+                      ensure_ascii=False).encode("utf-8")
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1024])
+def test_iter_json_array(size):
+    assert list(iter_json_array(chunked(DOCUMENT,
+                                        size))) == json.loads(DOCUMENT)
+
+
+def test_iter_json_array_yields_elements_before_the_end():
+    elements = iter_json_array(iter([b'[{"code": "A"}, ', b'{"code"']))
+    assert next(elements) == {"code": "A"}
+    with pytest.raises(json.JSONDecodeError):
+        next(elements)
+
+
+def test_iter_json_array_large_elements():
+    element = {
+        "options": [{
+            "strike": i,
+            "contractName": f"AAPL{i:08d}"
+        } for i in range(100000)]
+    }
+    document = json.dumps([element, element]).encode("utf-8")
+    assert len(document) > 8 * 1024 * 1024
+
+    decoder = jsonstream._decoder
+    with mock.patch.object(decoder, "raw_decode",
+                           wraps=decoder.raw_decode) as raw_decode:
+        assert list(iter_json_array(chunked(document,
+                                            64 * 1024))) == [element, element]
+
+    # Instead of once per chunk the elements are decoded again only when the
+    # unparsed text is doubled
+    assert raw_decode.call_count < 20
+
+
+def test_iter_json_array_other_values():
+    assert list(iter_json_array([b" [ ] "])) == []
+    assert list(iter_json_array([b'{"error": ', b'"Not found"}'])) == [{
+        "error":
+        "Not found"
+    }]
+
+    for document in [b"", b"[1,]", b"[1 2]", b"[1"]:
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array([document]))
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 64])
+def test_iter_json_member_array(size):
+    document = json.dumps({
+        "code":
+        "AAPL",
+        "meta": {
+            "data": [0]
+        },
+        "data": [{
+            "expirationDate": "2021-12-03",
+            "options": {
+                "CALL": [{
+                    "strike": 1.5e2
+                }]
+            }
+        }, {
+            "expirationDate": "2021-12-10"
+        }],
+        "lastTradePrice":
+        -1.5e3
+    }).encode("utf-8")
+    assert list(iter_json_member_array(chunked(document, size),
+                                       "data")) == json.loads(document)["data"]
+
+
+def test_iter_json_member_array_other_values():
+    assert list(iter_json_member_array([b'{"data": []}'], "data")) == []
+    assert list(iter_json_member_array([b'{"code": "A"}'], "data")) == []
+    assert list(iter_json_member_array([b'{"data": null}'], "data")) == []
+    assert list(iter_json_member_array([b'[1, 2]'], "data")) == []
+
+    for document in [
+            b"", b'{"data": [1]', b'{"data" [1]}', b'{"data": [1] 2}'
+    ]:
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_member_array([document], "data"))
@@ -0,0 +1,109 @@
+"""Tests Datadog metrics batching against a local stand-in API endpoint."""
+
+import json
+import logging
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from tap_eodhistoricaldata.metrics import DatadogMetricsEmitter
+
+
+class _DatadogHandler(BaseHTTPRequestHandler):
+    payloads = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "deflate":
+            body = zlib.decompress(body)
+        self.payloads.append((self.path, json.loads(body)))
+
+        self.send_response(202)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server():
+    _DatadogHandler.payloads = []
+    server = HTTPServer(("127.0.0.1", 0), _DatadogHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_counters_are_aggregated_and_sent_in_one_batch():
+    server = _start_server()
+
+    try:
+        emitter = DatadogMetricsEmitter(
+            logging.getLogger("test"),
+            flush_interval=3600,
+            api_key="fake_key",
+            api_host=f"http://127.0.0.1:{server.server_port}")
+
+        for i in range(100):
+            emitter.increment("data.tap.test.record_count", 1, ["stream:test"])
+        emitter.increment("data.tap.test.record_count", 5, ["stream:other"])
+        emitter.close()
+    finally:
+        server.shutdown()
+
+    assert len(_DatadogHandler.payloads) == 1
+    path, payload = _DatadogHandler.payloads[0]
+    assert path.startswith("/api/v1/series")
+
+    values = {
+        tuple(series["tags"]): series["points"][0][1]
+        for series in payload["series"]
+    }
+    assert values == {("stream:test", ): 100, ("stream:other", ): 5}
+
+
+def test_gauges_send_the_last_value_once():
+    server = _start_server()
+
+    try:
+        emitter = DatadogMetricsEmitter(
+            logging.getLogger("test"),
+            flush_interval=3600,
+            api_key="fake_key",
+            api_host=f"http://127.0.0.1:{server.server_port}")
+
+        for i in range(3):
+            emitter.gauge("data.tap.test.queue_size", i, ["stream:test"])
+        emitter.flush()
+        # Not recorded since the previous flush
+        emitter.flush()
+        emitter.close()
+    finally:
+        server.shutdown()
+
+    assert len(_DatadogHandler.payloads) == 1
+    _, payload = _DatadogHandler.payloads[0]
+    assert [(series["type"], series["tags"], series["points"][0][1])
+            for series in payload["series"]] == [("gauge", ["stream:test"], 2)]
+
+
+def test_series_limit():
+    emitter = DatadogMetricsEmitter(logging.getLogger("test"), max_series=2)
+    for i in range(10):
+        emitter.increment("data.tap.test.record_count", 1, [f"symbol:{i}"])
+
+    assert len(emitter._counters) == 2
+    assert emitter._dropped_count == 8
+
+
+def test_close_unregisters_the_exit_hook():
+    emitter = DatadogMetricsEmitter(logging.getLogger("test"),
+                                    flush_interval=3600)
+    with mock.patch("tap_eodhistoricaldata.metrics.atexit") as atexit:
+        emitter.gauge("data.tap.test.queue_size", 1, ["stream:test"])
+        atexit.register.assert_called_once_with(emitter.close)
+
+        with mock.patch.object(emitter, "flush"):
+            emitter.close()
+        atexit.unregister.assert_called_once_with(emitter.close)
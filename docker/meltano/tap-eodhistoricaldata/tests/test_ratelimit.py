@@ -0,0 +1,90 @@
+"""Tests client-side rate limiting."""
+
+import time
+
+import requests
+
+from tap_eodhistoricaldata.ratelimit import RateLimiter, TokenBucket
+
+
+def _response(status_code=200, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+class _Clock:
+    """Time which passes only while sleeping. The tests use rates of powers
+    of two, so that the waits add up exactly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_rate():
+    clock = _Clock()
+    bucket = TokenBucket(rate=64, burst=4, clock=clock, sleep=clock.sleep)
+
+    for _ in range(20):
+        bucket.acquire()
+
+    # The burst is spent at once, the rest is spread at the rate
+    assert clock.sleeps == [1 / 64] * 16
+    assert clock.now == 0.25
+
+
+def test_buckets_are_per_host():
+    clock = _Clock()
+    limiter = RateLimiter(rate=8, clock=clock, sleep=clock.sleep)
+    url = "https://eodhistoricaldata.com/api/eod/AAPL.US"
+
+    assert limiter.bucket("eodhistoricaldata.com") is limiter.bucket(
+        "eodhistoricaldata.com")
+    assert limiter.bucket("eodhistoricaldata.com") is not limiter.bucket(
+        "other.host")
+
+    limiter.update(url, _response(429, {"Retry-After": "0.5"}))
+    assert limiter.bucket("eodhistoricaldata.com").rate == 4
+
+    limiter.acquire("https://other.host/")
+    assert clock.now == 0
+    # The pause is waited out, then the emptied bucket is refilled at the
+    # decreased rate
+    limiter.acquire(url)
+    assert clock.sleeps == [0.5, 0.25]
+
+
+def test_rate_adapts_to_quota_headers():
+    limiter = RateLimiter(rate=100)
+    url = "https://eodhistoricaldata.com/api/eod/AAPL.US"
+
+    limiter.update(
+        url,
+        _response(headers={
+            "X-RateLimit-Remaining": "30",
+            "X-RateLimit-Reset": "10",
+        }))
+    assert limiter.bucket("eodhistoricaldata.com").rate == 3
+
+    # The configured rate is never exceeded
+    limiter.update(
+        url,
+        _response(
+            headers={
+                "X-RateLimit-Remaining": "30000",
+                "X-RateLimit-Reset": str(time.time() + 10),
+            }))
+    assert limiter.bucket("eodhistoricaldata.com").rate == 100
+
+    unlimited = RateLimiter()
+    unlimited.update(url, _response(headers={"X-RateLimit-Remaining": "120"}))
+    assert unlimited.bucket("eodhistoricaldata.com").rate == 2
@@ -0,0 +1,88 @@
+"""Tests assignment of the exchange symbols to tap splits."""
+
+import hashlib
+import json
+from unittest import mock
+
+import pytest
+from singer_sdk.exceptions import ConfigValidationError
+
+from tap_eodhistoricaldata.splits import SplitAssigner
+from tap_eodhistoricaldata.tap import Tapeodhistoricaldata
+
+CONFIG = {"api_token": "fake_token", "exchanges": ["NYSE", "CC"]}
+EXCHANGE_SYMBOLS = {
+    "NYSE": [{
+        "Code": f"S{i}",
+        "Type": "Common Stock",
+        "Exchange": "NYSE"
+    } for i in range(50)],
+    "CC": [{
+        "Code": f"C{i}-USD",
+        "Type": "Currency",
+        "Exchange": "CC"
+    } for i in range(50)],
+}
+CODES = sorted([f"S{i}"
+                for i in range(50)] + [f"C{i}-USD.CC" for i in range(50)])
+
+
+def _load_symbols(config):
+    tap = Tapeodhistoricaldata(config=config)
+    stream = tap.streams["eod_fundamentals"]
+    with mock.patch.object(stream, "load_exchange_symbols",
+                           EXCHANGE_SYMBOLS.get):
+        return [record["Code"] for record in stream.load_symbols()]
+
+
+def test_symbols_are_split_by_code():
+    splits = [
+        _load_symbols({
+            **CONFIG, "split_num": "3",
+            "split_id": str(split_id)
+        }) for split_id in range(3)
+    ]
+    assert sorted(sum(splits, [])) == CODES
+    assert all(codes == sorted(codes) for codes in splits)
+
+    # The splits keep the assignment of the symbols with the exchange postfix
+    for split_id, codes in enumerate(splits):
+        assert all(
+            int(hashlib.md5(code.encode("UTF-8")).hexdigest(), 16) %
+            3 == split_id for code in codes)
+
+
+def test_jump_mode():
+    config = {**CONFIG, "split_num": "3", "split_mode": "jump"}
+    assigner = SplitAssigner(split_num=3, split_id=1, mode="jump")
+    assert _load_symbols({**config, "split_id": "1"}) == assigner.filter(CODES)
+
+
+def test_cost_mode(tmp_path):
+    plan_file = tmp_path / "plan.json"
+    plan_file.write_text(
+        json.dumps({
+            "split_num": 2,
+            "splits": {
+                "S1": 0,
+                "C1-USD.CC": 1,
+                "S2": 1
+            }
+        }))
+    config = {
+        **CONFIG, "split_num": "2",
+        "split_id": "1",
+        "split_mode": "cost",
+        "split_plan_file": str(plan_file)
+    }
+    codes = _load_symbols(config)
+    assert "C1-USD.CC" in codes and "S2" in codes
+    assert "S1" not in codes
+    # Symbols missing from the plan are hashed
+    jump = SplitAssigner(split_num=2, split_id=1, mode="jump")
+    planned = {"S1", "C1-USD.CC", "S2"}
+    assert [code for code in codes if code not in planned
+            ] == jump.filter(code for code in CODES if code not in planned)
+
+    with pytest.raises(ConfigValidationError, match="is required"):
+        _load_symbols({**config, "split_plan_file": None})
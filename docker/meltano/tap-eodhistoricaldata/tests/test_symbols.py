@@ -0,0 +1,121 @@
+"""Tests exchange symbol lists and event symbols caching."""
+
+import json
+import logging
+import threading
+import time
+
+from freezegun import freeze_time
+
+from tap_eodhistoricaldata.symbols import EventSymbolsCache, ExchangeSymbolsCache
+
+
+class _Loader:
+
+    def __init__(self, empty_exchanges=()):
+        self.calls = []
+        self.threads = set()
+        self.empty_exchanges = empty_exchanges
+
+    def __call__(self, exchange):
+        self.calls.append(exchange)
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        if exchange in self.empty_exchanges:
+            return []
+        return [{"Code": f"{exchange}1", "Type": "Common Stock"}]
+
+
+def test_exchanges_are_loaded_concurrently_once():
+    cache = ExchangeSymbolsCache(logging.getLogger("test"), concurrency=4)
+    loader = _Loader()
+
+    symbols = cache.get(["NASDAQ", "NYSE", "NASDAQ"], loader)
+    assert symbols["NYSE"] == [{"Code": "NYSE1", "Type": "Common Stock"}]
+    assert sorted(loader.calls) == ["NASDAQ", "NYSE"]
+    assert len(loader.threads) == 2
+
+    cache.get(["NYSE", "CC"], loader)
+    assert sorted(loader.calls) == ["CC", "NASDAQ", "NYSE"]
+
+
+def test_file_store(tmp_path):
+    logger = logging.getLogger("test")
+    loader = _Loader()
+
+    ExchangeSymbolsCache(logger, directory=str(tmp_path)).get(["NYSE", "CC"],
+                                                              loader)
+    assert sorted(p.name
+                  for p in tmp_path.iterdir()) == ["CC.json", "NYSE.json"]
+
+    symbols = ExchangeSymbolsCache(logger,
+                                   directory=str(tmp_path)).get(["NYSE", "CC"],
+                                                                loader)
+    assert len(loader.calls) == 2
+    assert symbols["CC"] == [{"Code": "CC1", "Type": "Common Stock"}]
+
+    # Expired and broken files are loaded again
+    data = json.loads((tmp_path / "NYSE.json").read_text())
+    data["fetched_at"] -= 3600
+    (tmp_path / "NYSE.json").write_text(json.dumps(data))
+    (tmp_path / "CC.json").write_text("{")
+
+    ExchangeSymbolsCache(logger, directory=str(tmp_path),
+                         ttl=60).get(["NYSE", "CC"], loader)
+    assert sorted(loader.calls[2:]) == ["CC", "NYSE"]
+
+
+def test_empty_lists_are_not_stored(tmp_path):
+    logger = logging.getLogger("test")
+    loader = _Loader(empty_exchanges=["CC"])
+
+    cache = ExchangeSymbolsCache(logger, directory=str(tmp_path))
+    assert cache.get(["NYSE", "CC"], loader)["CC"] == []
+    assert [p.name for p in tmp_path.iterdir()] == ["NYSE.json"]
+
+    # The empty list is loaded again by the next invocation only
+    cache.get(["CC"], loader)
+    assert sorted(loader.calls) == ["CC", "NYSE"]
+    ExchangeSymbolsCache(logger, directory=str(tmp_path)).get(["NYSE", "CC"],
+                                                              loader)
+    assert sorted(loader.calls) == ["CC", "CC", "NYSE"]
+
+
+def test_past_event_dates_are_stored(tmp_path):
+    logger = logging.getLogger("test")
+    calls = []
+
+    def load(date):
+        calls.append(date)
+        return [f"S{date[-2:]}"]
+
+    dates = ["2021-11-29", "2021-11-30", "2021-12-01"]
+    with freeze_time("2021-12-01"):
+        events = EventSymbolsCache(logger, directory=str(tmp_path)).get(
+            "NYSE", "splits", dates, load)
+        assert events == {date: [f"S{date[-2:]}"] for date in dates}
+        assert [p.name for p in tmp_path.iterdir()] == ["NYSE.splits.json"]
+
+        # The events of today may still change
+        EventSymbolsCache(logger,
+                          directory=str(tmp_path)).get("NYSE", "splits", dates,
+                                                       load)
+        assert calls == dates + ["2021-12-01"]
+
+    with freeze_time("2021-12-02"):
+        events = EventSymbolsCache(logger, directory=str(tmp_path)).get(
+            "NYSE", "splits", dates[1:] + ["2021-12-02"], load)
+        assert list(events) == dates[1:] + ["2021-12-02"]
+        assert calls[4:] == ["2021-12-01", "2021-12-02"]
+
+    # Dates no longer requested are dropped
+    data = json.loads((tmp_path / "NYSE.splits.json").read_text())
+    assert list(data["events"]) == ["2021-11-30", "2021-12-01"]
+
+    # Broken files are loaded again
+    (tmp_path / "NYSE.splits.json").write_text("{")
+    with freeze_time("2021-12-02"):
+        EventSymbolsCache(logger,
+                          directory=str(tmp_path)).get("NYSE", "splits",
+                                                       ["2021-12-01"], load)
+    assert calls[6:] == ["2021-12-01"]
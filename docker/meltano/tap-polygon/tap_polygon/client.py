@@ -1,16 +1,41 @@
 """REST client handling, including polygonStream base class."""
 import os
-import hashlib
 from pathlib import Path
 from typing import Any, Dict, Optional, List, Callable
 
 import backoff
-import datadog.api
 import requests
 from singer_sdk.streams import RESTStream
 from singer_sdk.exceptions import RetriableAPIError
 
+from tap_polygon.ratelimit import RateLimitedAdapter, RateLimiter
+
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 300
+DEFAULT_RATE_LIMIT_BURST = 1
+
+
+def create_requests_session(config: dict) -> requests.Session:
+    """Create a keep-alive session shared by all the streams of the tap. All
+    the requests of the session go through one rate limiter."""
+    # Each prefetch worker holds a connection
+    pool_size = max(DEFAULT_HTTP_POOL_SIZE,
+                    int(config.get("fetch_concurrency", 1)))
+    pool_size = int(config.get("http_pool_size", pool_size))
+    rate_limit = config.get("rate_limit")
+    rate_limiter = RateLimiter(rate=float(rate_limit) if rate_limit else None,
+                               burst=float(
+                                   config.get("rate_limit_burst",
+                                              DEFAULT_RATE_LIMIT_BURST)))
+    adapter = RateLimitedAdapter(rate_limiter,
+                                 pool_connections=pool_size,
+                                 pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class PolygonStream(RESTStream):
@@ -18,6 +43,15 @@ class PolygonStream(RESTStream):
 
     url_base = "https://api.polygon.io"
 
+    @property
+    def requests_session(self) -> requests.Session:
+        # All the streams of the tap share one pooled keep-alive session
+        return self._tap.requests_session
+
+    @property
+    def timeout(self) -> int:
+        return int(self.config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT))
+
     def request_decorator(self, func: Callable) -> Callable:
         decorator: Callable = backoff.on_exception(
             backoff.expo,
@@ -42,11 +76,17 @@ class PolygonStream(RESTStream):
     def split_id(self):
         return int(self.config.get("split_id", 0))
 
-    def is_within_split(self, symbol) -> int:
-        split_num = int(self.config.get("split_num", 1))
-        # Use built-in `hashlib` to get consistent hash value
-        symbol_hash = int(hashlib.md5(symbol.encode("UTF-8")).hexdigest(), 16)
-        return symbol_hash % split_num == self.split_id
+    def is_within_split(self, symbol) -> bool:
+        return self._tap.split_assigner.is_within_split(symbol)
+
+    def _write_schema_message(self) -> None:
+        # Buffered records must reach the target before any other message
+        self._tap.record_writer.flush()
+        super()._write_schema_message()
+
+    def _write_state_message(self) -> None:
+        self._tap.record_writer.flush()
+        super()._write_state_message()
 
     def _write_metric_log(self, metric: dict,
                           extra_tags: Optional[dict]) -> None:
@@ -56,8 +96,6 @@ class PolygonStream(RESTStream):
     def _send_to_datadog(self, metric, types, add_env=True):
         try:
             if metric["type"] in types:
-                datadog.initialize()
-
                 tag_list = []
                 if "tags" in metric:
                     tag_list += [
@@ -67,11 +105,9 @@ class PolygonStream(RESTStream):
                 if add_env and "ENV" in os.environ:
                     tag_list.append(f"env:{os.environ['ENV']}")
 
-                datadog.api.Metric.send(
-                    metric=f"data.tap.{self.name}.{metric['metric']}",
-                    type="count",
-                    points=metric["value"],
-                    tags=tag_list)
+                self._tap.metrics_emitter.increment(
+                    f"data.tap.{self.name}.{metric['metric']}",
+                    metric["value"], tag_list)
             else:
                 self.logger.debug(f"Skipping metric: {metric['metric']}")
 
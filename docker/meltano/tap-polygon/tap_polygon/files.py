@@ -0,0 +1,26 @@
+"""Files kept between the tap invocations."""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Union
+
+
+def write_json_atomic(path: Union[str, Path], data: Any) -> None:
+    """Write the data to the JSON file through a temporary file, which then
+    replaces the file, so that readers never see a partially written file.
+    The directory of the file is created if it doesn't exist."""
+    path = Path(path)
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,59 @@
+"""Conversion between timestamps and US market dates.
+
+The US Eastern daylight saving rules are fixed here instead of reading the
+`America/New_York` zone, which needs `zoneinfo` and a tz database. The rules
+cover all the dates since 1976, earlier than any date loaded by the tap.
+"""
+import datetime
+from typing import Tuple
+
+EPOCH = datetime.datetime(1970, 1, 1)
+STANDARD_OFFSET = datetime.timedelta(hours=-5)
+DAYLIGHT_SAVING = datetime.timedelta(hours=1)
+
+
+def _sunday(year: int, month: int, n: int) -> datetime.date:
+    # The n-th Sunday of the month, the last one for -1
+    if n > 0:
+        day = datetime.date(year, month, 1)
+        day += datetime.timedelta(days=(6 - day.weekday()) % 7 + 7 * (n - 1))
+    else:
+        day = datetime.date(year + month // 12, month % 12 + 1, 1)
+        day -= datetime.timedelta(days=day.weekday() + 1)
+    return day
+
+
+def daylight_saving_days(year: int) -> Tuple[datetime.date, datetime.date]:
+    """Return the days when the daylight saving time starts and ends. The
+    clocks change at 2 AM of the local time on both days."""
+    if year >= 2007:
+        return _sunday(year, 3, 2), _sunday(year, 11, 1)
+    if year >= 1987:
+        return _sunday(year, 4, 1), _sunday(year, 10, -1)
+    return _sunday(year, 4, -1), _sunday(year, 10, -1)
+
+
+def market_date(t: int) -> str:
+    """Return the market date of the millisecond timestamp."""
+    standard_time = EPOCH + datetime.timedelta(
+        milliseconds=t) + STANDARD_OFFSET
+    start, end = daylight_saving_days(standard_time.year)
+    # From 2 AM of the standard time to 2 AM of the daylight saving time
+    if datetime.datetime.combine(start, datetime.time(2)) <= standard_time:
+        if standard_time < datetime.datetime.combine(end, datetime.time(1)):
+            standard_time += DAYLIGHT_SAVING
+    return standard_time.date().isoformat()
+
+
+def market_day_start(date: str) -> int:
+    """Return the millisecond timestamp of the start of the market date."""
+    day = datetime.date.fromisoformat(date)
+    start, end = daylight_saving_days(day.year)
+    offset = STANDARD_OFFSET
+    # The day starts before the clocks change
+    if start < day <= end:
+        offset += DAYLIGHT_SAVING
+
+    midnight = datetime.datetime.combine(day, datetime.time(),
+                                         datetime.timezone(offset))
+    return int(midnight.timestamp() * 1000)
@@ -0,0 +1,109 @@
+"""Buffered writing of singer RECORD messages."""
+import decimal
+import json
+import logging
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from singer.utils import strftime
+from singer_sdk.helpers._typing import (conform_record_data_types,
+                                        is_boolean_type,
+                                        _warn_unmapped_property)
+from singer_sdk.helpers._util import utc_now
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Values of these types are emitted as is, unless the property is boolean
+PASSTHROUGH_TYPES = frozenset([str, int, float, dict, list, type(None)])
+
+
+def _default(obj: Any) -> Any:
+    # singer writes Decimal values with simplejson `use_decimal=True`
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"),
+                            check_circular=False,
+                            default=_default)
+dumps = _encoder.encode
+
+
+def compile_conformance(stream_name: str, schema: dict,
+                        logger: logging.Logger) -> Callable[[dict], dict]:
+    """Return a function equivalent to `conform_record_data_types` for the
+    schema, which looks the schema up once instead of for every record."""
+    properties = schema.get("properties", {})
+    known_properties = frozenset(properties)
+    boolean_properties = frozenset(
+        name for name, property_schema in properties.items()
+        if is_boolean_type(property_schema))
+
+    def conform(row: dict) -> dict:
+        record: Dict[str, Any] = {}
+        for name, value in row.items():
+            if name not in known_properties:
+                _warn_unmapped_property(stream_name, name, logger)
+                continue
+
+            is_plain = type(value) in PASSTHROUGH_TYPES
+            if is_plain and name not in boolean_properties:
+                record[name] = value
+            else:
+                record[name] = conform_record_data_types(
+                    stream_name, {name: value}, schema, logger)[name]
+        return record
+
+    return conform
+
+
+class RecordWriter:
+    """Serializes RECORD messages into an in-memory buffer, which is written
+    to stdout once it reaches `buffer_size` characters or is older than
+    `flush_interval` seconds.
+
+    Any other message must be written only after `flush()`, so that the
+    target receives the messages in order.
+    """
+
+    def __init__(self,
+                 output: Optional[TextIO] = None,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.output = output
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self._buffer: List[str] = []
+        self._buffered_size = 0
+        self._flushed_at = time.monotonic()
+
+    def write_record(self, stream_name: str, record: dict) -> None:
+        line = dumps({
+            "type": "RECORD",
+            "stream": stream_name,
+            "record": record,
+            "time_extracted": strftime(utc_now()),
+        })
+        self._buffer.append(line)
+        self._buffer.append("\n")
+        self._buffered_size += len(line) + 1
+
+        if self._buffered_size >= self.buffer_size or time.monotonic(
+        ) - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+
+        # sys.stdout is resolved on every flush the same way singer does it
+        output = self.output or sys.stdout
+        output.write("".join(self._buffer))
+        output.flush()
+        self._buffer = []
+        self._buffered_size = 0
@@ -0,0 +1,65 @@
+"""Bounded look-ahead loading of stream partitions."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+PartitionLoader = Callable[[], Any]
+
+
+class PartitionPrefetcher:
+    """Loads the next `concurrency` partitions in a thread pool while the
+    current one is being emitted.
+
+    `prepare` is called in the caller's thread with the partition context and
+    must return a callable without arguments, which performs the network calls
+    in a worker thread. This way all the reads from the stream state happen in
+    the main thread and workers never touch shared state.
+
+    Results are always handed out in the partitions order, so the records of
+    a partition are emitted exactly as in the sequential mode.
+    """
+
+    def __init__(self, partitions: List[dict],
+                 prepare: Callable[[dict], PartitionLoader], concurrency: int):
+        self.partitions = partitions
+        self.prepare = prepare
+        self.concurrency = concurrency
+
+        self._positions = {
+            id(partition): position
+            for position, partition in enumerate(partitions)
+        }
+        self._futures: Dict[int, Future] = {}
+        self._next_position = 0
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def load(self, context: dict) -> Any:
+        position = self._positions.get(id(context))
+        if position is None:
+            # Not one of the stream partitions - nothing to prefetch
+            return self.prepare(context)()
+
+        for stale_position in [i for i in self._futures if i < position]:
+            self._futures.pop(stale_position).cancel()
+
+        self._next_position = max(self._next_position, position)
+        self._submit_until(position + self.concurrency)
+
+        future = self._futures.pop(position, None)
+        if future is None:
+            return self.prepare(context)()
+
+        return future.result()
+
+    def shutdown(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+        self._executor.shutdown(wait=False)
+
+    def _submit_until(self, limit: int):
+        limit = min(limit, len(self.partitions))
+        while self._next_position < limit:
+            context = self.partitions[self._next_position]
+            self._futures[self._next_position] = self._executor.submit(
+                self.prepare(context))
+            self._next_position += 1
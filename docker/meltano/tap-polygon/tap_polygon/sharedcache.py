@@ -0,0 +1,61 @@
+"""Values loaded once and shared by the partitions which need them."""
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+
+class SharedCache:
+    """Loads each key once for all the partitions, which may be loaded
+    concurrently.
+
+    Partitions acquire the keys they may need before any of them is loaded
+    and release the keys once loaded. A value is kept only until the last
+    partition which acquired its key releases it, so memory holds only the
+    values of the partitions still to be loaded.
+
+    Concurrent gets of a key wait for a single load, while different keys
+    are loaded in parallel. A failed load is shared the same way, so the key
+    is not loaded again by every partition. Keys which are not acquired are
+    loaded on every get.
+    """
+
+    def __init__(self, load: Callable[[Hashable], Any]):
+        self.load = load
+
+        self._lock = threading.Lock()
+        self._references: Counter = Counter()
+        self._futures: Dict[Hashable, Future] = {}
+
+    def acquire(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            self._references.update(keys)
+
+    def release(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self._references[key] -= 1
+                if self._references[key] <= 0:
+                    del self._references[key]
+                    self._futures.pop(key, None)
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            is_loader = future is None
+            if is_loader:
+                future = Future()
+                if self._references[key] > 0:
+                    self._futures[key] = future
+
+        if is_loader:
+            try:
+                future.set_result(self.load(key))
+            except Exception as e:
+                future.set_exception(e)
+
+        return future.result()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._futures)
@@ -1,19 +1,21 @@
 """Stream type classes for tap-polygon."""
 from abc import ABC, abstractmethod
+from collections import Counter
 import datetime
 from functools import cached_property, reduce
 from pathlib import Path
-from typing import Any, Dict, Optional, Iterable, List
+from typing import Any, Callable, Dict, Optional, Iterable, Iterator, List, Tuple
 import json
 import re
+import time
 
 import requests
-import singer
-from singer import RecordMessage
-from singer_sdk.helpers._typing import conform_record_data_types
-from singer_sdk.helpers._util import utc_now
 
 from tap_polygon.client import PolygonStream
+from tap_polygon.markettime import market_date, market_day_start
+from tap_polygon.messages import compile_conformance
+from tap_polygon.prefetch import PartitionPrefetcher
+from tap_polygon.sharedcache import SharedCache
 
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 
@@ -26,25 +28,19 @@ class AbstractPolygonStream(PolygonStream, ABC):
         'X-Polygon-Edge-IP-Address': '0.0.0.0'
     }
 
+    @cached_property
+    def conform_record(self) -> Callable[[dict], dict]:
+        return compile_conformance(self.name, self.schema, self.logger)
+
     def _write_record_message(self, record: dict) -> None:
         """Write out a RECORD message."""
-        record = conform_record_data_types(
-            stream_name=self.name,
-            row=record,
-            schema=self.schema,
-            logger=self.logger,
-        )
+        record = self.conform_record(record)
         for stream_map in self.stream_maps:
             mapped_record = stream_map.transform(record)
             # Emit record if not filtered
             if mapped_record is not None:
-                record_message = RecordMessage(
-                    stream=stream_map.stream_alias,
-                    record=mapped_record,
-                    version=None,
-                    time_extracted=utc_now(),
-                )
-                singer.write_message(record_message)
+                self._tap.record_writer.write_record(stream_map.stream_alias,
+                                                     mapped_record)
 
 
 class MarketStatusUpcoming(AbstractPolygonStream):
@@ -112,16 +108,18 @@ class AbstractHistoricalPricesStream(AbstractPolygonStream, ABC):
         pass
 
     @cached_property
-    def partitions(self) -> Iterable[Dict[str, Any]]:
+    def partitions(self) -> List[Dict[str, Any]]:
         symbols_state = self.get_symbols_state()
         symbols = self.get_symbols()
         symbols = list(sorted(set(symbols)))
         self.logger.info('Loading symbols %s' % (json.dumps(symbols)))
+        partitions = []
         for symbol in symbols:
             if symbol in symbols_state:
-                yield symbols_state[symbol]['context']
+                partitions.append(symbols_state[symbol]['context'])
             else:
-                yield {"symbol": symbol}
+                partitions.append({"symbol": symbol})
+        return partitions
 
     def get_symbols_state(self) -> Dict[str, str]:
         state_partitions = super().partitions or []
@@ -138,10 +136,24 @@ class AbstractHistoricalPricesStream(AbstractPolygonStream, ABC):
         else:
             headers = {**self.http_headers, **headers}
 
-        res = requests.get(url=url, params=params, headers=headers)
+        res = self.requests_session.get(url=url,
+                                        params=params,
+                                        headers=headers,
+                                        timeout=self.timeout)
         self._write_request_duration_log(url, res, None, None)
         return res.json()
 
+    def load_tickers_page(self, params: Dict[str, Any],
+                          next_url: Optional[str]) -> dict:
+        if next_url:
+            url = next_url
+            params = {}
+        else:
+            url = self.url_base + "/v3/reference/tickers"
+
+        params = {**params, "apiKey": self.config['api_key']}
+        return self.request_decorator(self.fetch)(url, params)
+
     def load_first_record(self, context) -> Dict[str, Any]:
         url = self.get_url(context)
         params = self.get_url_params(context, None)
@@ -149,38 +161,148 @@ class AbstractHistoricalPricesStream(AbstractPolygonStream, ABC):
         if data and 'results' in data and data['results']:
             return data['results'][0]
 
+    @property
+    def fetch_concurrency(self) -> int:
+        return int(self.config.get("fetch_concurrency", 1))
+
+    @cached_property
+    def partition_prefetcher(self) -> Optional[PartitionPrefetcher]:
+        if self.fetch_concurrency <= 1:
+            return None
+
+        return PartitionPrefetcher(self.partitions, self.prefetch_partition,
+                                   self.fetch_concurrency)
+
+    def sync(self, context: Optional[dict] = None) -> None:
+        try:
+            super().sync(context)
+        finally:
+            # Cancel the outstanding partitions, a new prefetcher is created by
+            # the next sync
+            prefetcher = self.__dict__.pop('partition_prefetcher', None)
+            if prefetcher is not None:
+                prefetcher.shutdown()
+
+    def prefetch_partition(self, context: dict) -> Callable[[], Tuple]:
+        load = self.prepare_partition(context)
+
+        def load_records() -> Tuple:
+            # Prefetched records are loaded by the worker, not while emitted
+            is_incremental, context, records = load()
+            return is_incremental, context, list(records)
+
+        return load_records
+
+    def prepare_partition(self, context: dict) -> Callable[[], Tuple]:
+        # Read the partition state in the calling thread, the returned loader
+        # may be executed in a prefetch worker
+        state = self.get_context_state(context)
+        first_record = state.get('first_record')
+        if first_record is not None:
+            first_record = first_record.copy()
+        context = context.copy()
+        check_first_record = self.prepare_first_record_check(
+            context, first_record)
+
+        return lambda: self.load_partition(context, first_record,
+                                           check_first_record)
+
+    def prepare_first_record_check(
+            self, context: dict,
+            first_record: Optional[dict]) -> Callable[[], bool]:
+        """Return the check whether the stored first record is unchanged,
+        executed by the partition loader."""
+        return lambda: self.is_first_record_unchanged(context, first_record)
+
+    def is_first_record_unchanged(self, context: dict,
+                                  first_record: dict) -> bool:
+        first_record_context = {
+            **context,
+            **{
+                "date_from": first_record['t'],
+                "date_to": first_record['t'],
+            }
+        }
+        loaded_first_record = self.request_decorator(
+            self.load_first_record)(first_record_context)
+        return bool(loaded_first_record) and loaded_first_record[
+            't'] == first_record['t'] and abs(loaded_first_record['c'] -
+                                              first_record['c']) < 1e-6
+
+    def load_partition(
+            self,
+            context: dict,
+            first_record: Optional[dict],
+            check_first_record: Optional[Callable[[], bool]] = None) -> Tuple:
+        started = time.monotonic()
+        is_incremental = False
+        if first_record is not None:
+            if self.config.get("realtime"):
+                is_incremental = True
+            elif check_first_record is not None:
+                is_incremental = check_first_record()
+            else:
+                is_incremental = self.is_first_record_unchanged(
+                    context, first_record)
+
+        if is_incremental:
+            context['date_from'] = first_record['date_to']
+
+        if 'date_from' not in context:
+            context['date_from'] = self.default_date_from
+        if 'date_to' not in context:
+            context['date_to'] = self.default_date_to
+
+        records = self.load_records(context, is_incremental)
+        return is_incremental, context, self.record_cost(
+            context, records,
+            time.monotonic() - started)
+
+    def record_cost(self, context: dict, records: Iterable[dict],
+                    elapsed: float) -> Iterator[dict]:
+        """Yield the records and record the cost of the partition once all
+        of them are loaded. Only the time spent loading the records counts,
+        not the time spent emitting them."""
+        records = iter(records)
+        records_count = 0
+        while True:
+            started = time.monotonic()
+            try:
+                record = next(records)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.monotonic() - started
+            records_count += 1
+            yield record
+
+        self._tap.symbol_costs.record(
+            self.name,
+            context.get("contract_name") or context.get("symbol"), elapsed,
+            records_count)
+
+    def load_records(self, context: dict,
+                     is_incremental: bool) -> Iterable[Dict[str, Any]]:
+        # Records are streamed unless prefetched
+        return self.request_records(context)
+
     def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        if context is None:
+            return
+
         try:
             state = self.get_context_state(context)
-
-            is_incremental = False
             symbol = context.get("contract_name") or context.get("symbol")
-            if 'first_record' in state:
-                if self.config.get("realtime"):
-                    is_incremental = True
-                else:
-                    first_record_context = {
-                        **context,
-                        **{
-                            "date_from": state['first_record']['t'],
-                            "date_to": state['first_record']['t'],
-                        }
-                    }
-                    first_record = self.request_decorator(
-                        self.load_first_record)(first_record_context)
-                    if first_record and first_record['t'] == state[
-                            'first_record']['t'] and abs(
-                                first_record['c'] -
-                                state['first_record']['c']) < 1e-6:
-                        is_incremental = True
-
-            if is_incremental:
-                context['date_from'] = state['first_record']['date_to']
-
-            if 'date_from' not in context:
-                context['date_from'] = self.default_date_from
-            if 'date_to' not in context:
-                context['date_to'] = self.default_date_to
+
+            if self.partition_prefetcher:
+                is_incremental, request_context, records = self.partition_prefetcher.load(
+                    context)
+            else:
+                is_incremental, request_context, records = self.prepare_partition(
+                    context)()
+
+            context['date_from'] = request_context['date_from']
+            context['date_to'] = request_context['date_to']
 
             self.logger.info('Symbol context %s %s' %
                              (symbol, json.dumps(context)))
@@ -188,11 +310,15 @@ class AbstractHistoricalPricesStream(AbstractPolygonStream, ABC):
             if is_incremental and 'first_record' in state:
                 # if incremental update - update the date_to in the first_record
                 state['first_record']['date_to'] = context['date_to']
-                yield from super().get_records(context)
+                for record in records:
+                    transformed_record = self.post_process(record, context)
+                    if transformed_record is None:
+                        continue
+                    yield transformed_record
             else:
                 # if full update - extract first record, otherwise it's preserved
                 first_record_saved = False
-                for record in self.request_records(context):
+                for record in records:
                     if not first_record_saved:
                         state['first_record'] = record.copy()
                         state['first_record']['date_to'] = context['date_to']
@@ -225,6 +351,10 @@ class StocksHistoricalPrices(AbstractHistoricalPricesStream):
     primary_keys = ["symbol", "t"]
     schema_filepath = SCHEMAS_DIR / "stocks_historical_prices.json"
 
+    def __init__(self, tap, name=None, schema=None, path=None):
+        super().__init__(tap, name=name, schema=schema, path=path)
+        self._partition_grouped_dates: Dict[str, List[str]] = {}
+
     def get_symbols(self) -> Iterable[str]:
         stock_symbols = self.config.get("stock_symbols")
         if stock_symbols:
@@ -235,51 +365,201 @@ class StocksHistoricalPrices(AbstractHistoricalPricesStream):
 
             return
 
-        default_params = {
-            "active": "true",
-            "sort": "ticker",
-            "order": "asc",
-            "limit": 1000,
-            "apiKey": self.config['api_key'],
-        }
         exchanges = self.config.get("stock_exchanges")
         if exchanges:
-            params_list = [{
-                "exchange": exchange,
-                **default_params
-            } for exchange in exchanges]
+            universes = [{"exchange": exchange} for exchange in exchanges]
         else:
-            params_list = [{**default_params}]
-
-        for params in params_list:
-            next_url = None
-            page = 0
-            while page == 0 or next_url:
-                page += 1
-                if next_url:
-                    url = next_url
-                    params = {
-                        "apiKey": self.config['api_key'],
-                    }
-                else:
-                    url = self.url_base + "/v3/reference/tickers"
-
-                data = self.request_decorator(self.fetch)(url, params)
-
-                if not data or "status" not in data or data['status'] not in [
-                        "OK", "DELAYED"
-                ]:
-                    raise Exception('Error while requesting %s' % (url))
-
-                for record in data.get('results', []):
-                    symbol = record['ticker']
-                    if not symbol or not self.is_within_split(symbol):
-                        continue
-                    yield symbol
+            universes = [{}]
+
+        for symbol in self._tap.ticker_universe.get(universes,
+                                                    self.load_tickers_page):
+            if not symbol or not self.is_within_split(symbol):
+                continue
+            yield symbol
+
+    @property
+    def grouped_daily(self) -> bool:
+        return bool(self.config.get("grouped_daily"))
+
+    @property
+    def grouped_check_min_symbols(self) -> Optional[int]:
+        value = self.config.get("grouped_check_min_symbols")
+        return int(value) if value else None
+
+    @property
+    def grouped_history_from(self) -> str:
+        """The earliest date of the grouped daily bars, older dates are not
+        available with the plan."""
+        days = int(self.config.get("grouped_history_days", 730))
+        return (datetime.date.today() -
+                datetime.timedelta(days=days)).isoformat()
+
+    @cached_property
+    def first_record_dates(self) -> Counter:
+        """Number of the partitions by the market date of their first record
+        within the grouped daily history."""
+        history_from = self.grouped_history_from
+        dates = Counter()
+        for partition in self.partitions:
+            first_record = self.get_context_state(partition).get(
+                'first_record')
+            if first_record and 't' in first_record:
+                date = market_date(first_record['t'])
+                if date >= history_from:
+                    dates[date] += 1
+        return dates
+
+    @cached_property
+    def grouped_daily_bars(self) -> SharedCache:
+        """Grouped daily bars by date. The dates of all the partitions are
+        acquired before any partition is loaded, each partition releases its
+        dates once loaded, so only the dates still needed are kept."""
+        cache = SharedCache(self.fetch_grouped_daily)
+        for partition in self.partitions:
+            dates = self.get_grouped_dates(partition)
+            self._partition_grouped_dates[partition['symbol']] = dates
+            cache.acquire(dates)
+        return cache
+
+    def get_grouped_dates(self, context: dict) -> List[str]:
+        """Return the dates of the grouped daily bars the partition may load.
+        """
+        first_record = self.get_context_state(context).get('first_record')
+        if not first_record:
+            return []
 
-                next_url = data.get('next_url')
-                if not next_url:
-                    break
+        dates = []
+        if self.grouped_daily and 'date_to' in first_record:
+            dates += self.market_days(
+                first_record['date_to'],
+                context.get('date_to', self.default_date_to))
+        check_date = self.get_grouped_check_date(first_record)
+        if check_date is not None:
+            dates.append(check_date)
+        return dates
+
+    def get_grouped_check_date(self, first_record: dict) -> Optional[str]:
+        """Return the date of the grouped daily bars checking the first
+        record, None if the first record is checked on its own."""
+        if 't' not in first_record or not self.grouped_check_min_symbols:
+            return None
+
+        date = market_date(first_record['t'])
+        if self.first_record_dates[date] < self.grouped_check_min_symbols:
+            return None
+        return date
+
+    @staticmethod
+    def market_days(date_from: str, date_to: str) -> List[str]:
+        date_from = datetime.date.fromisoformat(str(date_from)[:10])
+        date_to = datetime.date.fromisoformat(str(date_to)[:10])
+        dates = []
+        while date_from <= date_to:
+            # Markets are closed on weekends
+            if date_from.weekday() < 5:
+                dates.append(date_from.isoformat())
+            date_from += datetime.timedelta(days=1)
+        return dates
+
+    def prepare_partition(self, context: dict) -> Callable[[], Tuple]:
+        if not self.grouped_daily and not self.grouped_check_min_symbols:
+            return super().prepare_partition(context)
+
+        grouped_daily_bars = self.grouped_daily_bars
+        dates = self._partition_grouped_dates.pop(context['symbol'], None)
+        if dates is None:
+            dates = self.get_grouped_dates(context)
+            grouped_daily_bars.acquire(dates)
+        load = super().prepare_partition(context)
+
+        def load_partition() -> Tuple:
+            # Grouped bars are read before the loader returns, only the
+            # records requested per symbol are streamed
+            try:
+                return load()
+            finally:
+                grouped_daily_bars.release(dates)
+
+        return load_partition
+
+    def prepare_first_record_check(
+            self, context: dict,
+            first_record: Optional[dict]) -> Callable[[], bool]:
+        check_first_record = super().prepare_first_record_check(
+            context, first_record)
+        if first_record is None:
+            return check_first_record
+
+        # Partition states are counted in the calling thread
+        date = self.get_grouped_check_date(first_record)
+        if date is None:
+            return check_first_record
+
+        def check_grouped_first_record() -> bool:
+            # Symbols sharing the first record date are checked with one
+            # grouped request, the symbols missing from it on their own
+            try:
+                bar = self.load_grouped_daily(date).get(context['symbol'])
+            except Exception as e:
+                self.logger.warning(
+                    'Grouped daily bars for %s failed to load: %s' %
+                    (date, str(e)))
+                bar = None
+
+            if bar is None:
+                return check_first_record()
+            return abs(bar['c'] - first_record['c']) < 1e-6
+
+        return check_grouped_first_record
+
+    def load_records(self, context: dict,
+                     is_incremental: bool) -> Iterable[Dict[str, Any]]:
+        if not is_incremental or not self.grouped_daily:
+            return super().load_records(context, is_incremental)
+
+        # Incremental updates contain a few days, which are loaded for all the
+        # symbols at once instead of requesting each symbol's range
+        records = []
+        for date in self.market_days(context['date_from'], context['date_to']):
+            bars = self.load_grouped_daily(date)
+            if context['symbol'] in bars:
+                records.append(bars[context['symbol']].copy())
+
+        return records
+
+    def load_grouped_daily(self, date: str) -> Dict[str, Dict[str, Any]]:
+        """Return the daily bars of the date by symbol. Each date is requested
+        once, the bars are shared by all the symbols' partitions, which may be
+        loaded concurrently."""
+        return self.grouped_daily_bars.get(date)
+
+    def fetch_grouped_daily(self, date: str) -> Dict[str, Dict[str, Any]]:
+        url = self.url_base + f"/v2/aggs/grouped/locale/us/market/stocks/{date}"
+        params = {
+            "adjusted": "true",
+            "apiKey": self.config['api_key'],
+        }
+        data = self.request_decorator(self.fetch)(url, params)
+
+        if not data or "status" not in data or data['status'] not in [
+                "OK", "DELAYED"
+        ]:
+            raise Exception('Error while requesting %s' % (url))
+
+        # Grouped bars are timestamped with the end of the trading day, while
+        # the symbols' ranges are timestamped with the start of the day
+        t = market_day_start(date)
+
+        symbols = set(partition['symbol'] for partition in self.partitions)
+        bars = {}
+        for record in data.get('results', []):
+            symbol = record.pop('T', None)
+            if symbol in symbols:
+                bars[symbol] = {**record, "t": t}
+
+        self.logger.info('Loaded grouped daily bars for %s: %d symbols' %
+                         (date, len(bars)))
+        return bars
 
 
 class OptionsHistoricalPrices(AbstractHistoricalPricesStream):
@@ -360,34 +640,14 @@ class RealtimePrices(AbstractHistoricalPricesStream):
             return
 
         # load all
-        params = {
-            "apiKey": self.config['api_key'],
-            "active": "true",
-            "sort": "ticker",
-            "order": "asc",
-            "limit": 1000,
-        }
-        for market in ['stocks', 'crypto']:
-            url = self.url_base + f"/v3/reference/tickers"
-            params["market"] = market
-            while url:
-                data = self.request_decorator(self.fetch)(url, params)
-
-                if not data or "status" not in data or data['status'] != "OK":
-                    self.logger.error('Error while requesting %s: %s' %
-                                      (url, json.dumps(data)))
-                else:
-                    for record in data.get('results', []):
-                        symbol = record['ticker']
-                        if not symbol or not self.is_within_split(symbol):
-                            continue
-
-                        yield symbol
-
-                if 'next_url' not in data:
-                    break
-
-                url = data['next_url']
+        universes = [{"market": market} for market in ['stocks', 'crypto']]
+        for symbol in self._tap.ticker_universe.get(universes,
+                                                    self.load_tickers_page,
+                                                    raise_errors=False):
+            if not symbol or not self.is_within_split(symbol):
+                continue
+
+            yield symbol
 
         option_contract_names = self.config.get("option_contract_names", [])
         for contract_name in option_contract_names:
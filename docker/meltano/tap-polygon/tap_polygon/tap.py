@@ -1,9 +1,20 @@
 """polygon tap class."""
+from functools import cached_property
 from typing import List, Tuple
 
+import requests
+
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
 
+from tap_polygon.client import create_requests_session
+from tap_polygon.messages import RecordWriter
+from tap_polygon.metrics import DEFAULT_FLUSH_INTERVAL, DatadogMetricsEmitter
+from tap_polygon.splits import (SplitAssigner, SymbolCostRecorder,
+                                create_split_assigner)
+from tap_polygon.tickers import (DEFAULT_TICKERS_CACHE_TTL,
+                                 DEFAULT_TICKERS_FETCH_CONCURRENCY,
+                                 TickerUniverseCache)
 from tap_polygon.streams import MarketStatusUpcoming, StockSplitsUpcoming, OptionsHistoricalPrices, CryptoHistoricalPrices, StocksHistoricalPrices, RealtimePrices
 
 STREAM_TYPES = [
@@ -54,10 +65,143 @@ class Tappolygon(Tap):
         th.Property("split_num",
                     th.StringType,
                     required=False,
-                    description="Total number of tap splits")).to_dict()
+                    description="Total number of tap splits"),
+        th.Property(
+            "split_mode",
+            th.StringType,
+            required=False,
+            description=
+            "`modulo` (default), `jump` - consistent hashing, which moves few symbols between splits when `split_num` changes, or `cost` - assignment by `split_plan_file`"
+        ),
+        th.Property(
+            "split_plan_file",
+            th.StringType,
+            required=False,
+            description=
+            "Split plan built from the symbol costs by `python -m tap_polygon.splits`"
+        ),
+        th.Property(
+            "split_costs_dir",
+            th.StringType,
+            required=False,
+            description=
+            "Directory to save the measured loading time of each symbol to"),
+        th.Property("http_pool_size",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of kept-alive HTTP connections"),
+        th.Property("request_timeout",
+                    th.IntegerType,
+                    required=False,
+                    description="HTTP request timeout in seconds"),
+        th.Property("rate_limit",
+                    th.NumberType,
+                    required=False,
+                    description="Max number of requests per second to each "
+                    "API host"),
+        th.Property("rate_limit_burst",
+                    th.IntegerType,
+                    required=False,
+                    description="Max number of requests to send at once "
+                    "within the rate limit"),
+        th.Property(
+            "metrics_flush_interval",
+            th.NumberType,
+            required=False,
+            description="Interval in seconds between Datadog metrics flushes"),
+        th.Property(
+            "fetch_concurrency",
+            th.IntegerType,
+            required=False,
+            description=
+            "Number of symbols to prefetch concurrently in historical prices streams"
+        ),
+        th.Property(
+            "grouped_daily",
+            th.BooleanType,
+            required=False,
+            description=
+            "Load incremental stock prices of all symbols with one grouped daily request per date"
+        ),
+        th.Property(
+            "grouped_check_min_symbols",
+            th.IntegerType,
+            required=False,
+            description=
+            "Check the first stock prices shared by at least this many symbols with one grouped daily request per date instead of one request per symbol"
+        ),
+        th.Property(
+            "grouped_history_days",
+            th.IntegerType,
+            required=False,
+            description=
+            "Number of days of the grouped daily bars available with the plan, older first stock prices are checked with one request per symbol"
+        ),
+        th.Property("tickers_cache_dir",
+                    th.StringType,
+                    required=False,
+                    description="Directory to keep the tickers between runs"),
+        th.Property(
+            "tickers_cache_ttl",
+            th.IntegerType,
+            required=False,
+            description="Time in seconds before refreshing the cached tickers"
+        ),
+        th.Property(
+            "tickers_fetch_concurrency",
+            th.IntegerType,
+            required=False,
+            description="Max number of markets or exchanges to load tickers of "
+            "concurrently")).to_dict()
 
     parse_env_config = True
 
+    @cached_property
+    def requests_session(self) -> requests.Session:
+        return create_requests_session(self.config)
+
+    @cached_property
+    def metrics_emitter(self) -> DatadogMetricsEmitter:
+        flush_interval = float(
+            self.config.get("metrics_flush_interval", DEFAULT_FLUSH_INTERVAL))
+        return DatadogMetricsEmitter(self.logger,
+                                     flush_interval=flush_interval)
+
+    @cached_property
+    def ticker_universe(self) -> TickerUniverseCache:
+        return TickerUniverseCache(
+            self.logger,
+            directory=self.config.get("tickers_cache_dir"),
+            ttl=int(
+                self.config.get("tickers_cache_ttl",
+                                DEFAULT_TICKERS_CACHE_TTL)),
+            concurrency=int(
+                self.config.get("tickers_fetch_concurrency",
+                                DEFAULT_TICKERS_FETCH_CONCURRENCY)))
+
+    @cached_property
+    def split_assigner(self) -> SplitAssigner:
+        return create_split_assigner(self.config)
+
+    @cached_property
+    def symbol_costs(self) -> SymbolCostRecorder:
+        return SymbolCostRecorder(self.logger,
+                                  directory=self.config.get("split_costs_dir"),
+                                  split_id=int(self.config.get("split_id", 0)))
+
+    @cached_property
+    def record_writer(self) -> RecordWriter:
+        return RecordWriter()
+
+    def sync_all(self) -> None:
+        try:
+            super().sync_all()
+        finally:
+            self.record_writer.flush()
+            self.split_assigner.log_report(self.logger)
+            self.symbol_costs.save()
+            self.metrics_emitter.close()
+
     def discover_streams(self) -> List[Stream]:
         # """Return a list of discovered streams."""
         return [stream_class(tap=self) for stream_class in STREAM_TYPES]
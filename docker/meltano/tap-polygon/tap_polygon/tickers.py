@@ -0,0 +1,222 @@
+"""Cache of the active tickers universe."""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from tap_polygon.files import write_json_atomic
+
+DEFAULT_TICKERS_CACHE_TTL = 60 * 60
+DEFAULT_FULL_REFRESH_INTERVAL = 7 * 24 * 60 * 60
+DEFAULT_TICKERS_FETCH_CONCURRENCY = 4
+
+UNIVERSE_KEYS = frozenset(
+    ["tickers", "updated_until", "loaded_at", "refreshed_at"])
+
+# Returns a page of `/v3/reference/tickers` for the query params or the
+# `next_url` of the previous page
+TickersPageLoader = Callable[[Dict[str, Any], Optional[str]], dict]
+
+
+class TickerUniverseCache:
+    """Keeps the active tickers of each universe (a market, an exchange or
+    all of them) for the whole tap invocation and, if `directory` is set, in
+    files reused by later invocations.
+
+    A universe older than `ttl` seconds is refreshed incrementally: only the
+    tickers updated since the previous refresh are requested, sorted by
+    `last_updated_utc`. Every `full_refresh_interval` seconds the whole
+    universe is downloaded again. Universes to download are paginated
+    concurrently, with up to `concurrency` threads.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 directory: Optional[str] = None,
+                 ttl: float = DEFAULT_TICKERS_CACHE_TTL,
+                 full_refresh_interval: float = DEFAULT_FULL_REFRESH_INTERVAL,
+                 concurrency: int = DEFAULT_TICKERS_FETCH_CONCURRENCY):
+        self.logger = logger
+        self.directory = Path(directory) if directory else None
+        self.ttl = ttl
+        self.full_refresh_interval = full_refresh_interval
+        self.concurrency = max(1, concurrency)
+
+        self._universes: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self,
+            universes: Iterable[Dict[str, str]],
+            load_page: TickersPageLoader,
+            raise_errors: bool = True) -> List[str]:
+        """Return the active tickers of all the universes. Universes failed
+        to load are skipped with an error logged, unless `raise_errors`."""
+        universes = {self._key(params): params for params in universes}
+
+        # The lock is held while loading so that the streams sharing the
+        # cache wait for the universes being loaded instead of loading them
+        # again
+        with self._lock:
+            stale = [
+                key for key in universes if not self._is_fresh(
+                    self._universes.get(key) or self._read_file(key))
+            ]
+
+            def refresh(key):
+                try:
+                    return self._refresh(universes[key],
+                                         self._universes.get(key), load_page)
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    self.logger.error(
+                        f"Error while loading tickers {key}: {str(e)}")
+                    return None
+
+            if len(stale) > 1 and self.concurrency > 1:
+                with ThreadPoolExecutor(
+                        max_workers=min(len(stale), self.concurrency),
+                        thread_name_prefix="tickers") as executor:
+                    refreshed = list(executor.map(refresh, stale))
+            else:
+                refreshed = [refresh(key) for key in stale]
+
+            for key, universe in zip(stale, refreshed):
+                if universe is not None:
+                    self._universes[key] = universe
+                    self._write_file(key, universe)
+
+            tickers = []
+            for key in universes:
+                if key in self._universes:
+                    tickers += self._universes[key]["tickers"]
+            return tickers
+
+    def _is_fresh(self, universe: Optional[dict]) -> bool:
+        if universe is None:
+            return False
+        return time.time() - universe["refreshed_at"] <= self.ttl
+
+    def _is_refreshable(self, universe: Optional[dict]) -> bool:
+        # Incremental refresh relies on `last_updated_utc` of the tickers
+        if universe is None or universe["updated_until"] is None:
+            return False
+        return time.time(
+        ) - universe["loaded_at"] <= self.full_refresh_interval
+
+    def _refresh(self, params: Dict[str, str], universe: Optional[dict],
+                 load_page: TickersPageLoader) -> dict:
+        if not self._is_refreshable(universe):
+            return self._load(params, load_page)
+
+        tickers = set(universe["tickers"])
+        updated_since = updated_until = universe["updated_until"]
+        for active in ["true", "false"]:
+            for record in self._paginate(
+                {
+                    **params,
+                    "active": active,
+                    "sort": "last_updated_utc",
+                    "order": "desc",
+                    "limit": 1000,
+                }, load_page):
+                last_updated = record.get("last_updated_utc")
+                if last_updated is None or last_updated < updated_since:
+                    break
+
+                if active == "true":
+                    tickers.add(record["ticker"])
+                else:
+                    tickers.discard(record["ticker"])
+                updated_until = max(updated_until, last_updated)
+
+        self.logger.info(f"Refreshed tickers {self._key(params)}")
+        return {
+            **universe,
+            "tickers": sorted(tickers),
+            "updated_until": updated_until,
+            "refreshed_at": time.time(),
+        }
+
+    def _load(self, params: Dict[str, str],
+              load_page: TickersPageLoader) -> dict:
+        now = time.time()
+        tickers = []
+        updated_until = None
+        for record in self._paginate(
+            {
+                **params,
+                "active": "true",
+                "sort": "ticker",
+                "order": "asc",
+                "limit": 1000,
+            }, load_page):
+            tickers.append(record["ticker"])
+
+            last_updated = record.get("last_updated_utc")
+            if last_updated is not None:
+                updated_until = max(updated_until or last_updated,
+                                    last_updated)
+
+        self.logger.info(f"Loaded {len(tickers)} tickers {self._key(params)}")
+        return {
+            "tickers": tickers,
+            "updated_until": updated_until,
+            "loaded_at": now,
+            "refreshed_at": now,
+        }
+
+    def _paginate(self, params: Dict[str, Any],
+                  load_page: TickersPageLoader) -> Iterable[dict]:
+        next_url = None
+        while True:
+            data = load_page(params, next_url)
+            if not data or data.get("status") not in ["OK", "DELAYED"]:
+                raise Exception('Error while requesting tickers: %s' %
+                                (json.dumps(data)))
+
+            yield from data.get("results", [])
+
+            next_url = data.get("next_url")
+            if not next_url:
+                break
+
+    @staticmethod
+    def _key(params: Dict[str, str]) -> str:
+        return "_".join(f"{name}-{value}"
+                        for name, value in sorted(params.items())) or "all"
+
+    def _file_path(self, key: str) -> Path:
+        return self.directory / f"tickers_{key}.json"
+
+    def _read_file(self, key: str) -> Optional[dict]:
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self._file_path(key)) as f:
+                universe = json.load(f)
+            missing_keys = UNIVERSE_KEYS.difference(universe)
+            if missing_keys:
+                raise ValueError(f"missing {sorted(missing_keys)}")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(
+                f"Failed to read cached tickers {key}: '{str(e)}'")
+            return None
+
+        self._universes[key] = universe
+        return universe
+
+    def _write_file(self, key: str, universe: dict) -> None:
+        if self.directory is None:
+            return
+
+        try:
+            write_json_atomic(self._file_path(key), universe)
+        except OSError as e:
+            self.logger.warning(f"Failed to cache tickers {key}: '{str(e)}'")
@@ -0,0 +1,81 @@
+"""Measures RECORD messages throughput of the minute-bar RealtimePrices stream.
+
+Usage: python benchmark_record_messages.py [records]
+"""
+
+import contextlib
+import os
+import sys
+import time
+
+import singer
+from singer import RecordMessage
+from singer_sdk.helpers._typing import conform_record_data_types
+from singer_sdk.helpers._util import utc_now
+
+from tap_polygon.tap import Tappolygon
+
+
+def write_record_message_sdk(stream, record):
+    # The record writing path used before the buffered RecordWriter
+    record = conform_record_data_types(
+        stream_name=stream.name,
+        row=record,
+        schema=stream.schema,
+        logger=stream.logger,
+    )
+    for stream_map in stream.stream_maps:
+        mapped_record = stream_map.transform(record)
+        if mapped_record is not None:
+            record_message = RecordMessage(
+                stream=stream_map.stream_alias,
+                record=mapped_record,
+                version=None,
+                time_extracted=utc_now(),
+            )
+            singer.write_message(record_message)
+
+
+def generate_records(count):
+    t = 1651708800000
+    for i in range(count):
+        yield {
+            "symbol": "AAPL",
+            "v": 1055 + i,
+            "vw": 144.4812,
+            "o": 144.74,
+            "c": 144.44,
+            "h": 144.74,
+            "l": 144.4,
+            "t": t + i * 60000,
+            "n": 44,
+            "first_t": t,
+        }
+
+
+def measure(name, records, write, flush=None):
+    started_at = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            for record in records:
+                write(record)
+            if flush:
+                flush()
+    elapsed = time.perf_counter() - started_at
+    print(f"{name}: {len(records) / elapsed:,.0f} records/s")
+
+
+def main(count):
+    tap = Tappolygon(config={"api_key": "fake_key"})
+    stream = tap.streams["polygon_intraday_prices_launchpad"]
+
+    records = list(generate_records(count))
+    measure("singer.write_message", records,
+            lambda record: write_record_message_sdk(stream, record))
+
+    measure("RecordWriter", records, stream._write_record_message,
+            tap.record_writer.flush)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -1,6 +1,8 @@
 """Tests standard tap features using the built-in SDK tests library."""
 
 import copy
+import time
+from unittest import mock
 
 import vcr
 from vcr.record_mode import RecordMode
@@ -8,6 +10,7 @@ from freezegun import freeze_time
 from singer_sdk.plugin_base import JSONSchemaValidator
 from singer_sdk.testing import get_standard_tap_tests
 
+from tap_polygon.ratelimit import RateLimitedAdapter
 from tap_polygon.tap import Tappolygon
 
 RECORD_MODE = RecordMode.NONE
@@ -22,6 +25,8 @@ CONFIG = {
 EXCHANGES_CONFIG = {
     "api_key": "fake_key",
     "stock_exchanges": ["XNAS"],
+    # vcr playback is not thread-safe
+    "tickers_fetch_concurrency": 1,
 }
 
 STATE = {
@@ -190,3 +195,277 @@ def _validate_schema(context, schema_file, stream_name):
 
         validator = JSONSchemaValidator(schema)
         validator.validate(records[0])
+
+
+@freeze_time("2022-05-05")
+def test_concurrent_fetch():
+    config = {**CONFIG, "realtime": True}
+    sequential_records, sequential_state = _sync_realtime_prices(config)
+
+    config["fetch_concurrency"] = 2
+    concurrent_records, concurrent_state = _sync_realtime_prices(config)
+
+    assert len(sequential_records) == 6
+    assert sequential_records == concurrent_records
+    assert sequential_state == concurrent_state
+
+
+@freeze_time("2022-05-05")
+def test_grouped_daily():
+    config = {
+        **CONFIG, "stock_symbols": ["AAPL", "MSFT"],
+        "grouped_daily": True
+    }
+    first_record = {"t": 1651204800000, "c": 157.65, "date_to": "2022-05-02"}
+    state = {
+        "bookmarks": {
+            "polygon_stocks_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "symbol": symbol
+                    },
+                    "first_record": first_record.copy()
+                } for symbol in config["stock_symbols"]]
+            }
+        }
+    }
+    tap = Tappolygon(config=config, state=state)
+    stream = tap.streams["polygon_stocks_historical_prices"]
+
+    urls = []
+
+    def fetch(url, params, headers=None):
+        urls.append(url)
+        if "/grouped/" not in url:
+            # The first record check
+            return {"status": "OK", "results": [first_record]}
+
+        day = int(url[-2:])
+        return {
+            "status":
+            "OK",
+            "results": [{
+                "T": symbol,
+                "c": float(day),
+                "t": 1651262400000
+            } for symbol in ["AAPL", "MSFT", "TSLA"]]
+        }
+
+    records = []
+    cached_dates = []
+    with mock.patch.object(stream, "fetch", fetch):
+        for context in stream.partitions:
+            for record in stream.get_records(context):
+                records.append((context["symbol"], record["t"], record["c"]))
+            cached_dates.append(len(stream.grouped_daily_bars))
+
+    # 2022-05-02 - 2022-05-05 are loaded once for both symbols
+    grouped_urls = [url for url in urls if "/grouped/" in url]
+    assert len(grouped_urls) == 4
+    assert len(urls) == 6
+    # The bars are dropped once the last symbol needing them is loaded
+    assert cached_dates == [4, 0]
+
+    assert records[:4] == [("AAPL", 1651464000000 + day * 86400000,
+                            float(day + 2)) for day in range(4)]
+    assert [symbol for symbol, _, _ in records] == ["AAPL"] * 4 + ["MSFT"] * 4
+
+    partition_state = stream.get_context_state({"symbol": "AAPL"})
+    assert partition_state["first_record"]["date_to"] == "2022-05-05"
+
+
+@freeze_time("2022-05-05")
+def test_grouped_first_record_check():
+    config = {
+        **CONFIG, "stock_symbols": ["AAPL", "MSFT", "TSLA"],
+        "grouped_check_min_symbols": 2
+    }
+    first_records = {
+        "AAPL": {
+            "t": 1651204800000,
+            "c": 157.65,
+            "date_to": "2022-05-02"
+        },
+        "MSFT": {
+            "t": 1651204800000,
+            "c": 277.52,
+            "date_to": "2022-05-02"
+        },
+        "TSLA": {
+            "t": 1651118400000,
+            "c": 877.51,
+            "date_to": "2022-05-02"
+        },
+    }
+    state = {
+        "bookmarks": {
+            "polygon_stocks_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "symbol": symbol
+                    },
+                    "first_record": first_record
+                } for symbol, first_record in first_records.items()]
+            }
+        }
+    }
+    tap = Tappolygon(config=config, state=state)
+    stream = tap.streams["polygon_stocks_historical_prices"]
+
+    urls = []
+
+    def fetch(url, params, headers=None):
+        urls.append(url)
+        if "/grouped/" not in url:
+            return {"status": "OK", "results": [first_records["TSLA"]]}
+
+        # MSFT prices were adjusted since the first record was stored
+        return {
+            "status":
+            "OK",
+            "results": [{
+                "T": "AAPL",
+                "c": 157.65,
+                "t": 1651262400000
+            }, {
+                "T": "MSFT",
+                "c": 138.76,
+                "t": 1651262400000
+            }]
+        }
+
+    date_from = {}
+
+    def request_records(context):
+        date_from[context["symbol"]] = context["date_from"]
+        return []
+
+    with mock.patch.object(stream, "fetch",
+                           fetch), mock.patch.object(stream, "request_records",
+                                                     request_records):
+        for context in stream.partitions:
+            list(stream.get_records(context))
+
+    # One grouped request for the shared date, TSLA is checked on its own
+    assert len(urls) == 2
+    assert urls[0].endswith("/grouped/locale/us/market/stocks/2022-04-29")
+    assert "/ticker/TSLA/" in urls[1]
+    assert date_from == {
+        "AAPL": "2022-05-02",
+        "MSFT": "1980-01-01",
+        "TSLA": "2022-05-02"
+    }
+
+
+@freeze_time("2022-05-05")
+def test_grouped_first_record_check_history():
+    # First records older than the grouped history are checked on their own
+    config = {
+        **CONFIG, "stock_symbols": ["AAPL", "MSFT"],
+        "grouped_check_min_symbols": 2,
+        "grouped_history_days": 3
+    }
+    first_record = {"t": 1651204800000, "c": 157.65, "date_to": "2022-05-02"}
+    state = {
+        "bookmarks": {
+            "polygon_stocks_historical_prices": {
+                "partitions": [{
+                    "context": {
+                        "symbol": symbol
+                    },
+                    "first_record": first_record.copy()
+                } for symbol in config["stock_symbols"]]
+            }
+        }
+    }
+    tap = Tappolygon(config=config, state=state)
+    stream = tap.streams["polygon_stocks_historical_prices"]
+
+    urls = []
+
+    def fetch(url, params, headers=None):
+        urls.append(url)
+        return {"status": "OK", "results": [first_record]}
+
+    with mock.patch.object(stream, "fetch",
+                           fetch), mock.patch.object(stream, "request_records",
+                                                     lambda context: []):
+        for context in stream.partitions:
+            list(stream.get_records(context))
+
+    assert len(urls) == 2
+    assert not any("/grouped/" in url for url in urls)
+    assert len(stream.grouped_daily_bars) == 0
+
+
+@freeze_time("2022-05-05")
+def test_records_are_streamed():
+    # Without prefetch the records are emitted while they are requested
+    config = {**CONFIG, "realtime": True}
+    tap = Tappolygon(config=config, state=copy.deepcopy(STATE))
+    stream = tap.streams["polygon_intraday_prices_launchpad"]
+
+    events = []
+
+    def request_records(context):
+        for i in range(3):
+            events.append(("requested", i))
+            yield {"t": context["date_from"] + i, "c": 1.0}
+
+    context = stream.partitions[0]
+    with mock.patch.object(stream, "request_records", request_records):
+        for record in stream.get_records(context):
+            events.append(("emitted", record["t"] - context["date_from"]))
+
+    assert events == [(event, i) for i in range(3)
+                      for event in ["requested", "emitted"]]
+    costs = tap.symbol_costs._costs[stream.name][context["symbol"]]
+    assert costs["records"] == 3
+
+
+@freeze_time("2022-05-05")
+def test_prefetcher_is_shut_down():
+    config = {**CONFIG, "realtime": True, "fetch_concurrency": 2}
+    tap = Tappolygon(config=config, state=copy.deepcopy(STATE))
+    stream = tap.streams["polygon_intraday_prices_launchpad"]
+    prefetcher = stream.partition_prefetcher
+
+    with mock.patch.object(stream, "request_records", lambda context: []):
+        stream.sync()
+
+    assert prefetcher._executor._shutdown
+    # The next sync prefetches with a new executor
+    assert stream.partition_prefetcher is not prefetcher
+
+
+def test_shared_requests_session():
+    tap = Tappolygon(config={**CONFIG, "fetch_concurrency": 16})
+
+    sessions = [stream.requests_session for stream in tap.streams.values()]
+    assert all(session is tap.requests_session for session in sessions)
+    adapter = tap.requests_session.get_adapter("https://api.polygon.io")
+    assert adapter._pool_maxsize == 16
+    # All the requests go through the shared rate limiter
+    assert isinstance(adapter, RateLimitedAdapter)
+
+
+def _sync_realtime_prices(config):
+    tap = Tappolygon(config=config, state=copy.deepcopy(STATE))
+    stream = tap.streams["polygon_intraday_prices_launchpad"]
+
+    def request_records(context):
+        # The first symbols respond slower, so the prefetched ones complete first
+        position = config["realtime_symbols"].index(context["symbol"])
+        time.sleep(0.1 / (position + 1))
+        return [{
+            "t": context["date_from"] + i,
+            "c": float(position)
+        } for i in range(2)]
+
+    records = []
+    with mock.patch.object(stream, "request_records", request_records):
+        for context in stream.partitions:
+            for record in stream.get_records(context):
+                records.append((record["symbol"], record["t"]))
+
+    return records, tap.state
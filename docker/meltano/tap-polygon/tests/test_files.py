@@ -0,0 +1,27 @@
+"""Tests writing of the files kept between the tap invocations."""
+
+import json
+
+import pytest
+
+from tap_polygon.files import write_json_atomic
+
+
+def test_write_json_atomic(tmp_path):
+    path = tmp_path / "cache" / "tickers.json"
+    write_json_atomic(path, {"tickers": ["AAPL"]})
+    write_json_atomic(str(path), {"tickers": ["MSFT"]})
+
+    assert json.loads(path.read_text()) == {"tickers": ["MSFT"]}
+    assert [p.name for p in path.parent.iterdir()] == ["tickers.json"]
+
+
+def test_failed_write_keeps_the_file(tmp_path):
+    path = tmp_path / "tickers.json"
+    write_json_atomic(path, {"tickers": ["AAPL"]})
+
+    with pytest.raises(TypeError):
+        write_json_atomic(path, {"tickers": {"AAPL"}})
+
+    assert json.loads(path.read_text()) == {"tickers": ["AAPL"]}
+    assert [p.name for p in tmp_path.iterdir()] == ["tickers.json"]
@@ -0,0 +1,48 @@
+"""Tests conversion between timestamps and US market dates."""
+
+import datetime
+
+import pytest
+
+from tap_polygon.markettime import market_date, market_day_start
+
+
+def test_fixed_dates():
+    # Daylight saving time since 2007, 1987 - 2006 and before 1987
+    for date, t in [
+        ("2022-03-11", 1646974800000),
+        ("2022-03-13", 1647147600000),
+        ("2022-03-14", 1647230400000),
+        ("2021-11-07", 1636257600000),
+        ("2021-11-08", 1636347600000),
+        ("2000-04-02", 954651600000),
+        ("2000-04-03", 954734400000),
+        ("1985-04-28", 483512400000),
+        ("1985-07-01", 489038400000),
+    ]:
+        assert t == market_day_start(date)
+        assert date == market_date(t)
+        # Grouped bars are timestamped with the close of the day
+        assert date == market_date(t + 16 * 3600000)
+
+
+def test_matches_time_zone():
+    zoneinfo = pytest.importorskip("zoneinfo")
+    try:
+        time_zone = zoneinfo.ZoneInfo("America/New_York")
+    except zoneinfo.ZoneInfoNotFoundError:
+        pytest.skip("No time zone database")
+
+    day = datetime.date(1976, 1, 1)
+    while day < datetime.date(2030, 1, 1):
+        midnight = datetime.datetime.combine(day, datetime.time(), time_zone)
+        t = int(midnight.timestamp() * 1000)
+        assert t == market_day_start(day.isoformat())
+
+        for minutes in range(0, 24 * 60, 90):
+            t_minutes = t + minutes * 60000
+            assert datetime.datetime.fromtimestamp(
+                t_minutes / 1000,
+                tz=time_zone).date().isoformat() == market_date(t_minutes)
+
+        day += datetime.timedelta(days=1)
@@ -0,0 +1,36 @@
+"""Tests that the modules copied between the taps are kept the same.
+
+Each tap is built from its own directory, so the modules can't be shared as a
+package. The check is skipped when the other taps are not next to this one.
+"""
+
+from pathlib import Path
+
+import pytest
+
+TAPS_DIR = Path(__file__).parent.parent.parent
+
+SHARED_MODULES = {
+    "metrics.py": ["tap-polygon", "tap-eodhistoricaldata", "tap-coingecko"],
+    "ratelimit.py": ["tap-polygon", "tap-eodhistoricaldata", "tap-coingecko"],
+    "files.py": ["tap-polygon", "tap-eodhistoricaldata", "tap-coingecko"],
+    "splits.py": ["tap-polygon", "tap-eodhistoricaldata", "tap-coingecko"],
+    # tap-eodhistoricaldata caches the conformance functions of its streams
+    "messages.py": ["tap-polygon", "tap-coingecko"],
+    "prefetch.py": ["tap-polygon", "tap-coingecko"],
+}
+
+
+def _module_path(tap: str, module: str) -> Path:
+    return TAPS_DIR / tap / tap.replace("-", "_") / module
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_shared_module_copies_are_the_same(module):
+    paths = [_module_path(tap, module) for tap in SHARED_MODULES[module]]
+    missing = [str(path) for path in paths if not path.exists()]
+    if missing:
+        pytest.skip(f"Missing copies: {', '.join(missing)}")
+
+    sources = {path: path.read_text() for path in paths}
+    assert len(set(sources.values())) == 1, sorted(map(str, sources))
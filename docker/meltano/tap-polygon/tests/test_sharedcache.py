@@ -0,0 +1,72 @@
+"""Tests the values shared by the partitions."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tap_polygon.sharedcache import SharedCache
+
+
+def test_loaded_once_while_acquired():
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        return key.upper()
+
+    cache = SharedCache(load)
+    cache.acquire(["a", "b"])
+    cache.acquire(["a"])
+
+    assert cache.get("a") == "A"
+    assert cache.get("a") == "A"
+    assert cache.get("b") == "B"
+    assert loads == ["a", "b"]
+    assert len(cache) == 2
+
+    cache.release(["a", "b"])
+    assert len(cache) == 1
+    cache.release(["a"])
+    assert len(cache) == 0
+
+    # Keys which are not acquired are not kept
+    assert cache.get("a") == "A"
+    assert loads == ["a", "b", "a"]
+    assert len(cache) == 0
+
+
+def test_failure_is_shared():
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        raise ValueError(key)
+
+    cache = SharedCache(load)
+    cache.acquire(["a"])
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.get("a")
+    assert loads == ["a"]
+
+
+def test_keys_are_loaded_concurrently():
+    loads = []
+    b_loaded = threading.Event()
+
+    def load(key):
+        loads.append(key)
+        if key == "a":
+            # Another key is loaded while this one is still loading
+            assert b_loaded.wait(5)
+        else:
+            b_loaded.set()
+        return key
+
+    cache = SharedCache(load)
+    cache.acquire(["a", "a", "b"])
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(cache.get, ["a", "a", "b"]))
+
+    assert results == ["a", "a", "b"]
+    assert sorted(loads) == ["a", "b"]
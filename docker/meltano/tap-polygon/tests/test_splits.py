@@ -0,0 +1,134 @@
+"""Tests assignment of symbols to tap splits."""
+
+import hashlib
+import json
+import logging
+
+import pytest
+from singer_sdk.exceptions import ConfigValidationError
+
+from tap_polygon.splits import (SplitAssigner, SymbolCostRecorder,
+                                create_split_assigner, load_symbol_costs,
+                                plan_splits)
+
+SYMBOLS = [f"S{i}" for i in range(20000)]
+
+
+def test_modulo_mode_is_compatible():
+    assigner = SplitAssigner(split_num=4, split_id=1)
+    for symbol in SYMBOLS[:1000]:
+        symbol_hash = int(hashlib.md5(symbol.encode("UTF-8")).hexdigest(), 16)
+        assert assigner.is_within_split(symbol) == (symbol_hash % 4 == 1)
+
+
+def test_jump_mode_moves_few_symbols():
+    for split_num in [1, 4, 9]:
+        before = SplitAssigner(split_num, mode="jump").assign_all(SYMBOLS)
+        after = SplitAssigner(split_num + 1, mode="jump").assign_all(SYMBOLS)
+
+        moved = [
+            symbol for symbol in SYMBOLS if before[symbol] != after[symbol]
+        ]
+        # Symbols only move to the new split
+        assert all(after[symbol] == split_num for symbol in moved)
+        assert len(moved) / len(SYMBOLS) == pytest.approx(1 / (split_num + 1),
+                                                          abs=0.02)
+
+
+def test_filter_and_report(caplog):
+    splits = [
+        SplitAssigner(split_num=3, split_id=split_id, mode="jump")
+        for split_id in range(3)
+    ]
+    filtered = [assigner.filter(SYMBOLS + SYMBOLS[:10]) for assigner in splits]
+    assert sorted(sum(filtered, [])) == sorted(SYMBOLS + SYMBOLS[:10])
+
+    counts = splits[0].split_counts()
+    assert counts == [len(set(symbols)) for symbols in filtered]
+
+    with caplog.at_level(logging.INFO):
+        splits[0].log_report(logging.getLogger("test"))
+    assert f"{counts[0]} of {len(SYMBOLS)} symbols" in caplog.text
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        SplitAssigner(split_num=2, mode="rendezvous")
+
+
+def test_plan_splits_balances_costs():
+    costs = {f"S{i}": float(i % 97 + 1) for i in range(1000)}
+    costs["BIG"] = 500.0
+
+    plan = plan_splits(costs, 4)
+    assert plan == plan_splits(dict(reversed(costs.items())), 4)
+
+    loads = [0.0] * 4
+    for symbol, split in plan.items():
+        loads[split] += costs[symbol]
+    assert max(loads) / (sum(loads) / 4) < 1.01
+
+    # Hash splits of the same symbols are noticeably less balanced
+    assigner = SplitAssigner(split_num=4, mode="jump")
+    hash_loads = [0.0] * 4
+    for symbol, split in assigner.assign_all(costs).items():
+        hash_loads[split] += costs[symbol]
+    assert max(hash_loads) > max(loads)
+
+
+def test_cost_mode(tmp_path):
+    logger = logging.getLogger("test")
+    for split_id, durations in enumerate([{"A": 10.0, "B": 1.0}, {"C": 5.0}]):
+        recorder = SymbolCostRecorder(logger,
+                                      directory=str(tmp_path / "costs"),
+                                      split_id=split_id)
+        for symbol, duration in durations.items():
+            recorder.record("prices", symbol, duration, 100)
+            recorder.record("dividends", symbol, duration, 10)
+        recorder.save()
+
+    # A symbol moved to another split, the latest measurement is used
+    recorder = SymbolCostRecorder(logger,
+                                  directory=str(tmp_path / "costs"),
+                                  split_id=1)
+    recorder.record("prices", "B", 7.0, 100)
+    recorder.save()
+
+    costs = load_symbol_costs(str(tmp_path / "costs"), logger)
+    assert {"A": 20.0, "B": 8.0, "C": 10.0} == costs
+
+    plan_file = tmp_path / "plan.json"
+    plan_file.write_text(
+        json.dumps({
+            "split_num": 2,
+            "splits": plan_splits(costs, 2)
+        }))
+    config = {
+        "split_num": "2",
+        "split_id": "1",
+        "split_mode": "cost",
+        "split_plan_file": str(plan_file)
+    }
+    assigner = create_split_assigner(config)
+    assert ["B", "C"] == assigner.filter(["A", "B", "C"])
+    # Symbols missing from the plan are hashed
+    jump = SplitAssigner(split_num=2, split_id=1, mode="jump")
+    assert jump.filter(SYMBOLS[:100]) == assigner.filter(SYMBOLS[:100])
+
+    # A plan which can't be used fails instead of splitting by hash
+    with pytest.raises(ConfigValidationError, match="for 2 splits"):
+        create_split_assigner({**config, "split_num": "3"})
+    with pytest.raises(ConfigValidationError, match="Failed to read"):
+        create_split_assigner({
+            **config, "split_plan_file":
+            str(tmp_path / "missing.json")
+        })
+    with pytest.raises(ConfigValidationError, match="is required"):
+        create_split_assigner({**config, "split_plan_file": None})
+
+    plan_file.write_text(json.dumps({"split_num": 2, "splits": {"A": 2}}))
+    with pytest.raises(ConfigValidationError, match="unknown splits"):
+        create_split_assigner(config)
+    plan_file.write_text("{")
+    with pytest.raises(ConfigValidationError, match="Failed to read"):
+        create_split_assigner(config)
@@ -0,0 +1,124 @@
+"""Tests the tickers universe caching."""
+
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+from tap_polygon.tickers import TickerUniverseCache
+
+TICKERS = {
+    "stocks": [
+        {
+            "ticker": "AAPL",
+            "last_updated_utc": "2022-05-01T00:00:00Z"
+        },
+        {
+            "ticker": "TSLA",
+            "last_updated_utc": "2022-05-02T00:00:00Z"
+        },
+    ],
+    "crypto": [{
+        "ticker": "X:BTCUSD",
+        "last_updated_utc": "2022-05-01T00:00:00Z"
+    }],
+}
+
+
+class _Loader:
+
+    def __init__(self, tickers, inactive_tickers=()):
+        self.tickers = tickers
+        self.inactive_tickers = inactive_tickers
+        self.requests = []
+        self.threads = set()
+
+    def __call__(self, params, next_url):
+        self.requests.append((params, next_url))
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+
+        if params["active"] == "true":
+            results = self.tickers[params["market"]]
+        else:
+            results = self.inactive_tickers
+        results = sorted(results,
+                         key=lambda record: record[params["sort"]],
+                         reverse=params["order"] == "desc")
+
+        # Two records per page
+        offset = int(next_url or 0)
+        data = {"status": "OK", "results": results[offset:offset + 2]}
+        if offset + 2 < len(results):
+            data["next_url"] = str(offset + 2)
+        return data
+
+
+def test_markets_are_loaded_concurrently_once():
+    cache = TickerUniverseCache(logging.getLogger("test"))
+    loader = _Loader(TICKERS)
+    universes = [{"market": "stocks"}, {"market": "crypto"}]
+
+    assert sorted(cache.get(universes, loader)) == ["AAPL", "TSLA", "X:BTCUSD"]
+    assert len(loader.requests) == 2
+    assert len(loader.threads) == 2
+
+    assert cache.get([{"market": "crypto"}], loader) == ["X:BTCUSD"]
+    assert len(loader.requests) == 2
+
+
+def test_incremental_refresh(tmp_path):
+    logger = logging.getLogger("test")
+    universes = [{"market": "stocks"}]
+    loader = _Loader({
+        "stocks":
+        TICKERS["stocks"] + [{
+            "ticker": "AMZN",
+            "last_updated_utc": "2022-04-01T00:00:00Z"
+        }]
+    })
+    TickerUniverseCache(logger, directory=str(tmp_path)).get(universes, loader)
+    assert len(loader.requests) == 2
+
+    # Within TTL the tickers are loaded from the file
+    cache = TickerUniverseCache(logger, directory=str(tmp_path))
+    assert cache.get(universes, loader) == ["AAPL", "AMZN", "TSLA"]
+    assert len(loader.requests) == 2
+
+    # After TTL only the tickers updated since are requested
+    loader.requests = []
+    loader.tickers["stocks"] = [{
+        "ticker": "META",
+        "last_updated_utc": "2022-05-03T00:00:00Z"
+    }] + loader.tickers["stocks"][:2]
+    loader.inactive_tickers = [{
+        "ticker": "AMZN",
+        "last_updated_utc": "2022-05-04T00:00:00Z"
+    }, {
+        "ticker": "FB",
+        "last_updated_utc": "2022-01-01T00:00:00Z"
+    }]
+    cache = TickerUniverseCache(logger, directory=str(tmp_path), ttl=0)
+    assert cache.get(universes, loader) == ["AAPL", "META", "TSLA"]
+    assert [params["sort"] for params, _ in loader.requests
+            ] == ["last_updated_utc", "last_updated_utc", "last_updated_utc"]
+
+    data = json.loads((tmp_path / "tickers_market-stocks.json").read_text())
+    assert data["updated_until"] == "2022-05-04T00:00:00Z"
+
+
+def test_errors():
+    cache = TickerUniverseCache(logging.getLogger("test"))
+
+    def load_page(params, next_url):
+        if params.get("market") == "crypto":
+            return {"status": "ERROR"}
+        return {"status": "OK", "results": [{"ticker": "AAPL"}]}
+
+    universes = [{"market": "stocks"}, {"market": "crypto"}]
+    with pytest.raises(Exception):
+        cache.get(universes, load_page)
+
+    assert cache.get(universes, load_page, raise_errors=False) == ["AAPL"]
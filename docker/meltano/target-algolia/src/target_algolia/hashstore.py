@@ -0,0 +1,88 @@
+import hashlib
+import sqlite3
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+
+def hash_search_record(serialized_record: bytes) -> str:
+    """Return a hash of the serialized search record. Attributes are always
+    serialized in the order of the index mapping."""
+    return hashlib.md5(serialized_record).hexdigest()
+
+
+class ObjectHashStore:
+    """
+    SQLite file keeping the content hash of every object saved to Algolia, so
+    that unchanged objects are not sent again on later runs.
+
+    Every object seen during the run is marked with the run id, objects of an
+    index without the mark are the ones missing from the source.
+    """
+
+    def __init__(self, path: str):
+        self.run_id = str(uuid.uuid4())
+
+        # Batches are completed from the target drain threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS object_hashes (
+                    index_name TEXT NOT NULL,
+                    object_id TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    run_id TEXT NOT NULL,
+                    PRIMARY KEY (index_name, object_id)
+                )""")
+
+    def get_hash(self, index_name: str, object_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash FROM object_hashes "
+                "WHERE index_name = ? AND object_id = ?",
+                (index_name, object_id)).fetchone()
+        return row[0] if row else None
+
+    def save(self, index_name: str, saved: Iterable[Tuple[str, str]],
+             unchanged: Iterable[str]) -> None:
+        """Store hashes of the saved objects and mark the unchanged objects as
+        seen during the run."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO object_hashes "
+                "(index_name, object_id, hash, run_id) VALUES (?, ?, ?, ?)",
+                [(index_name, object_id, object_hash, self.run_id)
+                 for object_id, object_hash in saved])
+            self._connection.executemany(
+                "UPDATE object_hashes SET run_id = ? "
+                "WHERE index_name = ? AND object_id = ?",
+                [(self.run_id, index_name, object_id)
+                 for object_id in unchanged])
+
+    def get_missing(self, index_name: str) -> List[str]:
+        """Return ids of the objects not seen during the run."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT object_id FROM object_hashes "
+                "WHERE index_name = ? AND run_id != ?",
+                (index_name, self.run_id)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, index_name: str) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) FROM object_hashes WHERE index_name = ?",
+                (index_name, )).fetchone()
+        return row[0]
+
+    def delete(self, index_name: str, object_ids: Iterable[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM object_hashes "
+                "WHERE index_name = ? AND object_id = ?",
+                [(index_name, object_id) for object_id in object_ids])
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,27 @@
+"""Projection of stream records into Algolia search records."""
+from typing import Callable, Dict
+
+SearchRecordProjector = Callable[[Dict], Dict]
+
+
+def compile_projector(source_config: Dict) -> SearchRecordProjector:
+    """Return a function building the search record of the index source
+    config from a stream record.
+
+    The search record contains all the `attributes` of the source, missing
+    ones set to None, and a surrogate `objectID` concatenating the
+    `primary_key` attributes. The function is generated once per index, so
+    that the config is not looked up and iterated for every record."""
+    items = [
+        f"{attr!r}: get({attr!r})" for attr in source_config["attributes"]
+    ]
+    object_id = " + ".join(f"str(record[{key_attr!r}])"
+                           for key_attr in source_config["primary_key"])
+    items.append(f"'objectID': {object_id or repr('')}")
+
+    source = ("def project(record):\n"
+              "    get = record.get\n"
+              f"    return {{{', '.join(items)}}}\n")
+    namespace = {}
+    exec(compile(source, "<search record projector>", "exec"), namespace)
+    return namespace["project"]
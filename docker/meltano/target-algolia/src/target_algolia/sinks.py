@@ -1,17 +1,27 @@
-from typing import Dict, List, Optional
+import io
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from algoliasearch.http.serializer import JSONEncoder
+from algoliasearch.responses import MultipleResponse
 from algoliasearch.search_client import SearchClient
 from algoliasearch.search_index import SearchIndex
 from singer_sdk.plugin_base import PluginBase
 from singer_sdk.sinks import BatchSink
 
-from target_algolia.utils import parse_config
+from target_algolia.hashstore import ObjectHashStore, hash_search_record
+from target_algolia.projector import compile_projector
+from target_algolia.utils import parse_index_mapping
 
 
 class AlgoliaSink(BatchSink):
     """Algolia target sink class, which handles writing streams."""
 
-    max_size = 1000  # Max records to write in one batch
+    DEFAULT_MAX_BATCH_RECORDS = 1000
+    DEFAULT_MAX_BATCH_BYTES = 5 * 1024 * 1024
+    DEFAULT_UPLOAD_CONCURRENCY = 4
+    DEFAULT_DELETE_MISSING_MAX_RATIO = 0.1
 
     def __init__(
         self,
@@ -31,19 +41,83 @@ class AlgoliaSink(BatchSink):
 
         super().__init__(target, stream_name, schema, key_properties)
         self.index_config, self.search_index = self._init_search_index()
+        self._to_search_record = compile_projector(self.index_config["source"])
+
+        self.max_batch_records = int(
+            self.config.get("max_batch_records",
+                            self.DEFAULT_MAX_BATCH_RECORDS))
+        self.max_batch_bytes = int(
+            self.config.get("max_batch_bytes", self.DEFAULT_MAX_BATCH_BYTES))
+        self.upload_concurrency = int(
+            self.config.get("upload_concurrency",
+                            self.DEFAULT_UPLOAD_CONCURRENCY))
+        self._batch_size_bytes = 0
+        # Search records are serialized the same way as by the Algolia client
+        self._encoder = JSONEncoder(separators=(",", ":"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.upload_concurrency,
+            thread_name_prefix=f"algolia-{stream_name}")
+        self._uploads: List[Tuple[Future, Dict]] = []
+        self._indexing_responses: List[MultipleResponse] = []
+
+        # Unchanged objects are skipped if the hashes of saved objects are kept
+        self.hash_store: Optional[ObjectHashStore] = target.hash_store
+        self.skipped_count = 0
+        self.updated_count = 0
+        self.deleted_count = 0
+        self.delete_missing_max_ratio = float(
+            self.config.get("delete_missing_max_ratio",
+                            self.DEFAULT_DELETE_MISSING_MAX_RATIO))
+        # Whether the records received so far are all the records of the
+        # source, see `activate_version`
+        self.is_full_snapshot = False
+
+    @property
+    def max_size(self) -> int:
+        # Max records to write in one batch
+        return self.max_batch_records
+
+    @property
+    def is_full(self) -> bool:
+        if self._batch_size_bytes >= self.max_batch_bytes:
+            return True
+        return super().is_full
+
+    def start_batch(self, context: dict) -> None:
+        self._batch_size_bytes = 0
 
     def process_record(self, record: dict, context: dict) -> None:
         """Load the latest record from the stream and converts into a search records.
 
-        Creates `context["records"]` list and append all search records for processing during
-        :meth:`~singer_sdk.BatchSink.process_batch()`.
+        Creates `context["buffer"]` with all the search records serialized as JSON lines for
+        processing during :meth:`~singer_sdk.BatchSink.process_batch()`. The buffer takes a
+        fraction of the memory of the records and its size limits the batch.
 
         Args:
             record: Individual record in the stream.
             context: Stream partition or context dictionary.
         """
 
-        super().process_record(self._to_search_record(record), context)
+        self.is_full_snapshot = False
+
+        search_record = self._to_search_record(record)
+        line = self._encoder.encode(search_record).encode("UTF-8")
+
+        if self.hash_store is not None:
+            object_id = search_record["objectID"]
+            object_hash = hash_search_record(line)
+            if self.hash_store.get_hash(self.index_config["name"],
+                                        object_id) == object_hash:
+                context.setdefault("unchanged", []).append(object_id)
+                return
+            context.setdefault("hashes", []).append((object_id, object_hash))
+
+        if "buffer" not in context:
+            context["buffer"] = io.BytesIO()
+            context["records_count"] = 0
+        context["buffer"].write(line + b"\n")
+        context["records_count"] += 1
+        self._batch_size_bytes += len(line)
 
     def process_batch(self, context: dict) -> None:
         """Takes records from context, prepares for indexing and save into Algolia index.
@@ -51,8 +125,105 @@ class AlgoliaSink(BatchSink):
         Args:
             context: Stream partition or context dictionary.
         """
-        if "records" in context:
-            self.search_index.save_objects(context["records"])
+        if "buffer" in context:
+            self._submit_upload(context["buffer"], context)
+        else:
+            self._save_hashes(context)
+
+    def activate_version(self, new_version: int) -> None:
+        """Full table streams activate the version of the table once all its
+        records are sent. Incremental streams and streams of a tap which
+        stopped early don't activate a version after their last record."""
+        self.is_full_snapshot = True
+
+    def flush_uploads(self) -> None:
+        """Wait until all the submitted batches are accepted by Algolia."""
+        while self._uploads:
+            self._complete_upload(*self._uploads.pop(0))
+
+    def delete_missing_objects(self) -> None:
+        """Delete the objects saved by previous runs, which were not received
+        during this run. Must be called once all the batches are flushed."""
+        if self.hash_store is None:
+            return
+
+        index_name = self.index_config["name"]
+        if not self.is_full_snapshot:
+            self.logger.warning(
+                f"Not deleting missing objects from index {index_name}: the "
+                f"stream did not end with an ACTIVATE_VERSION message, so it "
+                f"may not have sent all the records")
+            return
+
+        object_ids = self.hash_store.get_missing(index_name)
+        if not object_ids:
+            return
+
+        # A partial source, e.g. a resumed full table sync, must not wipe
+        # the index
+        objects_count = self.hash_store.count(index_name)
+        if len(object_ids) > self.delete_missing_max_ratio * objects_count:
+            self.logger.warning(
+                f"Not deleting {len(object_ids)} of {objects_count} objects "
+                f"from index {index_name}: more than "
+                f"`delete_missing_max_ratio` of the objects are missing")
+            return
+
+        self.logger.info(
+            f"Deleting {len(object_ids)} missing objects from index: {index_name}"
+        )
+        self._indexing_responses.append(
+            self.search_index.delete_objects(object_ids))
+        self.hash_store.delete(index_name, object_ids)
+        self.deleted_count += len(object_ids)
+
+    def wait_indexing(self) -> None:
+        """Wait until Algolia finishes indexing all the uploaded batches."""
+        self.flush_uploads()
+        self.logger.info(
+            f"Waiting for {len(self._indexing_responses)} indexing tasks")
+        for response in self._indexing_responses:
+            response.wait()
+        self._indexing_responses = []
+        self._executor.shutdown()
+
+        self.logger.info(
+            f"Index {self.index_config['name']}: {self.updated_count} objects "
+            f"updated, {self.skipped_count} unchanged objects skipped, "
+            f"{self.deleted_count} objects deleted")
+
+    def _submit_upload(self, buffer: io.BytesIO, context: dict) -> None:
+        # At most `upload_concurrency` batches are in flight, the next batch
+        # is being collected while they are uploaded
+        while len(self._uploads) >= self.upload_concurrency:
+            self._complete_upload(*self._uploads.pop(0))
+
+        self._uploads.append(
+            (self._executor.submit(self.search_index.save_objects,
+                                   self._iter_buffer(buffer)), context))
+
+    @staticmethod
+    def _iter_buffer(buffer: io.BytesIO) -> Iterator[Dict]:
+        # The client sends the objects in chunks, so only the chunk being
+        # sent is held as dicts
+        buffer.seek(0)
+        for line in buffer:
+            yield json.loads(line)
+        buffer.close()
+
+    def _complete_upload(self, upload: Future, context: dict) -> None:
+        self._indexing_responses.append(upload.result())
+        self.updated_count += context["records_count"]
+        self._save_hashes(context)
+
+    def _save_hashes(self, context: dict) -> None:
+        # Hashes are only stored once the objects are accepted by Algolia, so
+        # that failed batches are sent again on the next run
+        self.skipped_count += len(context.get("unchanged", []))
+        if self.hash_store is not None:
+            self.hash_store.save(self.index_config["name"],
+                                 context.get("hashes", []),
+                                 context.get("unchanged", []))
 
     def _init_search_index(self) -> (Dict, SearchIndex):
         """Create an Algolia search client and initialize the search index.
@@ -74,27 +245,10 @@ class AlgoliaSink(BatchSink):
         return index_config, search_index
 
     def _get_index_config(self):
-        indices_config = parse_config(self.config["index_mapping_file"])
-        for index_config in indices_config:
-            table_config = index_config["index"]["source"]["table"]
-            if self.stream_name == f"{table_config['schema']}-{table_config['name']}":
-                return index_config["index"]
+        index_configs = parse_index_mapping(self.config["index_mapping_file"])
+        if self.stream_name in index_configs:
+            return index_configs[self.stream_name]
 
         raise ValueError(
             f"Index for stream `{self.stream_name}` was not found in the index mapping"
         )
-
-    def _to_search_record(self, record: Dict) -> Dict:
-        # Creates a new records using all attributes needed for search
-        search_record = {
-            attr: record.get(attr, None)
-            for attr in self.index_config["source"]["attributes"]
-        }
-
-        # Creates a surrogate `objectID` based on primary key attributes
-        search_record["objectID"] = "".join([
-            str(record[key_attr])
-            for key_attr in self.index_config["source"]["primary_key"]
-        ])
-
-        return search_record
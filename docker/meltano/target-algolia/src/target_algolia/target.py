@@ -1,8 +1,13 @@
 """Algolia target class."""
 
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from singer_sdk.sinks import Sink
 from singer_sdk.target_base import Target
 from singer_sdk import typing as th
 
+from target_algolia.hashstore import ObjectHashStore
 from target_algolia.sinks import (AlgoliaSink)
 
 
@@ -25,4 +30,83 @@ class TargetAlgolia(Target):
         th.Property("index_mapping_file",
                     th.StringType,
                     description="YAML file with Algolia index configurations",
-                    required=True)).to_dict()
+                    required=True),
+        th.Property("max_batch_records",
+                    th.IntegerType,
+                    description="Max number of records in one batch"),
+        th.Property(
+            "max_batch_bytes",
+            th.IntegerType,
+            description=
+            "Max size in bytes of the serialized records in one batch"),
+        th.Property(
+            "upload_concurrency",
+            th.IntegerType,
+            description="Max number of batches uploaded concurrently per stream"
+        ),
+        th.Property(
+            "hash_store_path",
+            th.StringType,
+            description=
+            "SQLite file with hashes of the saved objects, unchanged objects are not sent again"
+        ),
+        th.Property(
+            "delete_missing_objects",
+            th.BooleanType,
+            description=
+            "Delete the objects which are in the hash store, but were not received during the run. Only for full table streams, which end with an ACTIVATE_VERSION message"
+        ),
+        th.Property(
+            "delete_missing_max_ratio",
+            th.NumberType,
+            description=
+            "Max share of the objects of an index to delete as missing, no objects are deleted above it. Defaults to 0.1"
+        )).to_dict()
+
+    def __init__(self, *args, **kwargs):
+        self._algolia_sinks: List[AlgoliaSink] = []
+        super().__init__(*args, **kwargs)
+
+    def add_sink(self,
+                 stream_name: str,
+                 schema: dict,
+                 key_properties: Optional[List[str]] = None) -> Sink:
+        sink = super().add_sink(stream_name, schema, key_properties)
+        # Sinks replaced on schema change still have batches to finish
+        self._algolia_sinks.append(sink)
+        return sink
+
+    @cached_property
+    def hash_store(self) -> Optional[ObjectHashStore]:
+        if not self.config.get("hash_store_path"):
+            return None
+        return ObjectHashStore(self.config["hash_store_path"])
+
+    def _process_endofpipe(self) -> None:
+        super()._process_endofpipe()
+
+        for sink in self._algolia_sinks:
+            sink.flush_uploads()
+
+        if self.config.get("delete_missing_objects"):
+            # Sinks replaced on schema change share the index, objects are
+            # deleted once all of them are flushed
+            sinks_by_index: Dict[str, AlgoliaSink] = {
+                sink.index_config["name"]: sink
+                for sink in self._algolia_sinks
+            }
+            for sink in sinks_by_index.values():
+                sink.delete_missing_objects()
+
+        for sink in self._algolia_sinks:
+            sink.wait_indexing()
+
+        if self.hash_store is not None:
+            self.hash_store.close()
+
+    def _write_state_message(self, state: dict) -> None:
+        # The state is confirmed only once all the drained batches are saved
+        for sink in self._algolia_sinks:
+            sink.flush_uploads()
+
+        super()._write_state_message(state)
@@ -1,3 +1,4 @@
+import functools
 import os
 import re
 from typing import Dict
@@ -32,3 +33,18 @@ def parse_config(path, tag='!ENV') -> Dict:
 
     with open(path) as conf_data:
         return yaml.load(conf_data, Loader=loader)
+
+
+@functools.lru_cache(maxsize=None)
+def parse_index_mapping(path) -> Dict[str, Dict]:
+    """
+    Loads the index mapping file once for all the sinks and returns index
+    configurations by the name of the source stream - `{schema}-{table}`.
+    The returned configurations are shared and must not be modified.
+    """
+    index_configs = {}
+    for index_config in parse_config(path):
+        table_config = index_config["index"]["source"]["table"]
+        stream_name = f"{table_config['schema']}-{table_config['name']}"
+        index_configs.setdefault(stream_name, index_config["index"])
+    return index_configs
@@ -0,0 +1,91 @@
+"""Tests the compiled projection of stream records into search records."""
+
+import pytest
+
+from target_algolia.projector import compile_projector
+
+
+def to_search_record(source_config, record):
+    # The projection used before the compiled projector
+    search_record = {
+        attr: record.get(attr, None)
+        for attr in source_config["attributes"]
+    }
+    search_record["objectID"] = "".join(
+        [str(record[key_attr]) for key_attr in source_config["primary_key"]])
+    return search_record
+
+
+SOURCE_CONFIGS = [
+    {
+        "primary_key": ["symbol"],
+        "attributes": ["symbol", "name", "tags", "metrics"],
+    },
+    {
+        "primary_key": ["collection_id", "symbol"],
+        "attributes": ["symbol", "weight", "it's \"quoted\"", "_sdc_deleted"],
+    },
+    {
+        "primary_key": [],
+        "attributes": [],
+    },
+]
+
+RECORDS = [
+    {
+        "symbol": "AAPL",
+        "collection_id": 12,
+        "name": "Apple Inc",
+        "tags": ["Technology", "Hardware"],
+        "metrics": {
+            "avg_volume": 1000000,
+            "margins": {
+                "gross": 0.42,
+                "net": None
+            }
+        },
+        "weight": 0.5,
+        "it's \"quoted\"": "value",
+        "unused": "value",
+    },
+    # Missing and null attributes
+    {
+        "symbol": "GOOGL",
+        "collection_id": None,
+        "tags": None,
+    },
+    {
+        "symbol": 1,
+        "collection_id": 0,
+        "metrics": {},
+        "tags": [],
+    },
+]
+
+
+@pytest.mark.parametrize("source_config", SOURCE_CONFIGS)
+def test_projector_matches_record_mapping(source_config):
+    project = compile_projector(source_config)
+    for record in RECORDS:
+        search_record = project(record)
+        assert to_search_record(source_config, record) == search_record
+        # Attributes keep the order of the index mapping
+        attributes = source_config["attributes"] + ["objectID"]
+        assert attributes == list(search_record)
+
+
+def test_projector_keeps_nested_values():
+    source_config = SOURCE_CONFIGS[0]
+    record = RECORDS[0]
+    search_record = compile_projector(source_config)(record)
+    # Nested values are the values of the record, as with the record mapping
+    assert record["metrics"] is search_record["metrics"]
+    assert record["tags"] is search_record["tags"]
+
+
+def test_projector_requires_primary_key():
+    project = compile_projector(SOURCE_CONFIGS[1])
+    with pytest.raises(KeyError):
+        project({"symbol": "AAPL"})
+    with pytest.raises(KeyError):
+        to_search_record(SOURCE_CONFIGS[1], {"symbol": "AAPL"})
@@ -0,0 +1,339 @@
+"""Tests uploading of the search records to a fake Algolia index."""
+
+import datetime
+import decimal
+import io
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+from algoliasearch.exceptions import AlgoliaException
+from algoliasearch.http.serializer import DataSerializer
+
+from target_algolia.hashstore import ObjectHashStore
+from target_algolia.target import TargetAlgolia
+
+INDEX_MAPPING = """
+- index:
+    name: tickers
+    source:
+      table:
+        schema: public
+        name: tickers
+      primary_key: [symbol]
+      attributes: [symbol, name]
+"""
+
+
+class FakeResponse:
+
+    def __init__(self, events: list, task: tuple):
+        self.events = events
+        self.task = task
+
+    def wait(self):
+        self.events.append(("indexed", self.task))
+        return self
+
+
+class FakeSearchIndex:
+    """In-memory index, which logs the calls made by the sink."""
+
+    def __init__(self, events: list, delay: float = 0):
+        self.events = events
+        self.delay = delay
+        self.objects = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def save_objects(self, objects):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            objects = list(objects)
+            time.sleep(self.delay)
+            with self._lock:
+                for search_record in objects:
+                    self.objects[search_record["objectID"]] = search_record
+            object_ids = tuple(record["objectID"] for record in objects)
+            self.events.append(("saved", object_ids))
+            return FakeResponse(self.events, object_ids)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def delete_objects(self, object_ids):
+        object_ids = tuple(sorted(object_ids))
+        for object_id in object_ids:
+            del self.objects[object_id]
+        self.events.append(("deleted", object_ids))
+        return FakeResponse(self.events, object_ids)
+
+
+class StateOutput(io.StringIO):
+    """Target output logging the emitted states next to the index calls."""
+
+    def __init__(self, events: list):
+        super().__init__()
+        self.events = events
+
+    def write(self, s):
+        if s.strip():
+            self.events.append(("state", json.loads(s)))
+        return super().write(s)
+
+
+def schema_message():
+    return {
+        "type": "SCHEMA",
+        "stream": "public-tickers",
+        "schema": {
+            "properties": {
+                "symbol": {
+                    "type": "string"
+                },
+                "name": {
+                    "type": ["string", "null"]
+                },
+            }
+        },
+        "key_properties": ["symbol"]
+    }
+
+
+def record_message(symbol, name=None):
+    return {
+        "type": "RECORD",
+        "stream": "public-tickers",
+        "record": {
+            "symbol": symbol,
+            "name": name or f"{symbol} Inc"
+        }
+    }
+
+
+def state_message(value):
+    return {"type": "STATE", "value": value}
+
+
+def run_target(tmp_path, index, messages, **config):
+    mapping_file = tmp_path / "mapping.yaml"
+    mapping_file.write_text(INDEX_MAPPING)
+    config = {
+        "app_id": "app",
+        "api_key": "key",
+        "index_mapping_file": str(mapping_file),
+        **config
+    }
+
+    with mock.patch("target_algolia.sinks.SearchClient") as search_client, \
+            mock.patch("sys.stdout", new=StateOutput(index.events)):
+        search_client.create.return_value.init_index.return_value = index
+        target = TargetAlgolia(config=config)
+        # Every state message drains the sinks
+        target._MAX_RECORD_AGE_IN_MINUTES = -1
+        target.listen(
+            io.StringIO("".join(
+                json.dumps(message) + "\n" for message in messages)))
+    return target
+
+
+def test_uploads_are_bounded_and_confirmed_before_state(tmp_path):
+    events = []
+    index = FakeSearchIndex(events, delay=0.05)
+    symbols = [f"S{i}" for i in range(9)]
+    messages = [schema_message()]
+    messages += [record_message(symbol) for symbol in symbols[:6]]
+    messages += [state_message({"bookmark": 1})]
+    messages += [record_message(symbol) for symbol in symbols[6:]]
+    messages += [state_message({"bookmark": 2})]
+
+    run_target(tmp_path,
+               index,
+               messages,
+               max_batch_records=2,
+               upload_concurrency=2)
+
+    batches = [tuple(symbols[i:i + 2]) for i in range(0, len(symbols), 2)]
+    assert 2 == index.max_in_flight
+    assert set(symbols) == set(index.objects)
+    assert sorted(batches) == sorted(batch for event, batch in events
+                                     if event == "saved")
+    # Indexing is awaited once at the end, in the upload order
+    assert batches == [batch for event, batch in events if event == "indexed"]
+
+    # A state is emitted only once all the batches received before it are
+    # accepted by Algolia
+    states = [i for i, (event, _) in enumerate(events) if event == "state"]
+    saved = {
+        batch: i
+        for i, (event, batch) in enumerate(events) if event == "saved"
+    }
+    assert all(saved[batch] < states[0] for batch in batches[:3])
+    assert all(saved[batch] < states[-1] for batch in batches)
+    assert {"bookmark": 2} == events[states[-1]][1]
+
+
+def activate_version_message():
+    return {
+        "type": "ACTIVATE_VERSION",
+        "stream": "public-tickers",
+        "version": 1
+    }
+
+
+def test_unchanged_objects_are_skipped(tmp_path):
+    events = []
+    index = FakeSearchIndex(events)
+    config = {"hash_store_path": str(tmp_path / "hashes.db")}
+    symbols = ["A", "B", "C"]
+
+    run_target(tmp_path, index, [schema_message()] +
+               [record_message(symbol) for symbol in symbols], **config)
+    assert [("A", "B", "C")
+            ] == [batch for event, batch in events if event == "saved"]
+
+    events.clear()
+    target = run_target(tmp_path, index, [
+        schema_message(),
+        record_message("A"),
+        record_message("B"),
+        record_message("C", name="C Corp")
+    ], **config)
+    assert [("C", )] == [batch for event, batch in events if event == "saved"]
+    assert "C Corp" == index.objects["C"]["name"]
+
+    sink = target._algolia_sinks[0]
+    assert 2 == sink.skipped_count
+    assert 1 == sink.updated_count
+
+
+def test_hashes_are_saved_once_objects_are_accepted(tmp_path):
+    hash_store_path = str(tmp_path / "hashes.db")
+
+    class CheckingSearchIndex(FakeSearchIndex):
+
+        def save_objects(self, objects):
+            objects = list(objects)
+            # The batch is not marked as saved while it's being uploaded
+            store = ObjectHashStore(hash_store_path)
+            try:
+                assert all(
+                    store.get_hash("tickers", search_record["objectID"]) is
+                    None for search_record in objects)
+            finally:
+                store.close()
+
+            if any(search_record["objectID"] == "C"
+                   for search_record in objects):
+                raise AlgoliaException("Upload failed")
+            return super().save_objects(objects)
+
+    events = []
+    index = CheckingSearchIndex(events)
+    with pytest.raises(AlgoliaException):
+        run_target(tmp_path,
+                   index, [schema_message()] +
+                   [record_message(symbol) for symbol in ["A", "B", "C", "D"]],
+                   hash_store_path=hash_store_path,
+                   max_batch_records=2,
+                   upload_concurrency=1)
+
+    store = ObjectHashStore(hash_store_path)
+    assert store.get_hash("tickers", "A") is not None
+    assert store.get_hash("tickers", "B") is not None
+    # The failed batch is sent again on the next run
+    assert store.get_hash("tickers", "C") is None
+    assert store.get_hash("tickers", "D") is None
+    store.close()
+
+
+def test_missing_objects_are_deleted_after_full_snapshot(tmp_path):
+    events = []
+    index = FakeSearchIndex(events)
+    config = {
+        "hash_store_path": str(tmp_path / "hashes.db"),
+        "delete_missing_objects": True
+    }
+    symbols = [f"S{i}" for i in range(10)]
+
+    def run(symbols, activate_version=True, leading_activate_version=False):
+        events.clear()
+        messages = [schema_message()]
+        if leading_activate_version:
+            messages += [activate_version_message()]
+        messages += [record_message(symbol) for symbol in symbols]
+        if activate_version:
+            messages += [activate_version_message()]
+        run_target(tmp_path, index, messages, **config)
+        return [batch for event, batch in events if event == "deleted"]
+
+    assert [] == run(symbols)
+    assert [("S9", )] == run(symbols[:9])
+    assert set(symbols[:9]) == set(index.objects)
+
+    # A stream without ACTIVATE_VERSION after its records may be incomplete
+    assert [] == run(symbols[:8], activate_version=False)
+    assert [] == run(symbols[:8] + ["S10"],
+                     activate_version=False,
+                     leading_activate_version=True)
+
+    # Too many objects missing at once
+    assert [] == run(symbols[:4])
+    assert set(symbols[:9] + ["S10"]) == set(index.objects)
+
+    config["delete_missing_max_ratio"] = 1
+    assert [tuple(sorted(symbols[4:9] + ["S10"]))] == run(symbols[:4])
+    assert set(symbols[:4]) == set(index.objects)
+
+
+def test_buffer_round_trip(tmp_path):
+    search_records = [{
+        "symbol": "AAPL",
+        "price": decimal.Decimal("150.25"),
+        "updated_at": datetime.datetime(2022, 5, 5, 12, 30),
+        "tags": ["Technology"],
+        "name": "Caf\u00e9 \u2615",
+        "objectID": "AAPL"
+    }, {
+        "symbol": "GOOGL",
+        "price": None,
+        "updated_at": None,
+        "tags": None,
+        "name": None,
+        "objectID": "GOOGL"
+    }]
+
+    target = run_target(tmp_path, FakeSearchIndex([]), [schema_message()])
+    sink = target._algolia_sinks[0]
+    buffer = io.BytesIO()
+    for search_record in search_records:
+        buffer.write(
+            sink._encoder.encode(search_record).encode("UTF-8") + b"\n")
+
+    # The objects are the same as if serialized by the Algolia client
+    assert json.loads(DataSerializer.serialize(search_records)) == list(
+        sink._iter_buffer(buffer))
+    assert buffer.closed
+
+
+def test_batches_are_limited_by_size(tmp_path):
+    events = []
+    index = FakeSearchIndex(events)
+    symbols = [f"S{i}" for i in range(7)]
+    messages = [schema_message()]
+    messages += [record_message(symbol) for symbol in symbols]
+
+    # Every serialized search record takes 46 bytes
+    run_target(tmp_path, index, messages, max_batch_bytes=100)
+    assert [3, 3,
+            1] == [len(batch) for event, batch in events if event == "saved"]
+
+    events.clear()
+    run_target(tmp_path, index, messages, max_batch_records=2)
+    assert [2, 2, 2,
+            1] == [len(batch) for event, batch in events if event == "saved"]